@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 BENCHMARK
+# =============================================================================
+# Time-to-quality comparison of engines and parameters: each configuration
+# of a run config is run with each engine and seed for a fixed wall-clock
+# budget, recording after every generation the best reward found so far and
+# the largest |VNA| and county breaches of that state, and a final point
+# once the engine has finished (after polishing, if the config polishes).
+# Writes the curves, a summary table (final quality, and time taken to reach
+# a reward and a maximum |VNA|) and a plot of the curves.
+#
+#   python benchmark.py configs/example.toml --engines reference array \
+#       --seeds 0 1 2 --budget 300
+
+#%% Imports
+
+import argparse
+import datetime
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from engine import state_from_frame
+from static_data import build_static_data
+from sweep import engines, polishers, reward_keys, init_worker, \
+    seat_objective
+from run import load_config, load_dataset, expand_sweep, run_name
+
+#%% Stop Evolution
+
+class StopEvolution(Exception):
+    '''
+    Raised by a BenchmarkRecorder when the time budget has been used.
+    '''
+
+#%% State Metrics
+
+def state_metrics(static, state, national_ratio=29800):
+    '''
+    Returns the largest |VNA| of any CON (with seats the nearest integer SER,
+    as in vna) and the number of EDs outside the home counties of their CON,
+    for an EngineState of static.
+    '''
+    present = np.bincount(state.con, minlength=static.n_cons) > 0
+    sers = state.con_pop[present]/national_ratio
+    seats = np.round(sers)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vnas = np.abs((sers - seats)/seats)
+    breaches = ~static.home[state.con, static.county]
+    return float(np.nanmax(vnas)), int(breaches.sum())
+
+#%% Benchmark Recorder
+
+class BenchmarkRecorder:
+    '''
+    Callback for evolve() (or evolve_states) which records a point of the
+    curve of one run after every generation:
+        time          seconds since the run started (not counting the time
+                      spent recording)
+        reward        best reward found so far
+        max_vna       largest |VNA| of the state with that reward
+        breaches      EDs outside a home county in the state with that reward
+        best_max_vna  smallest largest |VNA| of any contiguous survivor so far
+        final         False (True for the point recorded by finish)
+    and raises StopEvolution once the budget (in seconds) has been used.
+    The survivors of the generation with the best reward are kept as
+    best_states, e.g. to be polished once evolution has been stopped.
+    '''
+    def __init__(self, static, budget, national_ratio=29800):
+        self.static = static
+        self.budget = budget
+        self.national_ratio = national_ratio
+        self.points = []
+        self.reward = -np.inf
+        self.max_vna = np.inf
+        self.breaches = None
+        self.best_max_vna = np.inf
+        self.evaluations = 0
+        self.generation = 0
+        self.best_states = []
+        self.start()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.overhead = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started - self.overhead
+
+    def metrics(self, state):
+        if not hasattr(state, 'con'):
+            state = state_from_frame(self.static, state)
+        return state_metrics(self.static, state, self.national_ratio)
+
+    def update(self, survivors):
+        '''
+        Updates the best values so far with a list of (state, reward),
+        best first.
+        '''
+        best, reward = survivors[0]
+        if reward > self.reward:
+            self.reward = float(reward)
+            self.max_vna, self.breaches = self.metrics(best)
+            self.best_states = [state for state, _ in survivors]
+        for state, reward in survivors:
+            # Survivors with reward 0 are not contiguous
+            if reward > 0:
+                self.best_max_vna = min(self.best_max_vna,
+                                        self.metrics(state)[0])
+
+    def record(self, now, final=False):
+        self.points.append({
+            'time': now,
+            'generation': self.generation,
+            'evaluations': self.evaluations,
+            'reward': self.reward,
+            'max_vna': self.max_vna,
+            'breaches': self.breaches,
+            'best_max_vna': self.best_max_vna,
+            'final': final,
+            })
+
+    def __call__(self, summary, survivors):
+        now = self.elapsed()
+        begun = time.perf_counter()
+        self.evaluations = summary.get('evaluations', 0)
+        self.generation = summary['generation']
+        self.update(survivors)
+        self.record(now)
+        self.overhead += time.perf_counter() - begun
+        if now >= self.budget:
+            raise StopEvolution()
+
+    def finish(self, states=(), rewards=()):
+        '''
+        Records the final point of the run, at the time the engine finished
+        (including any polishing), with the states and rewards it returned.
+        '''
+        now = self.elapsed()
+        if len(rewards):
+            self.update(list(zip(states, rewards)))
+        self.record(now, final=True)
+
+#%% Run Benchmark
+
+def run_benchmark(data, configurations, engine_names=('reference',),
+                  seeds=(0,), budget=60):
+    '''
+    Runs each configuration with each engine and seed, one at a time.
+    Evolution is stopped once <budget> seconds have been used (a run which
+    finishes sooner keeps its final values); configs with polish = True
+    then polish the best states found, as the engine would have done, so
+    the time of their final point includes polishing and may exceed the
+    budget. data is as for run_sweep.
+    Returns a dataframe of the curves, with one row per generation of each
+    run and a final row once the run (with polishing) has finished,
+    labelled by engine and configuration (without the seed).
+    '''
+    data = dict(data)
+    if 'static' not in data:
+        data['static'] = build_static_data(data['d'])
+    if 'd0' in data:
+        data.setdefault('national_population', data['d0']['POPULATION'].sum())
+    init_worker(data)
+    static = data['static']
+    curves = []
+    for config in configurations:
+        for engine in engine_names:
+            label = f"{engine} {run_name({**config, 'seed': None})}"
+            for seed in seeds:
+                run = {**config, 'seed': seed}
+                random.seed(seed)
+                np.random.seed(seed)
+                reward_params = {k: run[k] for k in reward_keys if k in run}
+                # Only the array engine has a seat objective (see
+                # run_configuration)
+                if engine == 'array':
+                    objective = seat_objective(run, static)
+                    if objective is not None:
+                        reward_params.setdefault('nr',
+                                                 objective.national_ratio)
+                recorder = BenchmarkRecorder(static, budget,
+                                             reward_params.get('nr', 29800))
+                finished = True
+                try:
+                    states, rewards = engines[engine](run, reward_params,
+                                                      recorder)
+                except StopEvolution:
+                    finished = False
+                    states, rewards = recorder.best_states, []
+                    if run.get('polish') and states:
+                        states, rewards = polishers[engine](
+                            run, states, reward_params)
+                recorder.finish(states, rewards)
+                print(f'{label}, seed {seed}: reward {recorder.reward:.4f} '
+                      f'after {recorder.elapsed():.1f}s'
+                      + ('' if finished else ' (budget used)'))
+                for point in recorder.points:
+                    curves.append({'label': label, 'engine': engine,
+                                   'seed': seed, 'finished': finished,
+                                   **point})
+    return pd.DataFrame(curves)
+
+#%% Time To Reach
+
+def time_to_reach(curve, column, target, higher=True):
+    '''
+    Returns the first time at which column of a curve (the rows of one run)
+    reaches target (from above if higher=False), or NaN if it never does.
+    '''
+    reached = curve[column] >= target if higher else curve[column] <= target
+    return curve.loc[reached, 'time'].min() if reached.any() else np.nan
+
+#%% Summarise Benchmark
+
+def summarise_benchmark(curves, reward_target=None, vna_target=0.05):
+    '''
+    Returns a dataframe with one row per label (engine and configuration):
+    the mean final reward, largest |VNA| and breaches over seeds, the mean
+    reward evaluations per second, and the median time taken to reach
+    reward_target (by default, the median final reward of the label with
+    the best mean final reward, which half of its runs reach) and a largest
+    |VNA| of vna_target, with the fraction of runs which reached each.
+    '''
+    runs = curves.groupby(['label', 'seed'], sort=False)
+    finals = runs.tail(1).set_index(['label', 'seed'])
+    if reward_target is None:
+        rewards = finals['reward'].groupby(level='label', sort=False)
+        reward_target = rewards.get_group(rewards.mean().idxmax()).median()
+    timed = runs[['time', 'reward', 'best_max_vna']]
+    to_reward = timed.apply(time_to_reach, 'reward', reward_target)
+    to_vna = timed.apply(time_to_reach, 'best_max_vna', vna_target, False)
+    finals = finals.assign(to_reward=to_reward, to_vna=to_vna,
+                           rate=finals['evaluations']/finals['time'])
+    by_label = finals.groupby(level='label', sort=False)
+    return pd.DataFrame({
+        'runs': by_label.size(),
+        'reward': by_label['reward'].mean(),
+        'max_vna': by_label['max_vna'].mean(),
+        'breaches': by_label['breaches'].mean(),
+        'evaluations_per_s': by_label['rate'].mean(),
+        f'time_to_reward_{reward_target:.4g}': by_label['to_reward'].median(),
+        'reached_reward': by_label['to_reward'].apply(
+            lambda t: t.notna().mean()),
+        f'time_to_vna_{vna_target:g}': by_label['to_vna'].median(),
+        'reached_vna': by_label['to_vna'].apply(lambda t: t.notna().mean()),
+        }).reset_index()
+
+#%% Plot Benchmark
+
+def plot_benchmark(curves, name='benchmark', dpi=300, x=15, y=11):
+    '''
+    Plots the best reward so far and the smallest largest |VNA| so far
+    against time, with the median over seeds of each label in bold.
+    Saves a PNG and returns a list of its path.
+    '''
+    # Never open windows when running headless
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(2, 1, figsize=(x,y), sharex=True)
+    grid = np.linspace(0, curves['time'].max(), 200)
+    for k, (label, runs) in enumerate(curves.groupby('label', sort=False)):
+        colour = f'C{k}'
+        for ax, column in zip(axs, ('reward', 'best_max_vna')):
+            values = []
+            for _, run in runs.groupby('seed'):
+                ax.step(run['time'], run[column], where='post', color=colour,
+                        alpha=0.3, linewidth=0.8)
+                # Value of the run at each time of the grid
+                at = np.searchsorted(run['time'].to_numpy(), grid,
+                                     side='right') - 1
+                column_values = run[column].to_numpy()[np.maximum(at, 0)]
+                values.append(np.where(at >= 0, column_values, np.nan))
+            ax.plot(grid, np.nanmedian(values, axis=0), color=colour,
+                    linewidth=2, label=label)
+    axs[0].set_ylabel('Best reward')
+    axs[1].set_ylabel('Smallest max |VNA|')
+    axs[1].set_xlabel('Time (s)')
+    axs[0].legend()
+
+    time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
+    path = f'./images/{name}_{time}.png'
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return [path]
+
+#%% Main
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare how quickly engines and parameters reach a '
+        'given quality, for a fixed time budget per run.')
+    parser.add_argument('config', help='TOML or YAML run config')
+    parser.add_argument('--engines', nargs='+', choices=list(engines),
+                        help='engines to compare (default: the engine of '
+                        'the config)')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--budget', type=float, default=60,
+                        help='seconds per run')
+    parser.add_argument('--reward-target', type=float,
+                        help='reward to time (default: the median final '
+                        'reward of the label with the best mean final '
+                        'reward)')
+    parser.add_argument('--vna-target', type=float, default=0.05,
+                        help='largest |VNA| to time')
+    parser.add_argument('--curves', default='benchmark_curves.csv')
+    parser.add_argument('--summary', default='benchmark_summary.csv')
+    parser.add_argument('--no-plot', action='store_true')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    d0, d = load_dataset(config['data'])
+    curves = run_benchmark({'d0': d0, 'd': d}, expand_sweep(config),
+                           args.engines or [config['run']['engine']],
+                           args.seeds, args.budget)
+    curves.to_csv(args.curves, index=False)
+    summary = summarise_benchmark(curves, args.reward_target,
+                                  args.vna_target)
+    summary.to_csv(args.summary, index=False)
+    print(summary.to_string(index=False))
+    if not args.no_plot:
+        plot_benchmark(curves)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                CONNECTIVITY
+# =============================================================================
+# Contiguity of constituencies without building graphs: the articulation
+# points of each CON (EDs which hold it together) are kept in an index and
+# refreshed lazily, only for CONs which have changed, so that "does removing
+# ED i disconnect its CON?" is a lookup. A from-scratch validator checks
+# whole states.
+
+#%% Imports
+
+import numpy as np
+from numba import jit # Use numba for faster computation
+
+#%% Articulation Points
+
+@jit(nopython=True)
+def articulation_in(indptr, indices, con, members, disc, low, parent, edge,
+                    stack, cut):
+    '''
+    Marks in cut the articulation points of the subgraph of each CON among
+    members (which must hold every ED of those CONs), using an iterative
+    version of Tarjan's algorithm. disc, low, parent, edge and stack are
+    work arrays of the number of EDs; only entries of members are touched.
+    Returns the number of connected pieces among members.
+    '''
+    for m in members:
+        disc[m] = -1
+        parent[m] = -1
+        cut[m] = False
+    t = 0
+    pieces = 0
+    for root in members:
+        if disc[root] >= 0:
+            continue
+        pieces += 1
+        disc[root] = t
+        low[root] = t
+        t += 1
+        edge[root] = indptr[root]
+        stack[0] = root
+        top = 1
+        root_children = 0
+        while top > 0:
+            u = stack[top-1]
+            if edge[u] < indptr[u+1]:
+                v = indices[edge[u]]
+                edge[u] += 1
+                if con[v] != con[u]:
+                    continue
+                if disc[v] < 0:
+                    parent[v] = u
+                    disc[v] = t
+                    low[v] = t
+                    t += 1
+                    edge[v] = indptr[v]
+                    stack[top] = v
+                    top += 1
+                    if u == root:
+                        root_children += 1
+                elif v != parent[u]:
+                    low[u] = min(low[u], disc[v])
+            else:
+                top -= 1
+                p = parent[u]
+                if p >= 0:
+                    low[p] = min(low[p], low[u])
+                    if p != root and low[u] >= disc[p]:
+                        cut[p] = True
+        if root_children > 1:
+            cut[root] = True
+    return pieces
+
+def articulation_points(indptr, indices, con):
+    '''
+    Returns a boolean array which is True for EDs whose removal would split
+    their CON into pieces.
+    '''
+    n = con.size
+    cut = np.zeros(n, dtype=np.bool_)
+    articulation_in(indptr, indices, con, np.arange(n),
+                    np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64),
+                    np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64),
+                    np.empty(n, dtype=np.int64), cut)
+    return cut
+
+#%% Components
+
+@jit(nopython=True)
+def component_labels(indptr, indices, con):
+    '''
+    Labels each ED with the connected component of its CON which contains
+    it (components numbered from 0, over all CONs).
+    '''
+    labels = np.full(con.size, -1, dtype=np.int64)
+    stack = np.empty(con.size, dtype=np.int64)
+    n = 0
+    for start in range(con.size):
+        if labels[start] >= 0:
+            continue
+        labels[start] = n
+        stack[0] = start
+        top = 1
+        while top > 0:
+            top -= 1
+            i = stack[top]
+            for k in range(indptr[i], indptr[i+1]):
+                j = indices[k]
+                if con[j] == con[i] and labels[j] < 0:
+                    labels[j] = n
+                    stack[top] = j
+                    top += 1
+        n += 1
+    return labels
+
+#%% Validate
+
+def discontiguous_cons(static, con):
+    '''
+    Full-state validator: returns the codes of the CONs which are not
+    contiguous, computed from scratch. As in f_contiguity, a CON containing
+    a single ED counts as discontiguous. EDs exempt from contiguity are
+    ignored.
+    '''
+    keep = ~static.exempt
+    labels = component_labels(static.indptr, static.indices, con)
+    comp_con = np.full(labels.max() + 1 if labels.size else 0, -1,
+                       dtype=np.int64)
+    comp_con[labels[keep]] = con[keep]
+    pieces = np.bincount(comp_con[comp_con>=0], minlength=static.n_cons)
+    size = np.bincount(con[keep], minlength=static.n_cons)
+    return np.flatnonzero((pieces > 1) | (size == 1))
+
+#%% Connectivity Index
+
+class ConnectivityIndex:
+    '''
+    Articulation points and contiguity of each CON of the CON codes con
+    (e.g. EngineState.con, which is shared, not copied).
+    When EDs are moved, moved() must be called; the CONs involved are
+    marked dirty and only refreshed when next asked about, so each query is
+    a lookup plus, at most, one pass over the EDs of a changed CON.
+    EDs exempt from contiguity are not counted.
+    '''
+    def __init__(self, static, con):
+        self.static = static
+        self.con = con
+        n = static.n_eds
+        self.work = [np.empty(n, dtype=np.int64) for _ in range(5)]
+        self.cut = np.zeros(n, dtype=np.bool_)
+        self.size = np.bincount(con[~static.exempt], minlength=static.n_cons)
+        self.pieces = np.zeros(static.n_cons, dtype=np.int64)
+        self.dirty = np.ones(static.n_cons, dtype=bool)
+        self.refreshes = 0
+
+    def copy(self, con):
+        '''
+        Returns a copy of the index for a copy con of the CON codes (e.g. of
+        a child state). The work arrays are shared.
+        '''
+        index = ConnectivityIndex.__new__(ConnectivityIndex)
+        index.static = self.static
+        index.con = con
+        index.work = self.work
+        index.cut = self.cut.copy()
+        index.size = self.size.copy()
+        index.pieces = self.pieces.copy()
+        index.dirty = self.dirty.copy()
+        index.refreshes = 0
+        return index
+
+    def refresh(self, cons=None):
+        '''
+        Recomputes the articulation points and pieces of the given CONs
+        (by default, every dirty CON).
+        '''
+        if cons is None:
+            cons = np.flatnonzero(self.dirty)
+        for c in cons:
+            members = np.flatnonzero((self.con == c) & ~self.static.exempt)
+            self.pieces[c] = articulation_in(
+                self.static.indptr, self.static.indices, self.con, members,
+                *self.work, self.cut)
+            self.dirty[c] = False
+            self.refreshes += 1
+
+    def moved(self, i, old_con, new_con):
+        '''
+        Records that ED i has moved from old_con to new_con.
+        '''
+        self.size[old_con] -= 1
+        self.size[new_con] += 1
+        self.dirty[old_con] = True
+        self.dirty[new_con] = True
+
+    def splits(self, i):
+        '''
+        Returns True if removing ED i would disconnect its CON.
+        '''
+        c = self.con[i]
+        if self.dirty[c]:
+            self.refresh([c])
+        return bool(self.cut[i])
+
+    def contiguous(self, c):
+        '''
+        Returns True if CON c is contiguous (or empty). As in f_contiguity,
+        a CON containing a single ED counts as discontiguous.
+        '''
+        if self.dirty[c]:
+            self.refresh([c])
+        return self.size[c] == 0 or (self.pieces[c] == 1 and
+                                     self.size[c] > 1)
+
+    def removable(self, i):
+        '''
+        Returns True if ED i can leave its CON with the CON still contiguous.
+        '''
+        c = self.con[i]
+        return self.contiguous(c) and not self.cut[i] and self.size[c] != 2
+
+    def articulation(self):
+        '''
+        Returns the articulation points of every CON, refreshing any dirty
+        CONs first.
+        '''
+        self.refresh()
+        return self.cut
+
+    def contiguous_cons(self):
+        '''
+        Returns a boolean array which is True for each contiguous CON,
+        refreshing any dirty CONs first.
+        '''
+        self.refresh()
+        return (self.size == 0) | ((self.pieces == 1) & (self.size > 1))
+
+    def validate(self):
+        '''
+        Checks the index against articulation points and contiguity computed
+        from scratch, raising a ValueError if they differ.
+        '''
+        cut = articulation_points(self.static.indptr, self.static.indices,
+                                  self.con)
+        wrong = np.flatnonzero(cut != self.articulation())
+        if wrong.size:
+            raise ValueError(f'Articulation points out of date for EDs '
+                             f'{wrong.tolist()}')
+        expected = np.ones(self.static.n_cons, dtype=bool)
+        expected[discontiguous_cons(self.static, self.con)] = False
+        wrong = np.flatnonzero(expected != self.contiguous_cons())
+        if wrong.size:
+            raise ValueError(f'Contiguity out of date for CONs '
+                             f'{wrong.tolist()}')
+        return True
+
+#%% Articulation Filter
+
+class ArticulationFilter:
+    '''
+    Keeps EDs whose flip would disconnect their CON (articulation points,
+    and EDs of CONs with only two EDs) out of the flip pool, since such
+    flips always produce a child with reward 0.
+    With the array engine, each state keeps a ConnectivityIndex which is
+    updated as EDs move, and the pool is filtered up front. With flip, a
+    chosen ED is checked by a search of its CON, and redrawn if it is
+    excluded.
+    Counts the EDs excluded, and estimates the wasted evaluations avoided
+    as expected_avoided: the expected number of children which would have
+    been discontiguous without the filter (with flip, the number of children
+    with a redrawn ED).
+    '''
+    def __init__(self):
+        self.excluded = 0
+        self.expected_avoided = 0.0
+        self.neighbours = None
+        self.clean = 1.0
+
+    def filter(self, static, state, eligible):
+        '''
+        Returns eligible without the EDs whose flip would disconnect their
+        CON in EngineState state (unless that would leave no EDs).
+        '''
+        if state.index is None:
+            state.index = ConnectivityIndex(static, state.con)
+        index = state.index
+        blocked = eligible & (index.articulation() |
+                              (index.size[state.con] == 2))
+        n, n_blocked = eligible.sum(), blocked.sum()
+        if n_blocked == 0 or n_blocked == n:
+            return eligible
+        # Chance that a uniform pick from the full pool would be blocked
+        self.clean *= 1 - n_blocked/n
+        self.excluded += int(n_blocked)
+        return eligible & ~blocked
+
+    def splits(self, df, i):
+        '''
+        Returns True if flipping the ED at index i of dataframe df would
+        disconnect its CON, and counts it as excluded.
+        '''
+        if self.neighbours is None:
+            self.neighbours = dict(zip(df['ED_ID'], df['NEIGHBOURS']))
+        members = df['CON']==df.at[i,'CON']
+        if 'EXEMPT' in df:
+            members &= ~df['EXEMPT']
+        ed_ids = set(df.loc[members, 'ED_ID'])
+        ed_ids.discard(df.at[i,'ED_ID'])
+        if len(ed_ids) == 1 or not connected(ed_ids, self.neighbours):
+            self.excluded += 1
+            self.clean = 0.0
+            return True
+        return False
+
+    def child_done(self):
+        '''
+        Called after the flips of each child.
+        '''
+        self.expected_avoided += 1 - self.clean
+        self.clean = 1.0
+
+    def reporting(self, callback):
+        '''
+        Wraps an evolve callback to add 'excluded' and 'expected_avoided' to
+        each generation summary.
+        '''
+        if callback is None:
+            return None
+        def report(summary, survivors):
+            summary['excluded'] = self.excluded
+            summary['expected_avoided'] = float(self.expected_avoided)
+            callback(summary, survivors)
+        return report
+
+#%% Connected
+
+def connected(nodes, neighbours):
+    '''
+    Returns True if the graph on the set of nodes, with edges from each node
+    to those of its neighbours (a dictionary node:iterable) which are also in
+    nodes, is connected.
+    '''
+    if not nodes:
+        return True
+    start = next(iter(nodes))
+    seen = {start}
+    stack = [start]
+    while stack:
+        # A single neighbour may be stored as a 0-d array
+        for n in np.atleast_1d(neighbours[stack.pop()]):
+            if n in nodes and n not in seen:
+                seen.add(n)
+                stack.append(n)
+    return len(seen) == len(nodes)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 CROSSOVER
+# =============================================================================
+# Recombination of two states for the array engine: each region (by default
+# each county) takes its EDs' CONs from one parent or the other, and a
+# repair pass then makes every CON contiguous again.
+
+#%% Imports
+
+import numpy as np
+
+from engine import initial_state, move
+from connectivity import component_labels
+
+#%% Repair
+
+def repair_contiguity(static, state, rng, passes=50):
+    '''
+    Makes each CON of state contiguous, in place: the most populous
+    component of each CON is kept, and EDs in its other components (orphans)
+    are moved, layer by layer from the outside in, to a random neighbouring
+    CON of an ED which is not an orphan.
+    Returns the number of EDs moved. EDs which the dataset fixes, and
+    orphans with no route to another CON, are left where they are.
+    '''
+    moved = 0
+    for _ in range(passes):
+        labels = component_labels(static.indptr, static.indices, state.con)
+        comp_pop = np.bincount(labels, weights=static.population)
+        comp_con = np.zeros(comp_pop.size, dtype=state.con.dtype)
+        comp_con[labels] = state.con
+        # Most populous component of each CON (ties to the lowest label)
+        order = np.lexsort((-comp_pop, comp_con))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = comp_con[order][1:] != comp_con[order][:-1]
+        main = np.zeros(comp_pop.size, dtype=bool)
+        main[order[first]] = True
+        orphan = ~main[labels] & static.movable
+        if not orphan.any():
+            break
+
+        # Orphans bordering an ED which is settled in a different CON
+        src, dst = static.edge_src, static.indices
+        edges = orphan[src] & ~orphan[dst] & \
+            (state.con[src] != state.con[dst])
+        if not edges.any():
+            break
+        edges = np.flatnonzero(edges)
+        rng.shuffle(edges)
+        eds, first_edge = np.unique(src[edges], return_index=True)
+        for i, k in zip(eds, edges[first_edge]):
+            move(static, state, i, state.con[dst[k]])
+        moved += eds.size
+    return moved
+
+#%% Crossover
+
+def crossover_states(static, a, b, rng, regions=None):
+    '''
+    Returns a child of EngineStates a and b: each region takes the CON and
+    CHANGE of its EDs from a or b at random, and the child is then repaired
+    with repair_contiguity. regions is an array with a region code for each
+    ED (by default its county).
+    Returns the child and the number of EDs moved by the repair.
+    '''
+    if regions is None:
+        regions = static.county
+    n_regions = regions.max() + 1
+    from_b = rng.random(n_regions) < 0.5
+    take = from_b[regions]
+    con = np.where(take, b.con, a.con)
+    change = np.where(take, b.change, a.change)
+    child = initial_state(static, con, change)
+    return child, repair_contiguity(static, child, rng)
+
+#%% Crossover Operator
+
+class Crossover:
+    '''
+    Adds <children> crossover children to each generation of evolve_states.
+    Each is the child of the parent of the generation and a random one of
+    the global best states (usually from a different lineage), and they go
+    into the same selection as the mutated children.
+    Counts the children made, the EDs moved to repair them, children dropped
+    for breaking the seat limits of a SeatObjective (when the parent keeps
+    them), and children which survived selection.
+    '''
+    def __init__(self, children=5, regions=None):
+        self.children = children
+        self.regions = regions
+        self.made = 0
+        self.repaired = 0
+        self.dropped = 0
+        self.accepted = 0
+
+    def offspring(self, static, parent, others, rng, objective=None):
+        '''
+        Returns a list of up to <children> children of parent and states
+        drawn from others.
+        '''
+        kids = []
+        for _ in range(self.children):
+            other = others[rng.integers(len(others))]
+            child, moved = crossover_states(static, parent, other, rng,
+                                            self.regions)
+            self.made += 1
+            self.repaired += moved
+            if objective is not None:
+                objective.start(child)
+                if objective.feasible(parent) and \
+                    not objective.feasible(child):
+                    self.dropped += 1
+                    continue
+            child.crossed = True
+            kids.append(child)
+        return kids
+
+    def record(self, survivors):
+        '''
+        Counts the crossover children among the survivors.
+        '''
+        self.accepted += sum(s.crossed for s, _ in survivors)
@@ -3,15 +3,29 @@
 
 #%% Imports
 
+import functools
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 
 #%% Files
+# Read when first needed, so that datasets without these files can be used
 
-dublin = gpd.read_feather('./data/DublinElectoralDivisions.feather')
-islands = gpd.read_feather('./data/IslandElectoralDivisions.feather')
-counties = gpd.read_feather('./data/IrishCounties.feather')
+layer_paths = {
+    'dublin': './data/DublinElectoralDivisions.feather',
+    'islands': './data/IslandElectoralDivisions.feather',
+    'counties': './data/IrishCounties.feather',
+    }
+
+@functools.lru_cache(maxsize=None)
+def load_layer(name):
+    '''
+    Returns the dataframe of one of the files in layer_paths.
+    '''
+    df = gpd.read_feather(layer_paths[name])
+    if name == 'dublin':
+        df = convert_data(df)
+    return df
 
 #%% Convert Data Types
 
@@ -19,14 +33,13 @@ def convert_data(df):
     '''
     Converts data arrays to appropriate types.
     '''
-    for i in range(len(df)):
-        df.at[i,'NEIGHBOURS'] = df.at[i,'NEIGHBOURS'].astype(int)
-        df.at[i,'NB_CONS'] = df.at[i,'NB_CONS'].astype(str)
+    # Whole columns are replaced, as setting a cell to an array of one
+    # element (e.g. with df.at) stores it as a 0-d array
+    df['NEIGHBOURS'] = [np.atleast_1d(x).astype(int)
+                        for x in df['NEIGHBOURS']]
+    df['NB_CONS'] = [np.atleast_1d(x).astype(str) for x in df['NB_CONS']]
     return df
 
-#%%
-dublin = convert_data(dublin)
-
 #%% Get Indices
   
 def get_indices(ed_ids, df):
@@ -81,7 +94,7 @@ def remove_islands(df):
     try:
         # Get indices to be removed
         to_remove = [df[df['ED'] == ed].index.item() 
-                     for ed in list(islands['ED'])]
+                     for ed in list(load_layer('islands')['ED'])]
         # Remove all eight wholly-island EDs
         df2 = df.drop(to_remove).reset_index(drop=True)
         return df2
@@ -106,15 +119,19 @@ def remove_dublin(df):
 
 #%% Find Full State
 
-def find_full_state(df, add_dublin=False):
+def find_full_state(df, add_dublin=False, add_islands=True):
     '''
     Replaces eight wholly-island EDs in dataframe.
     If add_dublin=True, then also replaces EDs in Dublin.
+    Set add_islands=False if the islands were never removed (e.g. when they
+    are excluded EDs of a Dataset).
     '''
+    parts = [df]
     if add_dublin:
-        df2 = gpd.GeoDataFrame(pd.concat([df, dublin, islands]))
-    else:
-        df2 =  gpd.GeoDataFrame(pd.concat([df, islands]))
+        parts.append(load_layer('dublin'))
+    if add_islands:
+        parts.append(load_layer('islands'))
+    df2 = gpd.GeoDataFrame(pd.concat(parts))
     df2 = df2.reset_index(drop=True)
     df2['CON'] = df2['CON'].str.upper()
     return df2
@@ -135,7 +152,7 @@ def vna(df, c, use_current_seats=False, national_ratio=29800):
     '''
     Returns VNA (Variance from National Average) of constituency c.
     '''
-    ser_val = ser(df, c)
+    ser_val = ser(df, c, national_ratio)
     if use_current_seats:
         seats = int(df[df['CON']==c].reset_index(drop=True)['SEATS'][0])
         return (ser_val - seats)/seats
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                  DATASETS
+# =============================================================================
+# An ED dataset is read in full, and its special cases are declared rather
+# than cut out of the dataframe: fixed EDs are never flipped, excluded EDs
+# (e.g. islands) are never flipped and are exempt from contiguity, and extra
+# links (e.g. ferry routes) are added to the adjacency. The engines skip
+# these EDs with a mask, so rows are never dropped and re-concatenated.
+# Excluded EDs, and EDs which are not in the dataframe (e.g. outside a
+# regional dataset, or removed with remove_dublin), are cut out of the
+# adjacency, as in the StaticData of the array engine, so that both engines
+# see the same boundaries.
+
+#%% Imports
+
+import numpy as np
+import geopandas as gpd
+
+from data_analysis import convert_data
+
+#%% ED IDs
+
+def ed_ids(eds):
+    '''
+    Returns a set of ED_IDs from a list of ED_IDs, or from the path of a
+    feather file of EDs.
+    '''
+    if isinstance(eds, str):
+        return set(gpd.read_feather(eds)['ED_ID'].astype(int))
+    return {int(e) for e in eds}
+
+#%% Cut Out
+
+def cut_out(df, eds=()):
+    '''
+    Removes from the adjacency of df, in place, the given EDs (a set of
+    ED_IDs, which keep no neighbours) and any EDs which are not rows of df,
+    recomputing NB_CONS and BOUNDARY of the EDs next to them.
+    '''
+    kept = np.setdiff1d(df['ED_ID'].to_numpy(), np.array(sorted(eds)))
+    con_of = dict(zip(df['ED_ID'], df['CON']))
+    for i in df.index:
+        neighbours = np.atleast_1d(df.at[i,'NEIGHBOURS'])
+        if df.at[i,'ED_ID'] in eds:
+            near = neighbours[:0]
+        else:
+            near = neighbours[np.isin(neighbours, kept)]
+        if len(near) == len(neighbours):
+            continue
+        nb_cons = [con_of[n] for n in near if con_of[n] != df.at[i,'CON']]
+        df.at[i,'NEIGHBOURS'] = near
+        df.at[i,'NB_CONS'] = np.array(list(dict.fromkeys(nb_cons)),
+                                      dtype=str)
+        df.at[i,'BOUNDARY'] = int(len(nb_cons) > 0)
+    return df
+
+#%% Dataset
+
+class Dataset:
+    '''
+    An ED dataset (a feather file with the columns of
+    IrishElectoralDivisions.feather) and its special cases:
+        fixed           EDs which are never flipped (ED_IDs, or the path of
+                        a feather file of EDs)
+        fixed_counties  counties whose EDs are never flipped, e.g. DUBLIN
+        excluded        EDs which are never flipped and are exempt from
+                        contiguity, e.g. islands
+        links           extra (ED_ID, ED_ID) adjacencies, e.g. ferry links,
+                        between EDs which are not excluded
+    '''
+    def __init__(self, path, fixed=(), fixed_counties=(), excluded=(),
+                 links=()):
+        self.path = path
+        self.fixed = fixed
+        self.fixed_counties = [k.upper() for k in fixed_counties]
+        self.excluded = excluded
+        self.links = [tuple(link) for link in links]
+
+    @classmethod
+    def from_config(cls, data_config):
+        '''
+        Makes a Dataset from the data section of a run config.
+        '''
+        return cls(data_config['path'],
+                   data_config.get('fixed', ()),
+                   data_config.get('fixed_counties', ()),
+                   data_config.get('excluded', ()),
+                   data_config.get('links', ()))
+
+    def load(self):
+        '''
+        Reads and prepares the dataframe of all EDs, with boolean columns
+        FIXED (never flipped) and EXEMPT (exempt from contiguity), the
+        excluded EDs (and any neighbours which are not in the file) cut out
+        of NEIGHBOURS, NB_CONS and BOUNDARY, and the links added to them.
+        '''
+        df = convert_data(gpd.read_feather(self.path))
+        excluded = ed_ids(self.excluded)
+        df['EXEMPT'] = df['ED_ID'].isin(excluded)
+        df['FIXED'] = df['EXEMPT'] | df['ED_ID'].isin(ed_ids(self.fixed)) | \
+            df['COUNTY'].isin(self.fixed_counties)
+        cut_out(df, excluded)
+        self.add_links(df, excluded)
+        return df
+
+    def add_links(self, df, excluded=()):
+        '''
+        Adds the links of the dataset to df in place, in both directions.
+        Cells of one element (0-d arrays, as stored by df.at) are read as
+        arrays. Raises a ValueError for links to excluded EDs, which have no
+        adjacency.
+        '''
+        row = {e: k for k, e in enumerate(df['ED_ID'])}
+        for a, b in self.links:
+            if a in excluded or b in excluded:
+                raise ValueError(f'Link ({a}, {b}) joins an excluded ED')
+            if a not in row or b not in row:
+                continue
+            for i, j in ((row[a], row[b]), (row[b], row[a])):
+                df.at[i,'NEIGHBOURS'] = np.union1d(df.at[i,'NEIGHBOURS'],
+                                                   [df.at[j,'ED_ID']])
+                other = df.at[j,'CON']
+                if other != df.at[i,'CON'] and \
+                    other not in np.atleast_1d(df.at[i,'NB_CONS']):
+                    df.at[i,'NB_CONS'] = np.append(df.at[i,'NB_CONS'], other)
+                    df.at[i,'BOUNDARY'] = 1
+        return df
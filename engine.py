@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                               ARRAY ENGINE
+# =============================================================================
+# The evolutionary algorithm of evolutionary_algorithm.py, working on small
+# integer arrays (the CON code and flip count of each ED) together with the
+# shared StaticData of the dataset, rather than on copies of the dataframe.
+
+#%% Imports
+
+import numpy as np
+from numba import jit # Use numba for faster computation
+
+from reward_function import f_exp
+from evolutionary_algorithm import sort_array, compare
+from monitoring import summarise
+from static_data import build_static_data
+
+#%% Engine State
+
+class EngineState:
+    '''
+    The mutable part of a state:
+        con      CON code of each ED
+        change   number of times each ED has been flipped (as CHANGE)
+        con_pop  population of each CON, kept up to date by move
+    If a SeatObjective is used, it also records the seats of each CON
+    (seats) and the total number of seats (seat_total).
+    proposed_by lists the proposal used for each flip since the state was
+    copied from its parent (see proposals.py), and crossed is True for the
+    children of a Crossover (see crossover.py).
+    index is an optional ConnectivityIndex of con, kept up to date by move
+    (see connectivity.py).
+    '''
+    def __init__(self, con, change, con_pop):
+        self.con = con
+        self.change = change
+        self.con_pop = con_pop
+        self.seats = None
+        self.seat_total = None
+        self.proposed_by = []
+        self.crossed = False
+        self.index = None
+
+    def copy(self):
+        # proposed_by and crossed are not copied, as they only describe how
+        # the state was made from its parent
+        state = EngineState(self.con.copy(), self.change.copy(),
+                            self.con_pop.copy())
+        if self.seats is not None:
+            state.seats = self.seats.copy()
+            state.seat_total = self.seat_total
+        if self.index is not None:
+            state.index = self.index.copy(state.con)
+        return state
+
+#%% Initial State
+
+def initial_state(static, con=None, change=None):
+    '''
+    Returns an EngineState with the given CON codes and flip counts,
+    or the baseline state of static if not given.
+    '''
+    if con is None:
+        con = static.con0.copy()
+    if change is None:
+        change = np.zeros(static.n_eds, dtype=np.int8)
+    con_pop = np.bincount(con, weights=static.population,
+                          minlength=static.n_cons).astype(np.int64)
+    return EngineState(con, change, con_pop)
+
+#%% State From Frame
+
+def state_from_frame(static, df):
+    '''
+    Returns the EngineState of a dataframe with the same rows as static.
+    '''
+    con = static.con_codes(df['CON'].to_numpy())
+    change = df['CHANGE'].to_numpy().astype(np.int8)
+    return initial_state(static, con, change)
+
+#%% State Frame
+
+def state_frame(static, state, df):
+    '''
+    Returns a copy of df (with the same rows as static) with CON and CHANGE
+    taken from state, and NB_CONS and BOUNDARY recomputed to match.
+    '''
+    names = np.array(static.con_names)
+    df2 = df.copy()
+    df2['CON'] = names[state.con]
+    df2['CHANGE'] = state.change.astype(int)
+    nb_cons = neighbour_cons(static, state.con)
+    df2['NB_CONS'] = [names[c] for c in nb_cons]
+    df2['BOUNDARY'] = [int(c.size>0) for c in nb_cons]
+    return df2
+
+#%% Neighbouring CONs
+
+def neighbour_cons(static, con):
+    '''
+    Returns a list with an array of the neighbouring CON codes of each ED
+    (not including its own CON).
+    '''
+    other = con[static.indices]
+    differs = other != con[static.edge_src]
+    pairs = np.unique(np.stack([static.edge_src[differs], other[differs]],
+                               axis=1), axis=0)
+    splits = np.searchsorted(pairs[:,0], np.arange(1, static.n_eds))
+    return np.split(pairs[:,1], splits)
+
+#%% Boundary
+
+def boundary_mask(static, con):
+    '''
+    Returns a boolean array which is True for EDs with a neighbour in a
+    different CON.
+    '''
+    differs = con[static.edge_src] != con[static.indices]
+    return np.bincount(static.edge_src[differs],
+                       minlength=static.n_eds) > 0
+
+#%% Move
+
+def move(static, state, i, new_con):
+    '''
+    Moves ED i to CON new_con in place, updating the CON populations.
+    '''
+    old_con = state.con[i]
+    pop = static.population[i]
+    state.con_pop[old_con] -= pop
+    state.con_pop[new_con] += pop
+    state.con[i] = new_con
+    # Record that this ED has changed, as in flip
+    state.change[i] = 2 if state.change[i] == 1 else 1
+    if state.index is not None:
+        state.index.moved(i, old_con, new_con)
+
+#%% Apply Moves
+
+def apply_moves(static, state, moves, objective=None):
+    '''
+    Applies a list of (ED, new CON) moves to state in order, in place.
+    If a SeatObjective is given and rejects a move, then the moves already
+    applied are undone and None is returned. Otherwise returns a list of
+    (ED, old CON, old CHANGE) records for undo_moves.
+    '''
+    done = []
+    for i, new_con in moves:
+        if objective is not None and \
+            not objective.move_allowed(static, state, i, new_con):
+            undo_moves(static, state, done, objective)
+            return None
+        done.append((i, state.con[i], state.change[i]))
+        if objective is None:
+            move(static, state, i, new_con)
+        else:
+            objective.apply(static, state, i, new_con)
+    return done
+
+def undo_moves(static, state, done, objective=None):
+    '''
+    Reverts moves recorded by apply_moves, in place.
+    '''
+    for i, con, change in reversed(done):
+        current = state.con[i]
+        pop = static.population[i]
+        state.con_pop[current] -= pop
+        state.con_pop[con] += pop
+        state.con[i] = con
+        state.change[i] = change
+        if state.index is not None:
+            state.index.moved(i, current, con)
+        if objective is not None:
+            objective.refresh(state, (current, con))
+
+#%% Flippable
+
+def flippable(static, state):
+    '''
+    Returns a boolean array which is True for EDs which may be flipped:
+    boundary EDs which have not previously changed, with non-zero population
+    (and which the dataset does not fix).
+    '''
+    return boundary_mask(static, state.con) & (state.change<1) \
+        & (static.population>0) & static.movable
+
+#%% Uniform Move
+
+def uniform_move(static, state, rng, eligible):
+    '''
+    Returns a random eligible ED and a random neighbouring CON of it.
+    Same proposal as flip in evolutionary_algorithm.py.
+    '''
+    pool = np.flatnonzero(eligible)
+    i = pool[rng.integers(len(pool))]
+    nb_cons = np.unique(state.con[static.neighbours(i)])
+    nb_cons = nb_cons[nb_cons!=state.con[i]]
+    return i, nb_cons[rng.integers(len(nb_cons))]
+
+#%% Flip
+
+def flip_state(static, state, rng, objective=None, tries=50, 
+               proposals=None, articulation=None):
+    '''
+    Moves a random boundary ED (which has not previously changed, and has
+    non-zero population) to a random neighbouring CON, in place.
+    By default the ED and CON are chosen uniformly, as in flip; otherwise
+    the move is drawn from proposals (a ProposalMix from proposals.py), and
+    may be a compound move of several EDs.
+    If a SeatObjective is given, then proposals which break its seat limits
+    are rejected and redrawn, up to <tries> times (after which the state is
+    left unchanged). Compound moves which leave any of the CONs involved
+    discontiguous are also rejected.
+    If an ArticulationFilter is given, EDs whose flip would disconnect
+    their CON are left out of the pool.
+    '''
+    eligible = flippable(static, state)
+    if articulation is not None:
+        eligible = articulation.filter(static, state, eligible)
+    for attempt in range(tries):
+        if proposals is None:
+            name = 'uniform'
+            moves = [uniform_move(static, state, rng, eligible)]
+        else:
+            name, moves = proposals.propose(static, state, rng, eligible)
+        done = apply_moves(static, state, moves, objective)
+        if done is None:
+            objective.rejected += 1
+            continue
+        if len(moves) > 1:
+            # Check the CONs involved in one local pass
+            cons = {c for _, c in moves} | {c for _, c, _ in done}
+            if not state_contiguous(static, state, cons):
+                undo_moves(static, state, done, objective)
+                proposals.rejected[name] += 1
+                continue
+        state.proposed_by.append(name)
+        return state
+    return state
+
+#%% Contiguity
+
+@jit(nopython=True)
+def count_reachable(indptr, indices, con, start):
+    '''
+    Counts the EDs reachable from ED start without leaving its CON.
+    '''
+    c = con[start]
+    seen = np.zeros(con.size, dtype=np.bool_)
+    stack = np.empty(con.size, dtype=np.int64)
+    seen[start] = True
+    stack[0] = start
+    top = 1
+    count = 0
+    while top > 0:
+        top -= 1
+        i = stack[top]
+        count += 1
+        for k in range(indptr[i], indptr[i+1]):
+            j = indices[k]
+            if con[j] == c and not seen[j]:
+                seen[j] = True
+                stack[top] = j
+                top += 1
+    return count
+
+def changed_cons(static, state):
+    '''
+    Returns the CON codes which may have become discontiguous: the CONs of
+    changed EDs and of their neighbours.
+    '''
+    changed = np.flatnonzero(state.con != static.con0)
+    nbs = [static.neighbours(i) for i in changed]
+    eds = np.concatenate([changed] + nbs) if len(changed) else changed
+    return np.unique(state.con[eds])
+
+def state_contiguous(static, state, cons=None):
+    '''
+    Returns 1 if all the given CONs (by default, those which may have
+    changed) are contiguous, 0 if not.
+    As in f_contiguity, a CON containing a single ED counts as discontiguous.
+    EDs exempt from contiguity are ignored.
+    '''
+    if cons is None:
+        cons = changed_cons(static, state)
+    for c in cons:
+        members = np.flatnonzero((state.con==c) & ~static.exempt)
+        if members.size == 0:
+            continue
+        if members.size == 1:
+            return 0
+        reached = count_reachable(static.indptr, static.indices, state.con,
+                                  members[0])
+        if reached != members.size:
+            return 0
+    return 1
+
+#%% Reward Terms
+
+def ser_terms(s, d=0.03):
+    '''
+    Vectorised version of the bump function f in reward_function.py.
+    '''
+    x = np.abs(s - np.round(s))
+    safe = np.where(x==0, 1, x)
+    return np.where(x==0, 1, 1 - np.exp(-d/safe))
+
+def county_boundary_term(static, state, a=1e-10, b=1e-4):
+    '''
+    Array version of f_county_boundary.
+    '''
+    breach = ~static.home[state.con, static.county]
+    return f_exp(static.population[breach].sum(), breach.sum(), a, b)
+
+def continuity_term(static, state, a=0.0001, b=0.01):
+    '''
+    Array version of f_continuity: counts EDs not in their baseline CON.
+    '''
+    changed = state.con != static.con0
+    return f_exp(static.population[changed].sum(), changed.sum(), a, b)
+
+def ser_term(static, state, a=3, national_ratio=29800):
+    '''
+    Array version of f_ser, over the CONs which contain at least one ED.
+    '''
+    present = np.bincount(state.con, minlength=static.n_cons) > 0
+    return a*ser_terms(state.con_pop[present]/national_ratio).sum()
+
+#%% Reward Totals
+
+def reward_totals(static, state):
+    '''
+    Returns the totals from which the county boundary and continuity terms
+    are computed: (EDs outside a home county, people in them, changed EDs,
+    people in them).
+    '''
+    breach = ~static.home[state.con, static.county]
+    changed = state.con != static.con0
+    return (breach.sum(), static.population[breach].sum(),
+            changed.sum(), static.population[changed].sum())
+
+#%% Move Delta
+
+def move_delta(static, state, moves, totals=None, a_ser=3, a_cb=1e-10,
+               b_cb=1e-4, a_cont=1e-3, b_cont=0.01, nr=29800):
+    '''
+    Returns the change in reward (ignoring contiguity) if the list of
+    (ED, new CON) moves were applied together, without changing state.
+    Each ED may appear only once. totals (from reward_totals) may be passed
+    in when scoring many moves from the same state.
+    '''
+    if totals is None:
+        totals = reward_totals(static, state)
+    eds = np.array([i for i, _ in moves])
+    new = np.array([c for _, c in moves])
+    old = state.con[eds]
+    pops = static.population[eds]
+
+    # SER of the CONs involved, before and after
+    cons = np.unique(np.concatenate([old, new]))
+    before = state.con_pop[cons].astype(float)
+    after = before.copy()
+    for k, c in enumerate(cons):
+        after[k] += pops[new==c].sum() - pops[old==c].sum()
+    d_ser = a_ser*(ser_terms(after/nr).sum() - ser_terms(before/nr).sum())
+
+    # County boundary and continuity totals, before and after
+    county = static.county[eds]
+    breach_before = ~static.home[old, county]
+    breach_after = ~static.home[new, county]
+    changed_before = old != static.con0[eds]
+    changed_after = new != static.con0[eds]
+    n_cb, p_cb, n_cont, p_cont = totals
+    n_cb2 = n_cb + breach_after.sum() - breach_before.sum()
+    p_cb2 = p_cb + pops[breach_after].sum() - pops[breach_before].sum()
+    n_cont2 = n_cont + changed_after.sum() - changed_before.sum()
+    p_cont2 = p_cont + pops[changed_after].sum() - pops[changed_before].sum()
+    d_cb = f_exp(p_cb2, n_cb2, a_cb, b_cb) - f_exp(p_cb, n_cb, a_cb, b_cb)
+    d_cont = f_exp(p_cont2, n_cont2, a_cont, b_cont) - \
+        f_exp(p_cont, n_cont, a_cont, b_cont)
+    return d_ser + d_cb + d_cont
+
+#%% Reward
+
+def state_reward(static, state, a_ser=3, a_cb=1e-10, b_cb=1e-4, a_cont=1e-3,
+                 b_cont=0.01, nr=29800):
+    '''
+    Array version of reward, with the same parameters.
+    '''
+    part, _ = state_reward_partial(static, state, a_ser, a_cont, b_cont, nr)
+    return state_reward_rest(static, state, part, a_cb, b_cb)
+
+def state_reward_partial(static, state, a_ser=3, a_cont=1e-3, b_cont=0.01,
+                         nr=29800):
+    '''
+    Array version of reward_partial: returns the continuity and SER terms,
+    and an upper bound on the full reward.
+    '''
+    cont = continuity_term(static, state, a_cont, b_cont)
+    s = ser_term(static, state, a_ser, nr)
+    return (cont, s), cont + s + 1
+
+def state_reward_rest(static, state, part, a_cb=1e-10, b_cb=1e-4):
+    '''
+    Array version of reward_rest: checks contiguity and adds the county
+    boundary term to the terms from state_reward_partial.
+    '''
+    if not state_contiguous(static, state):
+        return 0 # No reward if not globally contiguous
+    cont, s = part
+    return county_boundary_term(static, state, a_cb, b_cb) + cont + s
+
+#%% Reproduce
+
+def reproduce_state(static, state, flips=10, kids=10, rng=None,
+                    objective=None, proposals=None, articulation=None):
+    '''
+    Array version of reproduce: returns <kids> copies of state on which
+    <flips> random flips have been performed.
+    '''
+    offspring = []
+    for j in range(kids):
+        kid = state.copy()
+        for i in range(flips):
+            flip_state(static, kid, rng, objective, proposals=proposals,
+                       articulation=articulation)
+        if articulation is not None:
+            articulation.child_done()
+        offspring.append(kid)
+    return offspring
+
+#%% Kill
+
+def kill_states(static, offspring, keep=10, reward_params=None,
+                proposals=None, crossover=None, pruning=None):
+    '''
+    Array version of kill: returns [state, reward] pairs for the <keep>
+    best states in offspring.
+    If proposals or crossover are given, then their acceptance statistics
+    are updated. If a Pruning is given, states which cannot reach the
+    <keep> best are not scored in full.
+    '''
+    if reward_params is None:
+        reward_params = {}
+    if pruning is not None:
+        rest = dict(reward_params)
+        cheap = {k: rest.pop(k) for k in ('a_ser', 'a_cont', 'b_cont', 'nr')
+                 if k in rest}
+        chopping_block = pruning.select(
+            offspring, keep,
+            lambda x: state_reward_partial(static, x, **cheap),
+            lambda x, part: state_reward_rest(static, x, part, **rest))
+    else:
+        chopping_block = [[x, state_reward(static, x, **reward_params)]
+                          for x in offspring]
+    the_chosen_ones = sort_array(chopping_block)[:keep]
+    if proposals is not None:
+        proposals.record(the_chosen_ones)
+    if crossover is not None:
+        crossover.record(the_chosen_ones)
+    return the_chosen_ones
+
+#%% Notify
+
+def notify_states(static, callback, survivors, generation, evaluations,
+                  global_best, national_ratio=29800):
+    '''
+    Passes a summary of one generation's survivors to callback, if given.
+    '''
+    if callback is not None:
+        best = survivors[0][0]
+        present = np.bincount(best.con, minlength=static.n_cons) > 0
+        summary = summarise(
+            [r for _, r in survivors],
+            best.con_pop[present],
+            (best.con != static.con0).sum(),
+            generation,
+            evaluations,
+            global_best[0][1],
+            national_ratio
+            )
+        callback(summary, survivors)
+
+#%% Evolve
+
+def evolve_states(static, state, flips=10, kids=25, keep=3, callback=None,
+                  reward_params=None, rng=None, objective=None,
+                  proposals=None, crossover=None, articulation=None,
+                  pruning=None):
+    '''
+    Array version of evolve, starting from EngineState state.
+    rng is a numpy random Generator (or a seed).
+    If a SeatObjective is given, then flips which break its seat limits are
+    rejected, and its national ratio is used unless nr is in reward_params.
+    If a ProposalMix is given, then flips are drawn from it, and the
+    fraction of each proposal's flips which survived is added to each
+    summary.
+    If a Crossover is given, then each generation after the first also has
+    crossover children of its parent and the global best states.
+    If an ArticulationFilter is given, then flips which would disconnect a
+    CON are never proposed, and its counts are added to each summary.
+    If a Pruning is given, then states which cannot survive selection are
+    not scored in full, and the number pruned is added to each summary.
+    Returns the three best EngineStates and corresponding rewards.
+    '''
+    rng = np.random.default_rng(rng)
+    if articulation is not None:
+        callback = articulation.reporting(callback)
+    if pruning is not None:
+        callback = pruning.reporting(callback)
+    if proposals is not None:
+        callback = proposals.reporting(callback)
+    reward_params = dict(reward_params or {})
+    if objective is not None:
+        state = objective.start(state.copy())
+        reward_params.setdefault('nr', objective.national_ratio)
+    nr = reward_params.get('nr', 29800)
+
+    def generation_of(parent, global_best=None):
+        # Returns the survivors and the number of children evaluated
+        offspring = reproduce_state(static, parent, flips, kids, rng,
+                                    objective, proposals, articulation)
+        if crossover is not None and global_best is not None:
+            offspring += crossover.offspring(
+                static, parent, [x[0] for x in global_best], rng, objective)
+        return (kill_states(static, offspring, keep, reward_params,
+                            proposals, crossover, pruning),
+                len(offspring))
+
+    # Create parents
+    parents_and_rewards, evaluations = generation_of(state)
+    # Initialise global_best
+    global_best = sort_array(parents_and_rewards)
+    generation = 0
+    notify_states(static, callback, parents_and_rewards, generation,
+                  evaluations, global_best, nr)
+
+    # Main evolutionary loop, as in evolve
+    for parent, _ in parents_and_rewards:
+        children_and_rewards, n = generation_of(parent, global_best)
+        generation += 1
+        evaluations += n
+        notify_states(static, callback, children_and_rewards, generation,
+                      evaluations, global_best, nr)
+        for child_and_reward in children_and_rewards:
+            global_best = compare(child_and_reward, global_best, keep)
+            gchildren_and_rewards, n = generation_of(child_and_reward[0],
+                                                     global_best)
+            for gchild_and_reward in gchildren_and_rewards:
+                global_best = compare(gchild_and_reward, global_best, keep)
+            generation += 1
+            evaluations += n
+            notify_states(static, callback, gchildren_and_rewards,
+                          generation, evaluations, global_best, nr)
+
+    final_states = [x[0] for x in global_best]
+    final_rewards = [x[1] for x in global_best]
+    return final_states[0:3], final_rewards[0:3]
+
+#%% Evolve Frame
+
+def evolve_frame(df, flips=10, kids=25, keep=3, callback=None,
+                 reward_params=None, rng=None):
+    '''
+    Drop-in replacement for evolve, using the array engine.
+    Takes and returns dataframes (NB_CONS and BOUNDARY are recomputed for
+    the returned states).
+    '''
+    static = build_static_data(df)
+    states, rewards = evolve_states(static, state_from_frame(static, df),
+                                    flips, kids, keep, callback,
+                                    reward_params, rng)
+    return [state_frame(static, s, df) for s in states], rewards
@@ -7,6 +7,7 @@
 
 #%% Imports
 
+import heapq
 import numpy as np
 import random
 
@@ -16,31 +17,60 @@ import random
 #   2. Respect for county boundaries
 #   3. Continuity over time
 #   4. Compactness (convex hull) (not currently implemented)
-from reward_function import reward
+from reward_function import reward, reward_partial, reward_rest
+
+# Summaries passed to the optional callback of evolve
+from monitoring import summarise_generation
 
 # =============================================================================
 #                           FUNCTION DEFINITIONS
 # =============================================================================
 
+#%% Cell
+
+def cell(df, i, column):
+    '''
+    Returns the array in a column (e.g. NB_CONS) of row i of df. A cell set
+    to an array of one element holds a 0-d array, which is returned as an
+    array of one element.
+    '''
+    return np.atleast_1d(df.at[i,column])
+
 #%% Flip
 
-def flip(df_orig):
+def flip(df_orig, articulation=None, i=None, new_con=None):
     '''
     Randomly swaps the CON of a boundary ED.
+    If an ArticulationFilter is given, EDs whose flip would disconnect their
+    CON are left out of the pool.
+    The ED (a row index) and the new CON may be given instead of being
+    chosen at random, e.g. to replay a sequence of flips.
     '''
     # Make copy of input dataframe
     df = df_orig.copy()
     
-    # Filter the dataframe to contain only boundary EDs 
-    # which have not previously changed, and have non-zero population
-    pool = df[(df['BOUNDARY']!=0)&(df['CHANGE']<1)&(df['POPULATION']>0)]
-    
-    # Randomly choose one of the filtered EDs
-    i = int(random.choice(pool.index.to_list()))
+    if i is None:
+        # Filter the dataframe to contain only boundary EDs 
+        # which have not previously changed, and have non-zero population
+        pool = df[(df['BOUNDARY']!=0)&(df['CHANGE']<1)
+                  &(df['POPULATION']>0)]
+        # Leave out EDs which the dataset fixes (see datasets.py)
+        if 'FIXED' in df:
+            pool = pool[~pool['FIXED']]
+        
+        # Randomly choose one of the filtered EDs
+        candidates = pool.index.to_list()
+        i = int(random.choice(candidates))
+        # Redraw while the chosen ED would disconnect its CON
+        while articulation is not None and len(candidates) > 1 and \
+            articulation.splits(df, i):
+            candidates.remove(i)
+            i = int(random.choice(candidates))
     # Get pre-flip CON of chosen ED
     old_con = df.at[i,'CON']
-    # Choose random neighbouring CON of chosen ED
-    new_con = random.choice(df.at[i,'NB_CONS'])
+    if new_con is None:
+        # Choose random neighbouring CON of chosen ED
+        new_con = random.choice(cell(df, i, 'NB_CONS'))
     # Update the CON of of the chosen ED; this is the 'flip'
     df.at[i,'CON'] = new_con
     # Update CHANGE to record that this ED has changed
@@ -49,23 +79,30 @@ def flip(df_orig):
     else:
         df.at[i,'CHANGE'] = 1
     # Ensure no ED has its own CON as a neighbour
-    i0 = np.where(df.at[i,'NB_CONS']==new_con)
-    df.at[i,'NB_CONS'] = np.delete(df.at[i,'NB_CONS'],i0)
+    i0 = np.where(cell(df, i, 'NB_CONS')==new_con)
+    df.at[i,'NB_CONS'] = np.delete(cell(df, i, 'NB_CONS'),i0)
     
     # Get an array of indices of neighbouring EDs
-    nb_ed_ids = df.at[i,'NEIGHBOURS']
+    nb_ed_ids = cell(df, i, 'NEIGHBOURS')
     nb_indices = []
     for n in nb_ed_ids:
         nb_indices.append(df.loc[df['ED_ID']==n].index[0])
+    
+    # If any neighbouring ED is still in old_con, then old_con is now a
+    # neighbouring CON of the chosen ED
+    if any(df.at[y,'CON'] == old_con for y in nb_indices) and \
+        old_con not in list(cell(df, i, 'NB_CONS')):
+        df.at[i,'NB_CONS'] = np.append(cell(df, i, 'NB_CONS'), old_con)
         
-    # For each neighbouring ED y, if new_con is not listed in its neighbouring
-    # CONs, then append it to the list
+    # For each neighbouring ED y outside new_con, if new_con is not listed in
+    # its neighbouring CONs, then append it to the list
     for y in nb_indices:
-        if new_con not in list(df.at[y,'NB_CONS']):
-            df.at[y,'NB_CONS'] = np.append(df.at[y,'NB_CONS'], new_con)
+        if df.at[y,'CON'] != new_con and \
+            new_con not in list(cell(df, y, 'NB_CONS')):
+            df.at[y,'NB_CONS'] = np.append(cell(df, y, 'NB_CONS'), new_con)
             
         # Neighbouring EDs of y
-        nb_ed_ids_y = df.at[y,'NEIGHBOURS']
+        nb_ed_ids_y = cell(df, y, 'NEIGHBOURS')
         nb_indices_y = []
         for n2 in nb_ed_ids_y:
             nb_indices_y.append(df[df['ED_ID']==n2].index[0])
@@ -78,8 +115,8 @@ def flip(df_orig):
         # If no neighbours of y in old_con, remove old_con from the list of
         # neighbouring CONs of y
         if count == 0:
-            i1 = np.where(df.at[y,'NB_CONS']==old_con)
-            df.at[y,'NB_CONS'] = np.delete(df.at[y, 'NB_CONS'], i1)
+            i1 = np.where(cell(df, y, 'NB_CONS')==old_con)
+            df.at[y,'NB_CONS'] = np.delete(cell(df, y, 'NB_CONS'), i1)
 
     # If an ED has no neighbouting EDs, then it is not a boundary ED
     for j in range(len(df)):
@@ -102,7 +139,7 @@ def sort_array(arr):
 #%% Reproduce
 
 # Take an argument df corresponding to the parent of the generation
-def reproduce(df, flips=10, kids=10):
+def reproduce(df, flips=10, kids=10, articulation=None):
     '''
     Takes in a parent dataframe df and outputs a list containing <kid> child 
     dataframes on which <flips> random flips have been performed.
@@ -111,28 +148,99 @@ def reproduce(df, flips=10, kids=10):
     for j in range(kids):
         kid_data = df.copy()
         for i in range(flips):
-            kid_data = flip(kid_data)
+            kid_data = flip(kid_data, articulation)
+        if articulation is not None:
+            articulation.child_done()
         offspring.append(kid_data)
     return offspring
 
 #%% Kill
 
-def kill(offspring, keep=10):
+def kill(offspring, keep=10, reward_params=None, pruning=None):
     '''
-    Takes in a list of child dataframes, computes the reward function for each, 
+    Takes in a list of child dataframes, computes the reward function for each,
     and outputs a list with entries [child dataframe, corresponding reward]
     for the <keep> best children.
+    reward_params is an optional dictionary of keyword arguments for reward
+    (a_ser, a_cb, b_cb, a_cont, b_cont, nr).
+    If a Pruning is given, children which cannot reach the <keep> best are
+    not scored in full.
     '''
+    if reward_params is None:
+        reward_params = {}
     chopping_block=[]
-    for x in offspring:
-        kid_data = x.copy()
-        # Compute rewards
-        r = reward(kid_data)
-        chopping_block.append([x,r])
+    if pruning is not None:
+        # Split reward_params between the cheap terms and the rest
+        rest = dict(reward_params)
+        cheap = {k: rest.pop(k) for k in ('a_ser', 'a_cont', 'b_cont', 'nr')
+                 if k in rest}
+        scored = pruning.select(
+            [x.copy() for x in offspring], keep,
+            lambda kid_data: reward_partial(kid_data, **cheap),
+            lambda kid_data, part: reward_rest(kid_data, part, **rest))
+        for x, (_, r) in zip(offspring, scored):
+            chopping_block.append([x,r])
+    else:
+        for x in offspring:
+            kid_data = x.copy()
+            # Compute rewards
+            r = reward(kid_data, **reward_params)
+            chopping_block.append([x,r])
     # Sort by rewards and retain dataframes with <keep> highest rewards
     the_chosen_ones = sort_array(chopping_block)[:keep]
     return the_chosen_ones
 
+#%% Pruning
+
+class Pruning:
+    '''
+    Bound-and-prune selection for kill. The cheap terms of the reward, and
+    an upper bound on the full reward, are computed for every child first.
+    Children are then scored in full in order of their bounds, best first,
+    and once <keep> children have been scored, any child whose bound is
+    below the <keep>th best reward so far cannot survive, so it is given
+    reward 0 without being scored in full.
+    Counts the children scored in full and pruned.
+    '''
+    def __init__(self):
+        self.scored = 0
+        self.pruned = 0
+
+    def select(self, offspring, keep, partial, rest):
+        '''
+        Returns [child, reward] pairs for offspring (in the same order),
+        where partial(child) returns (cheap terms, upper bound) and
+        rest(child, cheap terms) returns the full reward.
+        '''
+        parts = [partial(x) for x in offspring]
+        order = sorted(range(len(offspring)), key=lambda k: parts[k][1],
+                       reverse=True)
+        rewards = [0]*len(offspring)
+        best = [] # Heap of the <keep> best rewards so far
+        for k in order:
+            part, bound = parts[k]
+            if len(best) >= keep and bound < best[0]:
+                self.pruned += 1
+                continue
+            rewards[k] = rest(offspring[k], part)
+            self.scored += 1
+            if len(best) < keep:
+                heapq.heappush(best, rewards[k])
+            else:
+                heapq.heappushpop(best, rewards[k])
+        return [[x, r] for x, r in zip(offspring, rewards)]
+
+    def reporting(self, callback):
+        '''
+        Wraps an evolve callback to add 'pruned' to each generation summary.
+        '''
+        if callback is None:
+            return None
+        def report(summary, survivors):
+            summary['pruned'] = self.pruned
+            callback(summary, survivors)
+        return report
+
 #%% Compare
 
 def compare(survivor, global_best, keep=10):
@@ -148,16 +256,50 @@ def compare(survivor, global_best, keep=10):
     # Return <keep> best survivors
     return sort_array(global_best)[:keep]
 
+#%% Notify
+
+def notify(callback, survivors, generation, evaluations, global_best,
+           national_ratio=29800):
+    '''
+    Passes a summary of one generation's survivors to callback, if given.
+    '''
+    if callback is not None:
+        summary = summarise_generation(survivors, generation, evaluations,
+                                       global_best, national_ratio)
+        callback(summary, survivors)
+
 #%% Evolve
-def evolve(df_orig, flips=10, kids=25, keep=3):
+def evolve(df_orig, flips=10, kids=25, keep=3, callback=None, 
+           reward_params=None, articulation=None, pruning=None):
     '''
     Evolve original state to find improved state.
+    If callback is given, then it is called after every generation as 
+    callback(summary, survivors), where summary is a dictionary from
+    summarise_generation and survivors is the list of [df, reward] pairs.
+    reward_params is an optional dictionary of keyword arguments for reward.
+    If an ArticulationFilter is given, then flips which would disconnect a
+    CON are never made, and its counts are added to each summary.
+    If a Pruning is given, then children which cannot survive kill are not
+    scored in full, and the number pruned is added to each summary.
     '''
+    if reward_params is None:
+        reward_params = {}
+    if articulation is not None:
+        callback = articulation.reporting(callback)
+    if pruning is not None:
+        callback = pruning.reporting(callback)
+    nr = reward_params.get('nr', 29800)
     df = df_orig.copy()
     # Create parents
-    parents_and_rewards = kill(reproduce(df, flips, kids), keep)
+    parents_and_rewards = kill(reproduce(df, flips, kids, articulation), keep,
+                               reward_params, pruning)
     # Initialise global_best
     global_best = sort_array(parents_and_rewards)
+    # Count generations and reward evaluations for the callback
+    generation = 0
+    evaluations = kids
+    notify(callback, parents_and_rewards, generation, evaluations, 
+           global_best, nr)
 
     # Main evolutionary loop
     i = 1
@@ -165,7 +307,13 @@ def evolve(df_orig, flips=10, kids=25, keep=3):
         # Get parent df
         parent = parent_and_reward[0]
         # Find children
-        children_and_rewards = kill(reproduce(parent, flips, kids), keep)
+        children_and_rewards = kill(reproduce(parent, flips, kids,
+                                              articulation),
+                                    keep, reward_params, pruning)
+        generation += 1
+        evaluations += kids
+        notify(callback, children_and_rewards, generation, evaluations, 
+               global_best, nr)
         j = 1
         for child_and_reward in children_and_rewards:
             # Update global_best
@@ -175,12 +323,18 @@ def evolve(df_orig, flips=10, kids=25, keep=3):
             # Print status update
             print(f'Parent {i}, Child {j}')
             # Find grandchildren
-            gchildren_and_rewards = kill(reproduce(child, flips, kids), keep)
+            gchildren_and_rewards = kill(
+                reproduce(child, flips, kids, articulation), keep,
+                reward_params, pruning)
             k = 1
             for gchild_and_reward in gchildren_and_rewards:
                 k += 1
                 # Update global_best
                 global_best = compare(gchild_and_reward, global_best, keep)
+            generation += 1
+            evaluations += kids
+            notify(callback, gchildren_and_rewards, generation, evaluations,
+                   global_best, nr)
             j += 1
         i += 1
                 
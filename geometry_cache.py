@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              GEOMETRY CACHE
+# =============================================================================
+
+#%% Imports
+
+import hashlib
+import pandas as pd
+import geopandas as gpd
+
+from collections import OrderedDict
+
+#%% Parameters
+
+# Simplification tolerances (in metres) stored for each state
+tolerances = (15, 100, 500)
+
+#%% Assignment Key
+
+def assignment_key(df):
+    '''
+    Returns a hash identifying the assignment of EDs to CONs in df.
+    Two states with the same EDs in the same CONs get the same key.
+    '''
+    data = pd.DataFrame({
+        'ED_ID': df['ED_ID'].to_numpy(),
+        'CON': df['CON'].str.upper().to_numpy()
+        })
+    hashes = pd.util.hash_pandas_object(data, index=False)
+    return hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()
+
+#%% Dissolve State
+
+def dissolve_state(df, tolerances=tolerances):
+    '''
+    Dissolves the EDs of df into one polygon per CON.
+    Returns a dictionary containing:
+        'cons': GeoDataFrame of CON polygons, indexed by upper-case CON,
+                with the majority COUNTY of each CON
+        'simplified': dictionary of tolerance:simplified GeoSeries
+        'labels': GeoSeries of label points (centroids) of each CON
+    '''
+    data = gpd.GeoDataFrame(
+        {'CON': df['CON'].str.upper(), 'COUNTY': df['COUNTY']},
+        geometry=df.geometry.values,
+        crs=df.crs
+        )
+    cons = data.dissolve(by='CON', aggfunc=lambda x: x.mode().iloc[0])
+    simplified = {tol: cons.geometry.simplify(tol) for tol in tolerances}
+    return {
+        'cons': cons,
+        'simplified': simplified,
+        'labels': cons.geometry.centroid
+        }
+
+#%% Geometry Cache
+
+class GeometryCache:
+    '''
+    Stores dissolved and simplified CON geometries for recently plotted
+    states, keyed by assignment_key, so re-plotting a state is near-instant.
+    '''
+    def __init__(self, tolerances=tolerances, max_entries=32):
+        self.tolerances = tolerances
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, df):
+        '''
+        Returns the cached entry for the state df, dissolving it if needed.
+        '''
+        key = assignment_key(df)
+        if key in self.entries:
+            # Mark as most recently used
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        entry = dissolve_state(df, self.tolerances)
+        self.entries[key] = entry
+        # Forget least recently used states
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def outlines(self, df, tolerance=15):
+        '''
+        Returns a GeoDataFrame of CON polygons of df, simplified with the
+        nearest stored tolerance, with title-case CON names (for plotting).
+        '''
+        entry = self.get(df)
+        tol = min(self.tolerances, key=lambda t: abs(t - tolerance))
+        outlines = gpd.GeoDataFrame(
+            {'CON': entry['cons'].index.str.title(),
+             'COUNTY': entry['cons']['COUNTY'].to_numpy()},
+            geometry=entry['simplified'][tol].to_numpy(),
+            crs=entry['cons'].crs
+            )
+        return outlines
+
+    def label_points(self, df):
+        '''
+        Returns a dictionary of title-case CON:(x, y) label points for df.
+        '''
+        labels = self.get(df)['labels']
+        return {c.title(): (pt.x, pt.y) for c, pt in labels.items()}
+
+    def clear(self):
+        self.entries.clear()
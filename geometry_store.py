@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              GEOMETRY STORE
+# =============================================================================
+# ED geometries on disk, memory-mapped rather than read into memory:
+#
+#   <directory>/wkb.bin            WKB of every geometry, one after another
+#   <directory>/offsets.npy        start of each geometry in wkb.bin (n+1)
+#   <directory>/bounds.npy         bounding box of each geometry (n x 4)
+#   <directory>/attributes.feather key and region columns (e.g. ED_ID, COUNTY)
+#   <directory>/crs.wkt            coordinate reference system
+#
+# Only the bounding boxes are scanned to find the geometries in a region or
+# view, and only the WKB of the geometries drawn is read and decoded, so
+# datasets much finer than EDs (e.g. small areas) can be plotted.
+
+#%% Imports
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+#%% Build Geometry Store
+
+def build_geometry_store(df, directory, key='ED_ID', columns=('COUNTY',)):
+    '''
+    Writes the geometries of the GeoDataFrame df to a geometry store in
+    directory, with the key column (identifying each row, e.g. ED_ID) and
+    any other columns to select regions by.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    wkb = df.geometry.to_wkb().to_numpy()
+    sizes = np.fromiter((len(b) for b in wkb), dtype=np.int64,
+                        count=len(wkb))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    with open(os.path.join(directory, 'wkb.bin'), 'wb') as f:
+        for b in wkb:
+            f.write(b)
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'bounds.npy'),
+            df.geometry.bounds.to_numpy(dtype=np.float64))
+    attributes = pd.DataFrame({c: df[c].to_numpy()
+                               for c in (key, *columns) if c in df})
+    attributes.to_feather(os.path.join(directory, 'attributes.feather'))
+    with open(os.path.join(directory, 'crs.wkt'), 'w') as f:
+        f.write('' if df.crs is None else df.crs.to_wkt())
+    return GeometryStore(directory, key)
+
+#%% Geometry Store
+
+class GeometryStore:
+    '''
+    A geometry store written by build_geometry_store. The WKB, offsets and
+    bounds stay on disk (memory-mapped), and only the attributes are read.
+    Rows are given by position in the store; rows_of finds the rows of keys.
+    '''
+    def __init__(self, directory, key='ED_ID'):
+        self.directory = directory
+        self.key = key
+        self.wkb = np.memmap(os.path.join(directory, 'wkb.bin'),
+                             dtype=np.uint8, mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'),
+                               mmap_mode='r')
+        self.bounds = np.load(os.path.join(directory, 'bounds.npy'),
+                              mmap_mode='r')
+        self.attributes = pd.read_feather(
+            os.path.join(directory, 'attributes.feather'))
+        with open(os.path.join(directory, 'crs.wkt')) as f:
+            self.crs = f.read() or None
+        self.index = pd.Index(self.attributes[key])
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def rows_of(self, keys):
+        '''
+        Returns the rows of the store of an array of keys (e.g. ED_IDs),
+        raising a KeyError for keys which are not in the store.
+        '''
+        rows = self.index.get_indexer(np.asarray(keys))
+        if (rows < 0).any():
+            missing = np.asarray(keys)[rows < 0]
+            raise KeyError(f'Not in geometry store: {missing[:10].tolist()}')
+        return rows
+
+    def intersects(self, rows, bbox):
+        '''
+        Returns a boolean array which is True for the rows whose bounding
+        box intersects bbox = (xmin, ymin, xmax, ymax).
+        '''
+        xmin, ymin, xmax, ymax = bbox
+        b = self.bounds[rows]
+        return (b[:,0] <= xmax) & (b[:,2] >= xmin) & \
+            (b[:,1] <= ymax) & (b[:,3] >= ymin)
+
+    def query(self, bbox):
+        '''
+        Returns the rows whose bounding box intersects bbox.
+        '''
+        return np.flatnonzero(self.intersects(slice(None), bbox))
+
+    def region_bounds(self, column, value):
+        '''
+        Returns the bounding box (xmin, ymin, xmax, ymax) of the rows where
+        column is value, e.g. region_bounds('COUNTY', 'DUBLIN'), or None if
+        there are no such rows.
+        '''
+        rows = np.flatnonzero(self.attributes[column].to_numpy() == value)
+        if rows.size == 0:
+            return None
+        b = self.bounds[rows]
+        return (b[:,0].min(), b[:,1].min(), b[:,2].max(), b[:,3].max())
+
+    def geometries(self, rows):
+        '''
+        Reads and decodes the geometries of the given rows, returning a
+        GeoSeries.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.offsets[rows], self.offsets[rows+1]
+        wkb = [self.wkb[a:b].tobytes() for a, b in zip(starts, ends)]
+        return gpd.GeoSeries.from_wkb(wkb, crs=self.crs)
+
+    def attach(self, df, bbox=None):
+        '''
+        Returns a GeoDataFrame of the rows of df (a dataframe with the key
+        column but no geometry, e.g. from a Materialiser or run output)
+        with their geometries read from the store. If bbox is given, only
+        rows whose bounding box intersects it are kept and read.
+        '''
+        rows = self.rows_of(df[self.key])
+        if bbox is not None:
+            keep = self.intersects(rows, bbox)
+            df, rows = df[keep], rows[keep]
+        if 'geometry' in df:
+            df = pd.DataFrame(df).drop(columns='geometry')
+        return gpd.GeoDataFrame(df, geometry=self.geometries(rows).values,
+                                crs=self.crs)
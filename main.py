@@ -7,8 +7,6 @@
 
 #%% Imports
 
-import geopandas as gpd
-
 # Import evolutionary algorithm
 from evolutionary_algorithm import evolve
 
@@ -16,27 +14,37 @@ from evolutionary_algorithm import evolve
 from plotting_functions import make_ser_and_vna_table, make_chart, \
     make_plot, make_county_boundary_plot, make_full_plot, make_double_chart
 
-# Import additional functions for data analysis
-from data_analysis import find_full_state, convert_data, remove_islands
+# Import materialiser of state dataframes sharing one set of geometries
+from materialise import Materialiser
+
+# Import dataset declarations
+from datasets import Dataset
+
+# Import queue for rendering plots in the background
+from render_queue import RenderQueue
+
+# Import progress monitor for watching long runs
+from monitoring import ProgressMonitor
+
+# Import steepest-ascent polishing of the final states
+from polish import polish
 
 #%% Files
 
-# Read in data
-d0 = gpd.read_feather('./data/IrishElectoralDivisions.feather')
-# d0 = gpd.read_feather('./data/IrishElectoralDivisionsWithoutDublin.feather')
-# Uncomment to use dataset with Dublin removed
+# All EDs, with the islands kept in place but exempt from contiguity
+dataset = Dataset('./data/IrishElectoralDivisions.feather',
+                  excluded='./data/IslandElectoralDivisions.feather')
+# dataset.fixed_counties = ['DUBLIN']
+# Uncomment to keep Dublin fixed
 
-# Convert data to appropriate types
-d0 = convert_data(d0)
+# Read in data, converted to appropriate types
+d0 = dataset.load()
 
 #%% Initialisation
 
 # Make a copy of the dataframe
 d = d0.copy()
 
-# Remove Islands
-d = remove_islands(d)
-
 # Re-run this cell to re-initialise the data
     
 #%% Parameters
@@ -48,36 +56,60 @@ keep = 4 # Number of child states to retain per generation
 
 #%% Run
 
+# Keep the latest generation summary, served as JSON at http://127.0.0.1:8765
+# (started only once, so that this cell can be re-run)
+if 'monitor' not in globals():
+    monitor = ProgressMonitor()
+    monitor.serve(port=8765)
+
 # Run the evolutionary algorithm to get three best states
-optimal_states, optimal_rewards = evolve(d, flips, kids, keep)
+optimal_states, optimal_rewards = evolve(d, flips, kids, keep, 
+                                         callback=monitor)
 optimal_state = optimal_states[0] # Get overall best state
 
+#%% Polish
+
+# Apply the best improving single-ED moves until none is left
+# (skip this cell to plot the states exactly as evolve returned them)
+optimal_states, optimal_rewards = polish(optimal_states, d)
+optimal_state = optimal_states[0]
+
 #%% Full State
 
-# Run find_full_state to add islands back into dataset (for plotting)
-# Set add_dublin=True if Dublin was not included in the evolution
-original_data_full = find_full_state(d0, add_dublin=False)
-optimal_data_full = find_full_state(optimal_state, add_dublin=False)
+# Every ED is already in the dataset, so nothing is added back; each state
+# is a shallow copy of d0 with its own CON (upper case) and CHANGE columns
+materialiser = Materialiser(d0)
+original_data_full = materialiser.frame()
+optimal_data_full = materialiser.frame(optimal_state)
+
+#%% Render Queue
+
+# Plots and tables are rendered in background processes, so the next
+# configuration can be loaded while they are being drawn
+renders = RenderQueue()
 
 #%% Full Numbered Plot
 
-make_full_plot(original_data_full)
+renders.submit(make_full_plot, original_data_full)
 
 #%% Plots
 
-make_plot(
+renders.submit(
+    make_plot,
     original_data_full, 
     'original_state'
     )
 
-make_plot(
+renders.submit(
+    make_plot,
     optimal_data_full, 
     f'optimal_state_flips={flips}_kids={kids}_keep={keep}'
     )
 
 #%% Plot with Changes Highlighted
 
-make_plot(
+renders.submit(
+    make_plot,
     optimal_data_full, 
     f'optimal_state_flips={flips}_kids={kids}_keep={keep}',
     highlight_changes=True
@@ -86,11 +118,13 @@ make_plot(
 #%% County Boundary Plots
 
 # Same as before, except also overlaid with county boundaries
-make_county_boundary_plot(
+renders.submit(
+    make_county_boundary_plot,
     original_data_full, 
     'original_state'
     )
-make_county_boundary_plot(
+renders.submit(
+    make_county_boundary_plot,
     optimal_data_full, 
     f'optimal_state_flips={flips}_kids={kids}_keep={keep}'
     )
@@ -98,7 +132,8 @@ make_county_boundary_plot(
 #%% SER Chart
 
 # Bar chart comparing SERs of original and optimal state
-make_chart(
+renders.submit(
+    make_chart,
     original_data_full, 
     optimal_data_full, 
     f'flips={flips}_kids={kids}_keep={keep}',
@@ -108,7 +143,8 @@ make_chart(
 #%% VNA Chart
 
 # Bar chart comparing VNAs of original and optimal state
-make_chart(
+renders.submit(
+    make_chart,
     original_data_full,
     optimal_data_full,
     f'flips={flips}_kids={kids}_keep={keep}',
@@ -118,7 +154,8 @@ make_chart(
 
 #%% Double Chart Showing SER and VNA
 
-make_double_chart(
+renders.submit(
+    make_double_chart,
     original_data_full, 
     optimal_data_full,
     save_tex=True
@@ -126,15 +163,23 @@ make_double_chart(
 
 #%% SER and VNA Tables
 
-make_ser_and_vna_table(
+renders.submit(
+    make_ser_and_vna_table,
     original_data_full, 
     'original_state'
     )
-make_ser_and_vna_table(
+renders.submit(
+    make_ser_and_vna_table,
     optimal_data_full, 
     f'optimal_state_SER_flips={flips}_kids={kids}_keep={keep}'
     )
 
+#%% Wait for Renders
+
+# Blocks until all queued plots and tables have been saved
+for path in renders.wait():
+    print(f'Saved {path}')
+
 #%% Save Data
 
 # Probably only bother with this if the optimal state is really good
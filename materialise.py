@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                MATERIALISE
+# =============================================================================
+# Dataframes of states for plotting and export, without copying geometry.
+# One base GeoDataFrame holds the geometry and every column which does not
+# change between states; the dataframe of a state is a shallow copy of it
+# with only CON and CHANGE filled in from the state's assignment, so
+# materialising many candidates costs little more than two columns each.
+
+#%% Imports
+
+import numpy as np
+import pandas as pd
+
+from engine import EngineState
+
+#%% Parameters
+
+# Columns which depend on the state, and are not kept in the base
+state_columns = ('CON', 'CHANGE', 'NB_CONS', 'BOUNDARY')
+
+#%% Materialiser
+
+class Materialiser:
+    '''
+    Materialises the dataframes of states of the EDs of base (a dataframe of
+    EDs, e.g. d0 from Dataset.load, which is read once and never modified).
+    A state may be:
+        a dataframe of EDs (e.g. from evolve), whose rows need not cover
+            every ED of base
+        an EngineState, or an array of CON codes, of StaticData static
+    EDs of base which are not in the state keep their CON from base (as
+    find_full_state adds back Dublin and the islands), and CON names are
+    upper case. NB_CONS and BOUNDARY are only recomputed if asked for (see
+    frame), e.g. for dataframes which are saved to be read back as a start
+    state.
+    '''
+    def __init__(self, base, static=None):
+        self.static = static
+        con = base['CON'].str.upper().to_numpy()
+        self.names = list(dict.fromkeys(con))
+        self.lookup = {c: k for k, c in enumerate(self.names)}
+        self.con0 = np.array([self.lookup[c] for c in con])
+        if 'CHANGE' in base:
+            self.change0 = base['CHANGE'].to_numpy(dtype=np.int64)
+        else:
+            self.change0 = np.zeros(len(base), dtype=np.int64)
+        self.rows = {e: k for k, e in enumerate(base['ED_ID'])}
+        # Original columns, to put the state columns back in their places
+        self.columns = list(base.columns)
+        self.dropped = [c for c in state_columns if c in base]
+        self.base = base.drop(columns=self.dropped).reset_index(drop=True)
+        self.edges = None
+        self.static_rows = None
+        self.static_codes = None
+        if static is not None:
+            self.static_rows = np.array([self.rows[e]
+                                         for e in static.ed_id])
+            self.static_codes = np.array([self.code(c)
+                                          for c in static.con_names])
+
+    def code(self, name):
+        '''
+        Returns the code of the CON name, adding it if it is new.
+        '''
+        name = name.upper()
+        if name not in self.lookup:
+            self.lookup[name] = len(self.names)
+            self.names.append(name)
+        return self.lookup[name]
+
+    def assignment(self, state):
+        '''
+        Returns arrays of the CON code and CHANGE of every ED of base in
+        state.
+        '''
+        con, change = self.con0.copy(), self.change0.copy()
+        if isinstance(state, pd.DataFrame):
+            rows = np.array([self.rows[e] for e in state['ED_ID']])
+            con[rows] = [self.code(c) for c in state['CON']]
+            if 'CHANGE' in state:
+                change[rows] = state['CHANGE'].to_numpy()
+            return con, change
+        if self.static is None:
+            raise ValueError('Materialiser needs the StaticData of states '
+                             'which are not dataframes')
+        if isinstance(state, EngineState):
+            con[self.static_rows] = self.static_codes[state.con]
+            change[self.static_rows] = state.change
+        else:
+            codes = self.static_codes[np.asarray(state)]
+            con[self.static_rows] = codes
+            change[self.static_rows] = codes != \
+                self.static_codes[self.static.con0]
+        return con, change
+
+    def neighbour_columns(self, con):
+        '''
+        Returns NB_CONS (a list of arrays of CON names) and BOUNDARY of every
+        ED of base when the EDs have CON codes con, from the NEIGHBOURS of
+        base.
+        '''
+        if self.edges is None:
+            src, dst = [], []
+            for k, neighbours in enumerate(self.base['NEIGHBOURS']):
+                for e in np.atleast_1d(neighbours):
+                    if e in self.rows:
+                        src.append(k)
+                        dst.append(self.rows[e])
+            self.edges = (np.array(src, dtype=np.int64),
+                          np.array(dst, dtype=np.int64))
+        src, dst = self.edges
+        other = con[dst]
+        differs = other != con[src]
+        pairs = np.unique(np.stack([src[differs], other[differs]], axis=1),
+                          axis=0)
+        splits = np.searchsorted(pairs[:,0], np.arange(1, len(con)))
+        names = np.array(self.names, dtype=str)
+        nb_cons = [names[c] for c in np.split(pairs[:,1], splits)]
+        return nb_cons, np.array([int(c.size > 0) for c in nb_cons])
+
+    def frame(self, state=None, neighbours=False):
+        '''
+        Returns the dataframe of state (by default, of the CONs of base):
+        a shallow copy of the base, sharing its geometry and other columns,
+        with CON and CHANGE added in their original places.
+        If neighbours=True, NB_CONS and BOUNDARY are also recomputed (as in
+        state_frame), so that the dataframe can be saved and read back as a
+        start state.
+        '''
+        if state is None:
+            con, change = self.con0, self.change0
+        else:
+            con, change = self.assignment(state)
+        names = np.array(self.names, dtype=object)
+        view = self.base.copy(deep=False)
+        # Inserting new columns never touches the blocks of the base
+        columns = {'CON': names[con], 'CHANGE': change}
+        if neighbours:
+            columns['NB_CONS'], columns['BOUNDARY'] = \
+                self.neighbour_columns(con)
+        kept = [c for c in self.columns
+                if c not in self.dropped or c in columns]
+        positions = {c: kept.index(c) for c in columns if c in kept}
+        order = sorted(columns, key=lambda c: positions.get(c, np.inf))
+        for column in order:
+            at = positions.get(column, view.shape[1])
+            view.insert(min(at, view.shape[1]), column, columns[column])
+        return view
+
+    def frames(self, states):
+        '''
+        Yields the dataframe of each of a list of states.
+        '''
+        for state in states:
+            yield self.frame(state)
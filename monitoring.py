@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                            PROGRESS MONITORING
+# =============================================================================
+
+#%% Imports
+
+import json
+import threading
+import time
+import numpy as np
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#%% Summarise
+
+def summarise(rewards, con_pops, changed_eds, generation, evaluations=0,
+              global_best_reward=None, national_ratio=29800):
+    '''
+    Returns a dictionary summarising one generation, given the rewards of
+    its survivors, and the populations of the CONs and number of changed EDs
+    of its best state:
+        best and median reward, SER spread (largest distance of any SER from
+        its nearest integer) and number of changed EDs in the best state.
+    '''
+    rewards = [float(r) for r in rewards]
+    sers = np.asarray(con_pops)/national_ratio
+    summary = {
+        'generation': generation,
+        'evaluations': evaluations,
+        'time': time.time(),
+        'best_reward': max(rewards),
+        'median_reward': float(np.median(rewards)),
+        'ser_spread': float(np.abs(sers - np.round(sers)).max()),
+        'changed_eds': int(changed_eds),
+        }
+    if global_best_reward is not None:
+        summary['global_best_reward'] = float(global_best_reward)
+    return summary
+
+#%% Summarise Generation
+
+def summarise_generation(survivors, generation, evaluations=0,
+                         global_best=None, national_ratio=29800):
+    '''
+    Takes in a list of [df, reward] pairs for the survivors of one generation
+    (best first) and returns a dictionary summarising it (see summarise).
+    '''
+    best_state = survivors[0][0]
+    # Population of each constituency in the best state
+    con_pops = best_state.groupby('CON')['POPULATION'].sum()
+    return summarise(
+        [r for _, r in survivors],
+        con_pops.to_numpy(),
+        (best_state['CHANGE']>0).sum(),
+        generation,
+        evaluations,
+        None if global_best is None else global_best[0][1],
+        national_ratio
+        )
+
+#%% Combine Callbacks
+
+def combine(*callbacks):
+    '''
+    Returns a callback for evolve() which calls each of the given callbacks
+    (ignoring any which are None) in turn.
+    '''
+    callbacks = [c for c in callbacks if c is not None]
+    def combined(summary, survivors):
+        for callback in callbacks:
+            callback(summary, survivors)
+    return combined
+
+#%% Progress Monitor
+
+class ProgressMonitor:
+    '''
+    Callback for evolve() which keeps the latest generation summary.
+    If serve() is called, the latest summary is also available as JSON
+    over HTTP so that a dashboard can poll it.
+    '''
+    def __init__(self, keep_history=True, verbose=False):
+        self.lock = threading.Lock()
+        self.latest = None
+        self.history = []
+        self.keep_history = keep_history
+        self.verbose = verbose
+        self.server = None
+
+    def __call__(self, summary, survivors):
+        # Only the small summary dictionary is kept; never the states
+        with self.lock:
+            self.latest = summary
+            if self.keep_history:
+                self.history.append(summary)
+        if self.verbose:
+            print(f"Generation {summary['generation']}: "
+                  f"best reward {summary['best_reward']:.4f}")
+
+    def snapshot(self):
+        '''
+        Returns the latest summary (None before the first generation).
+        '''
+        with self.lock:
+            return self.latest
+
+    def serve(self, host='127.0.0.1', port=8765):
+        '''
+        Serves the latest summary at / and the full history at /history
+        from a background thread. Returns the (host, port) being served.
+        '''
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with monitor.lock:
+                    if self.path.rstrip('/') == '/history':
+                        body = json.dumps(monitor.history)
+                    elif self.path in ('/', ''):
+                        body = json.dumps(monitor.latest)
+                    else:
+                        self.send_error(404)
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                # Don't print a line for every poll
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        return self.server.server_address
+
+    def stop(self):
+        '''
+        Stops the HTTP server, if running.
+        '''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                           MULTILEVEL OPTIMISATION
+# =============================================================================
+# Coarse-to-fine optimisation with census Small Areas (SAs), which nest
+# within EDs. The array engine is run on the EDs first; then the EDs along
+# the CON boundaries of the best state are split into their SAs, and the
+# engine is run again on a hybrid dataset of those SAs and the remaining
+# whole EDs. Whole EDs are fixed, so the fine level only moves the thin band
+# of SAs around the boundaries, and its adjacency and populations are
+# aggregated from the SAs (or the EDs) below.
+
+#%% Imports
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from engine import boundary_mask, initial_state, state_from_frame, \
+    state_frame, evolve_states
+from static_data import build_static_data
+
+#%% Refinement Band
+
+def refinement_band(static, state, width=1):
+    '''
+    Returns a boolean array which is True for movable EDs within width
+    steps of a CON boundary in EngineState state (the boundary EDs
+    themselves, if width=1).
+    '''
+    band = boundary_mask(static, state.con)
+    for _ in range(width - 1):
+        grown = band.copy()
+        grown[static.edge_src[band[static.indices]]] = True
+        band = grown
+    return band & static.movable
+
+#%% Hybrid Frame
+
+def hybrid_frame(d, static, refined, sa):
+    '''
+    Returns a dataframe of units for the fine level: the SAs of the refined
+    EDs (a boolean array over the rows of static), and every other ED of d
+    (the dataframe of static) whole.
+    sa is a (Geo)DataFrame of SAs with columns SA_ID, ED_ID (of the ED
+    containing each SA), POPULATION and geometry. If it has NEIGHBOURS
+    (arrays of SA_IDs), the adjacency of the units is aggregated from it;
+    otherwise only the geometries of the SAs of refined EDs are compared,
+    with each other and with the whole EDs next to them. Units are only
+    adjacent if their EDs are the same or adjacent.
+    Whole EDs keep their ED_ID; SAs are given new ED_IDs above those of the
+    EDs, and every unit has the ED_ID of its ED in PARENT. CON is the
+    baseline CON of each unit's ED, and whole EDs are FIXED.
+    Refined EDs without any SAs in sa are kept whole.
+    '''
+    n_eds = static.n_eds
+    refined = refined & np.isin(static.ed_id, sa['ED_ID'].to_numpy())
+    whole = np.flatnonzero(~refined)
+    row = pd.Index(static.ed_id)
+    sas = sa[sa['ED_ID'].isin(static.ed_id[refined])].reset_index(drop=True)
+    n_whole, n = len(whole), len(whole) + len(sas)
+    parent = np.concatenate([whole, row.get_indexer(sas['ED_ID'])])
+    unit_of_ed = np.full(n_eds, -1, dtype=np.int64)
+    unit_of_ed[whole] = np.arange(n_whole)
+
+    # Adjacency between whole EDs, as between the EDs
+    src = unit_of_ed[static.edge_src]
+    dst = unit_of_ed[static.indices]
+    both = (src >= 0) & (dst >= 0)
+    pairs = [np.stack([src[both], dst[both]], axis=1)]
+
+    if 'NEIGHBOURS' in sa:
+        # Aggregate the SA adjacency: each SA is its own unit if its ED is
+        # refined, and otherwise part of its ED
+        sa_ed = dict(zip(sa['SA_ID'], sa['ED_ID']))
+        sa_unit = {s: n_whole + k for k, s in enumerate(sas['SA_ID'])}
+        for k, neighbours in enumerate(sas['NEIGHBOURS']):
+            for s in np.atleast_1d(neighbours):
+                if s in sa_unit:
+                    pairs.append([[n_whole + k, sa_unit[s]]])
+                elif s in sa_ed and sa_ed[s] in row:
+                    u = unit_of_ed[row.get_loc(sa_ed[s])]
+                    if u >= 0:
+                        pairs.append([[n_whole + k, u]])
+    else:
+        # Compare the geometries of the SAs with each other, and with the
+        # whole EDs next to the refined EDs
+        adjacent = static.edge_src.astype(np.int64)*n_eds + static.indices
+        a, b = sas.sindex.query(sas.geometry, predicate='intersects')
+        sa_pairs = np.stack([n_whole + a, n_whole + b], axis=1)
+        near = np.unique(static.indices[refined[static.edge_src]])
+        near = near[~refined[near]]
+        geoms = gpd.GeoSeries(d.geometry.values[near], crs=d.crs)
+        a, b = geoms.sindex.query(sas.geometry, predicate='intersects')
+        ed_pairs = np.stack([n_whole + a, unit_of_ed[near[b]]], axis=1)
+        for p in (sa_pairs, ed_pairs):
+            u, v = parent[p[:,0]], parent[p[:,1]]
+            pairs.append(p[(u == v) | np.isin(u*n_eds + v, adjacent)])
+
+    pairs = np.concatenate([np.asarray(p, dtype=np.int64).reshape(-1, 2)
+                            for p in pairs])
+    pairs = np.unique(np.concatenate([pairs, pairs[:,::-1]]), axis=0)
+    pairs = pairs[pairs[:,0] != pairs[:,1]]
+
+    unit_id = np.concatenate([static.ed_id[whole],
+                              static.ed_id.max() + 1 + np.arange(len(sas))])
+    splits = np.searchsorted(pairs[:,0], np.arange(1, n))
+    hybrid = pd.DataFrame({
+        'ED_ID': unit_id,
+        'SA_ID': [None]*n_whole + list(sas['SA_ID']),
+        'PARENT': static.ed_id[parent],
+        'COUNTY': np.array(static.county_names)[static.county[parent]],
+        'CON': np.array(static.con_names)[static.con0[parent]],
+        'POPULATION': np.concatenate([static.population[whole],
+                                      sas['POPULATION'].to_numpy()]),
+        'NEIGHBOURS': np.split(unit_id[pairs[:,1]], splits),
+        'CHANGE': 0,
+        'FIXED': np.concatenate([np.ones(n_whole, dtype=bool),
+                                 ~static.movable[parent[n_whole:]]]),
+        'EXEMPT': np.concatenate([static.exempt[whole],
+                                  np.zeros(len(sas), dtype=bool)]),
+        })
+    if 'geometry' in d and 'geometry' in sa:
+        geometry = np.concatenate([d.geometry.values[whole],
+                                   sas.geometry.values])
+        hybrid = gpd.GeoDataFrame(hybrid, geometry=geometry, crs=d.crs)
+    return hybrid
+
+#%% Fine State
+
+def fine_state(fine, static, state, hybrid):
+    '''
+    Returns the EngineState of StaticData fine (built from hybrid) in which
+    every unit is in the CON of its ED in EngineState state of static, with
+    no flips recorded.
+    '''
+    parent = pd.Index(static.ed_id).get_indexer(hybrid['PARENT'])
+    cons = np.array(static.con_names)[state.con[parent]]
+    return initial_state(fine, fine.con_codes(cons))
+
+#%% Refine
+
+def refine(d, static, state, sa, flips=10, kids=25, keep=3, width=1,
+           callback=None, reward_params=None, rng=None):
+    '''
+    Runs evolve_states at the fine level, starting from EngineState state of
+    static (the StaticData of d), with the EDs within width steps of a CON
+    boundary split into their SAs.
+    Returns the hybrid dataframe, its StaticData, and the three best fine
+    EngineStates and corresponding rewards. The continuity term still counts
+    units which are not in their baseline CON.
+    '''
+    hybrid = hybrid_frame(d, static, refinement_band(static, state, width),
+                          sa)
+    fine = build_static_data(hybrid)
+    states, rewards = evolve_states(fine, fine_state(fine, static, state,
+                                                     hybrid),
+                                    flips, kids, keep, callback,
+                                    reward_params, rng)
+    return hybrid, fine, states, rewards
+
+#%% Multilevel
+
+def multilevel(d, sa, flips=10, kids=25, keep=3, width=1, fine_params=None,
+               callback=None, reward_params=None, rng=None):
+    '''
+    Coarse-to-fine version of evolve_frame: evolves the EDs of the dataframe
+    d, then refines the best state with the SAs of sa (see hybrid_frame)
+    around its CON boundaries.
+    fine_params may give different flips, kids and keep for the fine level.
+    callback is called for the generations of both levels (the generations
+    of the fine level are numbered from 0 again).
+    Returns the three best states, as dataframes of the units of the fine
+    level (with CHANGE marking units not in their baseline CON), and the
+    corresponding rewards.
+    '''
+    rng = np.random.default_rng(rng)
+    static = build_static_data(d)
+    states, _ = evolve_states(static, state_from_frame(static, d), flips,
+                              kids, keep, callback, reward_params, rng)
+    fine_params = {'flips': flips, 'kids': kids, 'keep': keep,
+                   **(fine_params or {})}
+    hybrid, fine, states, rewards = refine(
+        d, static, states[0], sa, fine_params['flips'], fine_params['kids'],
+        fine_params['keep'], width, callback, reward_params, rng)
+    frames = []
+    for s in states:
+        df = state_frame(fine, s, hybrid)
+        df['CHANGE'] = (s.con != fine.con0).astype(int)
+        frames.append(df)
+    return frames, rewards
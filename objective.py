@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                          SEAT APPORTIONMENT OBJECTIVE
+# =============================================================================
+# Keeps the seats of each CON (its SER rounded to the nearest integer) and the
+# total number of seats up to date as EDs are moved, so that moves which break
+# the constitutional limits can be rejected before a state is ever scored.
+
+#%% Imports
+
+import numpy as np
+
+from engine import move
+
+#%% National Ratio
+
+def derive_national_ratio(national_population, seat_total=174):
+    '''
+    Returns the national ratio (population per seat) for seat_total seats.
+    national_population must be the population of the whole country, not
+    only of the EDs being optimised (e.g. with the islands or Dublin
+    removed).
+    '''
+    return national_population/seat_total
+
+#%% Seat Objective
+
+class SeatObjective:
+    '''
+    Seat apportionment for a fixed total number of seats.
+    The national ratio is derived from national_population (by default, the
+    population of static) and seat_total, rather than fixed. Moves are
+    allowed only if they keep the total number of seats within total_bounds
+    and the seats of each CON within con_bounds (or, where a limit is
+    already broken, do not break it further).
+    total_bounds are for the whole country: if static has only part of the
+    national population, they are scaled down by its share of it. Set either
+    bounds to None to disable it.
+    '''
+    def __init__(self, static, seat_total=174, total_bounds=(171, 181),
+                 con_bounds=(3, 5), national_population=None):
+        population = static.population.sum()
+        if national_population is None:
+            national_population = population
+        self.seat_total = seat_total
+        self.national_ratio = derive_national_ratio(national_population,
+                                                    seat_total)
+        if total_bounds is not None and population < national_population:
+            share = population/national_population
+            total_bounds = (total_bounds[0]*share, total_bounds[1]*share)
+        self.total_bounds = total_bounds
+        self.con_bounds = con_bounds
+        self.rejected = 0
+
+    def seats(self, pop):
+        '''
+        Returns the seats of CON(s) with population pop.
+        '''
+        return np.round(np.asarray(pop)/self.national_ratio).astype(int)
+
+    def start(self, state):
+        '''
+        Records the seats of each CON and the seat total on state.
+        EDs must then be moved with apply, to keep these up to date.
+        '''
+        state.seats = self.seats(state.con_pop)
+        state.seat_total = int(state.seats.sum())
+        return state
+
+    def move_allowed(self, static, state, i, new_con):
+        '''
+        Returns True if moving ED i to CON new_con respects the seat limits.
+        Only the two CONs involved are looked at.
+        '''
+        old_con = state.con[i]
+        pop = static.population[i]
+        old_seats = state.seats[[old_con, new_con]]
+        new_seats = self.seats([state.con_pop[old_con] - pop,
+                                state.con_pop[new_con] + pop])
+        if self.con_bounds is not None:
+            lo, hi = self.con_bounds
+            for before, after in zip(old_seats, new_seats):
+                if distance(after, lo, hi) > distance(before, lo, hi):
+                    return False
+        if self.total_bounds is not None:
+            lo, hi = self.total_bounds
+            total = state.seat_total + new_seats.sum() - old_seats.sum()
+            if distance(total, lo, hi) > distance(state.seat_total, lo, hi):
+                return False
+        return True
+
+    def apply(self, static, state, i, new_con):
+        '''
+        Moves ED i to CON new_con in place, updating the seats of the two
+        CONs involved and the seat total.
+        '''
+        old_con = state.con[i]
+        move(static, state, i, new_con)
+        return self.refresh(state, (old_con, new_con))
+
+    def refresh(self, state, cons):
+        '''
+        Recomputes the seats of the given CONs and the seat total of state,
+        after their populations have changed.
+        '''
+        for c in cons:
+            seats = int(self.seats(state.con_pop[c]))
+            state.seat_total += seats - state.seats[c]
+            state.seats[c] = seats
+        return state
+
+    def feasible(self, state):
+        '''
+        Returns True if every limit is satisfied by state.
+        '''
+        present = state.con_pop > 0
+        if self.con_bounds is not None:
+            lo, hi = self.con_bounds
+            seats = state.seats[present]
+            if (seats < lo).any() or (seats > hi).any():
+                return False
+        if self.total_bounds is not None:
+            lo, hi = self.total_bounds
+            if not lo <= state.seat_total <= hi:
+                return False
+        return True
+
+#%% Distance
+
+def distance(x, lo, hi):
+    '''
+    Returns how far x lies outside the interval [lo, hi] (0 if inside).
+    '''
+    return max(lo - x, 0, x - hi)
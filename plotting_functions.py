@@ -7,6 +7,7 @@
 
 #%% Imports
 
+import functools
 import numpy as np
 import pandas as pd
 import geopandas as gpd
@@ -15,17 +16,81 @@ import matplotlib.pyplot as plt
 import datetime
 import tikzplotlib # To save plots as TikZ pictures
 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
 
 from data_analysis import ser_global, vna_global
+from geometry_cache import GeometryCache, assignment_key
+from geometry_store import GeometryStore
 
 #%% Files
+# Read when first needed, so that importing this module reads nothing
 
-counties = gpd.read_feather('./data/IrishCountiesSimplified.feather')
-bg = gpd.read_feather('./data/IrelandCoastline.feather') # Outline of Ireland
-dublin_outline = counties[counties.index=='DUBLIN']
-con_outlines = gpd.read_feather('./data/IrishConstituencies.feather')
+plot_layer_paths = {
+    'counties': './data/IrishCountiesSimplified.feather',
+    'coastline': './data/IrelandCoastline.feather', # Outline of Ireland
+    }
+
+@functools.lru_cache(maxsize=None)
+def plot_layer(name):
+    '''
+    Returns the GeoDataFrame of one of the files in plot_layer_paths, or of
+    the outline of Dublin ('dublin_outline').
+    '''
+    if name == 'dublin_outline':
+        counties = plot_layer('counties')
+        return counties[counties.index=='DUBLIN']
+    return gpd.read_feather(plot_layer_paths[name])
+
+#%% Geometry Store
+# If set, dataframes without geometry (e.g. of states from run output) can
+# be plotted, with only the geometries drawn read from the store
+
+geometry_store = None
+
+def use_geometry_store(directory, key='ED_ID'):
+    '''
+    Sets the geometry store (see geometry_store.py) to read ED geometries
+    from, or unsets it if directory is None.
+    '''
+    global geometry_store
+    geometry_store = None if directory is None else \
+        GeometryStore(directory, key)
+
+def with_geometry(df, bbox=None):
+    '''
+    Returns df with the geometry of each ED: df itself if it has a geometry
+    column, or otherwise a GeoDataFrame with geometries read from the
+    geometry store. If bbox = (xmin, ymin, xmax, ymax) is given, only EDs
+    whose bounding box intersects it are kept (and read).
+    '''
+    if 'geometry' in df:
+        if bbox is None:
+            return df
+        xmin, ymin, xmax, ymax = bbox
+        return df.cx[xmin:xmax, ymin:ymax]
+    if geometry_store is None:
+        raise ValueError('Dataframe has no geometry, and no geometry store '
+                         'is set (see use_geometry_store)')
+    return geometry_store.attach(df, bbox)
+
+#%% Geometry Cache
+# Dissolved CON polygons and label points of recently plotted states
+
+geometry_cache = GeometryCache()
+
+def state_outlines(df, tolerance=15):
+    '''
+    Returns the dissolved CON polygons of the state df from the geometry
+    cache (see GeometryCache.outlines). If df has no geometry, the
+    geometries of its EDs are only read if the state is not yet cached.
+    '''
+    if 'geometry' not in df and \
+        assignment_key(df) not in geometry_cache.entries:
+        df = with_geometry(df)
+    return geometry_cache.outlines(df, tolerance)
 
 #%% Palette
 # Colour palette for plots
@@ -132,6 +197,14 @@ def tikzplotlib_fix_ncols(obj):
     for child in obj.get_children():
         tikzplotlib_fix_ncols(child)
 
+#%% Timestamp
+
+def timestamp():
+    '''
+    Returns the current time, as used in names of saved files.
+    '''
+    return datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
+
 #%% SER Table
 
 def make_ser_and_vna_table(df, name='table', dpi=300, save_tex=False, 
@@ -141,45 +214,75 @@ def make_ser_and_vna_table(df, name='table', dpi=300, save_tex=False,
     If use_current_seats=True, then use currently assigned seat numbers
     to compute VNA.
     If seats=True, add a column showing seats assigned to each CON.
+    Returns a list of the paths of any files saved.
     '''
     ser_dictionary = ser_global(df)
     vna_dictionary = vna_global(df, use_current_seats)
     
-    fig, ax = plt.subplots()
-    
-    # Hide axes
-    fig.patch.set_visible(False)
-    ax.axis('off')
-    ax.axis('tight')
+    seats_dictionary = None
+    if seats:
+        if use_current_seats:
+            # Get current seat numbers from dataframe
+            seats_dictionary = dict(df.groupby('CON').first()['SEATS'])
+        else:
+            # Compute seat number by rounding SER
+            seats_dictionary = {c: int(np.round(round(s, 3))) 
+                                for c, s in ser_dictionary.items()}
     
+    table_data = format_table_data(ser_dictionary, vna_dictionary, 
+                                   seats_dictionary)
+    return render_table(table_data, name, dpi, save_tex)
+
+#%% Format Table Data
+
+def format_table_data(ser_dictionary, vna_dictionary, seats_dictionary=None):
+    '''
+    Returns a dataframe of formatted SER and VNA values of each CON, with a
+    column of seats if seats_dictionary is given.
+    '''
     # Get SER data
     table_data = pd.DataFrame.from_dict([ser_dictionary]).T
     table_data = table_data.reset_index()
     table_data.columns = ['Constituency','SER']
     table_data['VNA'] = table_data['Constituency'].map(vna_dictionary)
+    if seats_dictionary is not None:
+        table_data['Seats'] = table_data['Constituency'].map(
+            seats_dictionary).astype(int)
+        table_data = table_data[['Constituency', 'Seats', 'SER', 'VNA']]
     table_data['Constituency'] = table_data['Constituency'].str.title()
     table_data = table_data.round(3)
     table_data['SER'] = table_data['SER'].apply('{:0<5}'.format)
     table_data['VNA'] = table_data['VNA'].apply('{:0<5}'.format)
+    return table_data
+
+#%% Render Table
+
+def render_table(table_data, name='table', dpi=300, save_tex=False, 
+                 time=None):
+    '''
+    Saves a table from format_table_data as a PNG (and TeX if save_tex=True).
+    If time is not given, then the current time is used in the file names.
+    Returns a list of the paths of any files saved.
+    '''
+    if time is None:
+        time = timestamp()
     
-    if seats:
-        if use_current_seats:
-            # Get current seat numbers from dataframe
-            table_data['Seats'] = list(df.groupby('CON').first()['SEATS'])
-        else:
-            # Compute seat number by rounding SER
-            table_data['Seats'] = np.round(table_data['SER']
-                                           .apply(float)).apply(int)
-        table_data = table_data[['Constituency', 'Seats', 'SER', 'VNA']]
+    fig, ax = plt.subplots()
+    
+    # Hide axes
+    fig.patch.set_visible(False)
+    ax.axis('off')
+    ax.axis('tight')
+    
+    if 'Seats' in table_data.columns:
         col_widths =[0.4,0.2,0.2,0.2]
     else:
         col_widths =[0.4,0.2,0.2]
     
     if save_tex:
-        # Get current time
-        time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
         # Save data to TeX
-        table_data.to_latex(f'./tex/{name}_{time}.tex', index=False)
+        tex_path = f'./tex/{name}_{time}.tex'
+        table_data.to_latex(tex_path, index=False)
     
     t = ax.table(
         cellText=table_data.values, 
@@ -191,15 +294,15 @@ def make_ser_and_vna_table(df, name='table', dpi=300, save_tex=False,
     t.scale(1, 2)
     t.set_fontsize(15)
     
-    # Get current time
-    time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
-    
+    path = f'./images/{name}_{time}.png'
     fig.savefig(
-        f'./images/{name}_{time}.png', 
+        path, 
         dpi=dpi, 
         bbox_inches='tight'
         )
     
+    return [tex_path, path] if save_tex else [path]
+    
 #%% SER Chart
 
 def format_chart_data(df1, df2, metric='SER', 
@@ -217,6 +320,15 @@ def format_chart_data(df1, df2, metric='SER',
         dictionary_1 = vna_global(df1, use_current_seats_for_current)
         dictionary_2 = vna_global(df2)
     
+    return format_chart_dictionaries(dictionary_1, dictionary_2)
+
+#%% Format Chart Dictionaries
+
+def format_chart_dictionaries(dictionary_1, dictionary_2):
+    '''
+    Returns a dataframe indexed by constituency, with columns corresponding
+    to two dictionaries of CON:value pairs (original and optimal).
+    '''
     # Create dataframes from dictionaries
     data_1 = pd.DataFrame.from_dict([dictionary_1])
     data_2 = pd.DataFrame.from_dict([dictionary_2])
@@ -246,9 +358,23 @@ def make_chart(df1, df2, name='chart', dpi=300, x=15, y=11, filetype='png',
     '''
     Creates a bar chart comparing the SER/VNA of each CON for two states.
     Saves a PNG by default, otherwise PDF.
+    Returns a list of the paths of any files saved.
     '''
     # Get formatted chart data
     data = format_chart_data(df1, df2, metric, use_current_seats_for_current)
+    return render_chart(data, name, dpi, x, y, filetype, save_tex, metric)
+
+#%% Render Chart
+
+def render_chart(data, name='chart', dpi=300, x=15, y=11, filetype='png',
+                 save_tex=False, metric='SER', time=None):
+    '''
+    Saves a bar chart of data from format_chart_data.
+    If time is not given, then the current time is used in the file names.
+    Returns a list of the paths of any files saved.
+    '''
+    if time is None:
+        time = timestamp()
 
     fig, ax = plt.subplots(1, 1, figsize=(x,y))
     
@@ -306,28 +432,29 @@ def make_chart(df1, df2, name='chart', dpi=300, x=15, y=11, filetype='png',
     if save_tex:
         fig = plt.gcf()
         tikzplotlib_fix_ncols(fig) # Fix naming issue in tikzplotlib
-        # Get current time
-        time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
-        tikzplotlib.save(f'./tex/{name}_{metric}_{time}.tex')
-    
-    # Get current time
-    time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
+        tex_path = f'./tex/{name}_{metric}_{time}.tex'
+        tikzplotlib.save(tex_path)
     
     if filetype.upper().strip() == 'PNG':
+        path = f'./images/{metric}_{name}_{time}.png'
         fig.savefig(
-            f'./images/{metric}_{name}_{time}.png', 
+            path, 
             dpi=dpi, 
             bbox_inches='tight'
             )
     elif filetype.upper().strip() == 'PDF':
+        path = f'./images/{metric}_{name}_{time}.pdf'
         fig.savefig(
-            f'./images/{metric}_{name}_{time}.pdf', 
+            path, 
             bbox_inches='tight',
             transparent=True, 
             pad_inches=0
             )
     else:
-        fig.savefig(f'./images/{name}_{time}.{filetype.strip()}')
+        path = f'./images/{name}_{time}.{filetype.strip()}'
+        fig.savefig(path)
+    
+    return [tex_path, path] if save_tex else [path]
         
 #%% SER Chart
 
@@ -337,6 +464,7 @@ def make_double_chart(df1, df2, name='double_chart', dpi=300, x=15, y=20,
     '''
     Creates a bar chart comparing the SER/VNA of each CON for two states.
     Saves a PNG by default, otherwise PDF.
+    Returns a list of the paths of any files saved.
     '''
     # Get formatted chart data
     ser_data = format_chart_data(
@@ -423,37 +551,48 @@ def make_double_chart(df1, df2, name='double_chart', dpi=300, x=15, y=20,
         tikzplotlib.clean_figure()
         # Get current time
         time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
-        tikzplotlib.save(f'./tex/comp_chart_{time}.tex')
+        tex_path = f'./tex/comp_chart_{time}.tex'
+        tikzplotlib.save(tex_path)
     
     # Get current time
     time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
     
     if filetype.upper().strip() == 'PNG':
+        path = f'./images/{name}_{time}.png'
         fig.savefig(
-            f'./images/{name}_{time}.png', 
+            path, 
             dpi=dpi, 
             bbox_inches='tight'
             )
     elif filetype.upper().strip == 'PDF':
+        path = f'./images/{name}_{time}.pdf'
         fig.savefig(
-            f'./images/{name}_{time}.pdf', 
+            path, 
             bbox_inches='tight',
             transparent=True, 
             pad_inches=0
             )
     else:
-        fig.savefig(f'./images/{name}_{time}.{filetype.strip()}')
+        path = f'./images/{name}_{time}.{filetype.strip()}'
+        fig.savefig(path)
+    
+    return [tex_path, path] if save_tex else [path]
         
 #%% Plot
             
 def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
               filetype='png', numbered=False, save=True, ax=None,
-              outline_dublin=False, highlight_changes=False, use_cons=False):
+              outline_dublin=False, highlight_changes=False, use_cons=False,
+              bbox=None):
     '''
     Creates a plot of EDs coloured according to CON.
     If save=True, then saves a PNG/PDF depending on filetype.
     If save=False, ax can be passed for plotting.
     If highlight_changes=True, then changed EDs are highlighted.
+    If use_cons=True, then dissolved CONs are plotted instead of EDs.
+    If bbox = (xmin, ymin, xmax, ymax) is given, then the plot is zoomed to
+    it, and only EDs inside it are drawn.
+    Returns a list of the paths of any files saved.
     '''
     if ax == None:
         # If not plotting on an existing axis, then create a new figure
@@ -464,18 +603,23 @@ def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
         fontsize = 3
         markerscale = 2
     
-    df = df_orig.copy()
+    df = df_orig.copy(deep=False) # Only CON is replaced, not geometry
     
     df['CON'] = df['CON'].str.title()
     
+    if not highlight_changes or numbered:
+        # Only the changed EDs are needed when highlighting changes
+        df = with_geometry(df, bbox)
+    
     if highlight_changes:
-        con_outlines.plot(
+        # Outlines of the CONs of this state, from the geometry cache
+        state_outlines(df, tolerance=15).plot(
             facecolor='grey',
             edgecolor='darkgrey',
             ax=ax
             )
         
-        changed = df[df['CHANGE']>0]
+        changed = with_geometry(df[df['CHANGE']>0], bbox)
         changed['CON'] = changed['CON'].str.upper()
         changed['COLOR'] = changed['CON'].map(color_dict)
         changed.plot(color=changed['COLOR'], ax=ax)
@@ -483,9 +627,9 @@ def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
         legend=False
         
     elif use_cons:
-        con_outlines['CON'] = con_outlines['CON'].str.title()
-        con_outlines['geometry'] = con_outlines['geometry'].simplify(15)
-        con_outlines.plot(
+        # Plot dissolved CONs of this state from the geometry cache
+        outlines = state_outlines(df, tolerance=15)
+        outlines.plot(
             column='CON', 
             cmap=ListedColormap(palette), 
             ax=ax, 
@@ -509,15 +653,14 @@ def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
     if numbered:
         cons = np.unique(df[df['COUNTY']!='DUBLIN']['CON'])
         nums = numbered_con_dict(df)
+        # Centroid of each constituency, from the geometry cache
+        points = geometry_cache.label_points(df)
     
         for c in cons:
-            # Get centroid of each constituency
-            pt_xy = gpd.GeoSeries(df[df['CON']==c].unary_union.centroid)
-            pt = (pt_xy.x, pt_xy.y)
             # Annotate with number at centroid
             ax.annotate(
                 text=nums[c], 
-                xy=pt, 
+                xy=points[c], 
                 ha='center', 
                 fontsize=fontsize,
                 bbox={'boxstyle':'circle','color':'white'}
@@ -529,13 +672,17 @@ def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
             ax.legend(proxies, cons, numpoints=1, markerscale=markerscale)
             
     if outline_dublin:
-        dublin_outline.plot(
+        plot_layer('dublin_outline').plot(
             ax=ax, 
             facecolor='none', 
             edgecolor='grey',
             linewidth=0.5
             )
         
+    if bbox is not None:
+        ax.set_xlim(bbox[0], bbox[2])
+        ax.set_ylim(bbox[1], bbox[3])
+        
     if legend:
         leg = ax.get_legend()
         leg.set_bbox_to_anchor((0.85, 0.5, 0.5, 0.5))
@@ -545,22 +692,26 @@ def make_plot(df_orig, name='plot', dpi=500, legend=True, x=11, y=11,
         time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
         
         if filetype.upper().strip() == 'PNG':
+            path = f'./images/{name}_{time}.png'
             fig.savefig(
-                f'./images/{name}_{time}.png', 
+                path, 
                 dpi=dpi, 
                 bbox_inches='tight',
                 transparent=True
                 )
         elif filetype.upper().strip() == 'PDF':
+            path = f'./images/{name}_{time}.pdf'
             fig.savefig(
-                f'./images/{name}_{time}.pdf', 
+                path, 
                 bbox_inches='tight',
                 transparent=True, 
                 pad_inches=0
                 )
         else:
-            fig.savefig(f'./images/{name}_{time}.{filetype.strip()}')
-    
+            path = f'./images/{name}_{time}.{filetype.strip()}'
+            fig.savefig(path)
+        return [path]
+    return []
         
 #%% Dublin Plot
 
@@ -570,6 +721,9 @@ def make_dublin_plot(df_orig, name='dublin_plot', dpi=500, legend=True,
     '''
     Creates a plot of EDs coloured according to CON.
     Saves a PNG by default, otherwise PDF.
+    Only the geometries of Dublin EDs are needed, unless use_cons=True or
+    numbered=True (which use the CONs of the whole state).
+    Returns a list of the paths of any files saved.
     '''
     if ax == None:
         # If not plotting on an existing axis, then create a new figure
@@ -580,15 +734,17 @@ def make_dublin_plot(df_orig, name='dublin_plot', dpi=500, legend=True,
         fontsize = 3
         markerscale = 2
     
-    df = df_orig.copy()
+    df = df_orig.copy(deep=False) # Only CON is replaced, not geometry
     df['CON'] = df['CON'].str.title()
     
-    dub = df[df['COUNTY']=='DUBLIN']
+    if use_cons or numbered:
+        df = with_geometry(df)
+    dub = with_geometry(df[df['COUNTY']=='DUBLIN'])
     
     if use_cons:
-        dub_cons = con_outlines[con_outlines['COUNTY']=='DUBLIN'].copy()
-        dub_cons['CON'] = dub_cons['CON'].str.title()
-        dub_cons['geometry'] = dub_cons['geometry'].simplify(15)
+        # Plot dissolved CONs (mostly in Dublin) from the geometry cache
+        outlines = state_outlines(df, tolerance=15)
+        dub_cons = outlines[outlines['COUNTY']=='DUBLIN']
         dub_cons.plot(
             column='CON', 
             cmap=ListedColormap(palette_dublin), 
@@ -605,6 +761,18 @@ def make_dublin_plot(df_orig, name='dublin_plot', dpi=500, legend=True,
             categorical=True, 
             legend=legend
             )
+    
+    # Zoom to Dublin (from the bounding boxes alone, with a geometry store),
+    # unless there are no Dublin EDs
+    bounds = None
+    if geometry_store is not None:
+        bounds = geometry_store.region_bounds('COUNTY', 'DUBLIN')
+    if bounds is None and len(dub) > 0:
+        bounds = dub.total_bounds
+    if bounds is not None:
+        xmin, ymin, xmax, ymax = bounds
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
         
     # Remove axes
     ax.set_axis_off()
@@ -612,15 +780,14 @@ def make_dublin_plot(df_orig, name='dublin_plot', dpi=500, legend=True,
     if numbered:
         cons = np.unique(dub['CON'])
         nums = numbered_con_dict(df)
+        # Centroid of each constituency, from the geometry cache
+        points = geometry_cache.label_points(df)
     
         for c in cons:
-            # Get centroid of each constituency
-            pt_xy = gpd.GeoSeries(df[df['CON']==c].unary_union.centroid)
-            pt = (pt_xy.x, pt_xy.y)
             # Annotate with number at centroid
             ax.annotate(
                 text=nums[c], 
-                xy=pt, 
+                xy=points[c], 
                 ha='center', 
                 fontsize=fontsize,
                 bbox={'boxstyle':'circle','color':'white'}
@@ -640,21 +807,26 @@ def make_dublin_plot(df_orig, name='dublin_plot', dpi=500, legend=True,
         time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
         
         if filetype.upper().strip() == 'PNG':
+            path = f'./images/{name}_{time}.png'
             fig.savefig(
-                f'./images/{name}_{time}.png', 
+                path, 
                 dpi=dpi, 
                 bbox_inches='tight',
                 transparent=True
                 )
         elif filetype.upper().strip() == 'PDF':
+            path = f'./images/{name}_{time}.pdf'
             fig.savefig(
-                f'./images/{name}_{time}.pdf', 
+                path, 
                 bbox_inches='tight',
                 transparent=True, 
                 pad_inches=0
                 )
         else:
-            fig.savefig(f'./images/{name}_{time}.{filetype.strip()}')
+            path = f'./images/{name}_{time}.{filetype.strip()}'
+            fig.savefig(path)
+        return [path]
+    return []
             
 #%%
 def make_legend(df_orig, ax):
@@ -666,7 +838,7 @@ def make_legend(df_orig, ax):
     # Remove axes
     ax.set_axis_off()
     
-    df = df_orig.copy()
+    df = df_orig.copy(deep=False) # Only CON is replaced, not geometry
     df['CON'] = df['CON'].str.title()
     # Constituencies
     cons = np.unique(df['CON'])
@@ -697,8 +869,9 @@ def make_full_plot(df, save=True, use_cons=True):
     '''
     Make a numbered plot showing all Irish constituencies,
     including a zoomed view of Dublin.
-    Use use_cons=True if plotting current configuration, as this eliminates
-    ED edge lines from antialiasing.
+    Use use_cons=True to plot dissolved CONs from the geometry cache, as this
+    eliminates ED edge lines from antialiasing.
+    Returns a list of the paths of any files saved.
     '''
     # A = Full country plot
     # B = Zoomed view of Dublin
@@ -742,37 +915,41 @@ def make_full_plot(df, save=True, use_cons=True):
         # Get current time
         time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
         
-        fig.savefig(f'./images/full_plot_{time}.png', 
+        path = f'./images/full_plot_{time}.png'
+        fig.savefig(path, 
                     dpi=500,
                     bbox_inches='tight',
                     transparent=True, 
                     pad_inches=0.1
                     )
+        return [path]
+    return []
         
 #%% County Boundary Plot
 
 def make_county_boundary_plot(df_orig, name='plot', dpi=500, x=11, y=11, 
                               filetype='png'):
     '''
-    Creates a plot of EDs coloured according to CON, overlaid with county
-    boundaries.
+    Creates a plot of CONs (dissolved from the EDs, via the geometry cache),
+    overlaid with county boundaries.
     Saves a PNG by default, otherwise PDF.
+    Returns a list of the paths of any files saved.
     '''
     fig, ax = plt.subplots(1,1,figsize=(x,y))
     
-    df = df_orig.copy()
+    df = df_orig.copy(deep=False) # Only CON is replaced, not geometry
     df['CON'] = df['CON'].str.title()
     
     # Plot background colour
-    bg.plot(
+    plot_layer('coastline').plot(
         facecolor='none',
         edgecolor='grey', 
         ax=ax, 
         linewidth=2
         )
     
-    # Plot EDs coloured according to CON
-    df.plot(
+    # Plot dissolved CONs of this state from the geometry cache
+    state_outlines(df, tolerance=15).plot(
         column='CON',
         cmap=ListedColormap(palette),
         ax=ax, 
@@ -781,7 +958,7 @@ def make_county_boundary_plot(df_orig, name='plot', dpi=500, x=11, y=11,
         )
     
     # Plot county boundaries on top
-    counties.plot(
+    plot_layer('counties').plot(
         facecolor='none', 
         edgecolor='grey', 
         ax=ax
@@ -797,19 +974,100 @@ def make_county_boundary_plot(df_orig, name='plot', dpi=500, x=11, y=11,
     time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
     
     if filetype.upper().strip() == 'PNG':
+        path = f'./images/{name}_county_boundary_{time}.png'
         fig.savefig(
-            f'./images/{name}_county_boundary_{time}.png', 
+            path, 
             dpi=dpi, 
             bbox_inches='tight', 
             transparent=True
             )
     elif filetype.upper().strip() == 'PDF':
+        path = f'./images/{name}_county_boundary_{time}.pdf'
         fig.savefig(
-            f'./images/{name}_county_boundary_{time}.pdf', 
+            path, 
             bbox_inches='tight',
             transparent=True, 
             pad_inches=0
             )    
     else:
-        fig.savefig(f'./images/{name}_{time}.{filetype.strip()}')
-    
\ No newline at end of file
+        path = f'./images/{name}_{time}.{filetype.strip()}'
+        fig.savefig(path)
+    
+    
+    return [path]
+        
+#%% Changed EDs
+
+def changed_eds(baseline, df):
+    '''
+    Returns the rows of df for EDs whose CON differs from that in the 
+    baseline state, with a COLOR column for plotting.
+    If df has no geometry, only the geometries of the changed EDs are read
+    from the geometry store.
+    '''
+    base_cons = baseline.set_index('ED_ID')['CON'].str.upper()
+    cons_now = df['CON'].str.upper()
+    was = base_cons.reindex(df['ED_ID']).to_numpy()
+    columns = ['ED_ID', 'geometry'] if 'geometry' in df else ['ED_ID']
+    changed = with_geometry(df.loc[cons_now.to_numpy()!=was, columns].copy())
+    changed['COLOR'] = cons_now[changed.index].map(color_dict)
+    return changed
+
+#%% Change Renderer
+
+class ChangeRenderer:
+    '''
+    Renders maps of candidate states with changed EDs highlighted.
+    The grey base layer of the CONs of the baseline state (from the
+    geometry cache) is drawn once and cached as a raster; for each
+    candidate only the changed EDs are drawn over it.
+    '''
+    def __init__(self, baseline, dpi=150, x=11, y=11):
+        self.baseline = baseline
+        # Use a standalone Agg figure so pyplot state is never touched
+        self.fig = Figure(figsize=(x,y), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_axes([0, 0, 1, 1])
+        state_outlines(baseline, tolerance=15).plot(
+            facecolor='grey',
+            edgecolor='darkgrey',
+            ax=self.ax
+            )
+        self.ax.set_axis_off()
+        # Freeze the extent, so that candidates are drawn in the same frame
+        self.ax.set_autoscale_on(False)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, df, path):
+        '''
+        Composites the changed EDs of df over the base layer and saves a PNG.
+        '''
+        self.canvas.restore_region(self.background)
+        changed = changed_eds(self.baseline, df)
+        n = len(self.ax.collections)
+        if len(changed) > 0:
+            changed.plot(color=changed['COLOR'], ax=self.ax)
+        # Draw and then remove only the newly added artists
+        for artist in self.ax.collections[n:]:
+            self.ax.draw_artist(artist)
+            artist.remove()
+        plt.imsave(path, np.asarray(self.canvas.buffer_rgba()))
+        return path
+
+#%% Change Gallery
+
+def make_change_gallery(baseline, states, name='candidate', dpi=150, 
+                        x=11, y=11):
+    '''
+    Saves a map for each state in states, highlighting EDs whose CON 
+    differs from baseline. All files share a single timestamp.
+    Returns a list of the paths of the files saved.
+    '''
+    renderer = ChangeRenderer(baseline, dpi, x, y)
+    # Get current time
+    time = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
+    paths = []
+    for k, df in enumerate(states):
+        paths.append(renderer.render(df, f'./images/{name}_{k}_{time}.png'))
+    return paths
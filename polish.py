@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 POLISHING
+# =============================================================================
+# Steepest-ascent local search to finish off the states returned by evolve:
+# the best improving single-ED move is applied until no move improves the
+# reward. Candidate moves wait in a priority queue, and only the moves into
+# or out of the two CONs of each applied move are rescored.
+
+#%% Imports
+
+import heapq
+import numpy as np
+
+from engine import state_from_frame, state_frame, state_reward
+from static_data import build_static_data
+from what_if import MoveQuery
+
+#%% Polish State
+
+def polish_state(static, state, reward_params=None, eligible=None,
+                 objective=None, max_moves=None):
+    '''
+    Returns a copy of EngineState state after repeatedly applying the best
+    improving single-ED move which keeps every CON contiguous, and the
+    number of moves applied.
+    By default any ED with non-zero population which the dataset does not
+    fix may move (including EDs which evolve has already flipped); eligible
+    may be a boolean array to restrict this. If a SeatObjective is given,
+    moves which break its seat limits are skipped.
+    The queue is keyed by the change in reward when each move was scored.
+    As the county boundary and continuity terms depend on totals over all
+    EDs, the move at the front is rescored before being applied, and is
+    put back if it is no longer the best; and when the queue empties, every
+    move is rescored, as moves dropped earlier may have become improving.
+    Unless max_moves stops it, the state returned is therefore a local
+    optimum: no single allowed move improves its reward.
+    '''
+    reward_params = dict(reward_params or {})
+    if objective is not None:
+        reward_params.setdefault('nr', objective.national_ratio)
+    query = MoveQuery(static, state, reward_params.get('nr', 29800))
+    if objective is not None:
+        objective.start(query.state)
+    if eligible is None:
+        eligible = (static.population > 0) & static.movable
+
+    # Each CON has a stamp which changes whenever an ED moves in or out of
+    # it; queued moves with an out-of-date stamp are stale
+    stamp = np.zeros(static.n_cons, dtype=np.int64)
+    queue = []
+
+    def push(eds, cons):
+        answer = query.score(eds, cons, **reward_params)
+        improving = answer['contiguous'] & (answer['delta'] > 0)
+        for i, old, new, delta in zip(eds[improving],
+                                      answer['old_con'][improving],
+                                      answer['new_con'][improving],
+                                      answer['delta'][improving]):
+            heapq.heappush(queue, (-delta, i, old, new, stamp[old],
+                                   stamp[new]))
+
+    push(*query.candidates(eligible))
+    moves = 0
+    scanned = 0 # Moves applied when every move was last scored
+    while max_moves is None or moves < max_moves:
+        if not queue:
+            if moves == scanned:
+                break
+            scanned = moves
+            push(*query.candidates(eligible))
+            continue
+        _, i, old, new, s_old, s_new = heapq.heappop(queue)
+        if query.state.con[i] != old or stamp[old] != s_old or \
+            stamp[new] != s_new:
+            continue
+        answer = query.score(np.array([i]), np.array([new]), **reward_params)
+        delta = answer['delta'][0]
+        if not answer['contiguous'][0] or delta <= 0:
+            continue
+        if queue and delta < -queue[0][0]:
+            heapq.heappush(queue, (-delta, i, old, new, s_old, s_new))
+            continue
+        if objective is not None and \
+            not objective.move_allowed(static, query.state, i, new):
+            continue
+        query.apply(i, new, objective)
+        moves += 1
+        stamp[old] += 1
+        stamp[new] += 1
+
+        # Rescore the moves into or out of the two CONs involved
+        eds, cons = query.candidates(eligible)
+        around = np.isin(query.state.con[eds], (old, new)) | \
+            np.isin(cons, (old, new))
+        push(eds[around], cons[around])
+    return query.state, moves
+
+#%% Polish States
+
+def polish_states(static, states, reward_params=None, objective=None,
+                  max_moves=None):
+    '''
+    Polishes each of a list of EngineStates (e.g. those returned by
+    evolve_states), returning the polished states and their rewards, best
+    first.
+    '''
+    reward_params = dict(reward_params or {})
+    if objective is not None:
+        reward_params.setdefault('nr', objective.national_ratio)
+    polished = [polish_state(static, s, reward_params, None, objective,
+                             max_moves)[0]
+                for s in states]
+    rewards = [state_reward(static, s, **reward_params) for s in polished]
+    order = np.argsort(rewards)[::-1]
+    return [polished[k] for k in order], [rewards[k] for k in order]
+
+#%% Polish
+
+def polish(optimal_states, d, reward_params=None, max_moves=None,
+           static=None):
+    '''
+    Polishes the dataframes returned by evolve on dataframe d, returning the
+    polished dataframes and their rewards, best first.
+    The baseline CONs of the continuity term are those of d, whose
+    StaticData may be given as static if it has already been built.
+    '''
+    if static is None:
+        static = build_static_data(d)
+    states = [state_from_frame(static, df) for df in optimal_states]
+    states, rewards = polish_states(static, states, reward_params,
+                                    max_moves=max_moves)
+    return [state_frame(static, s, d) for s in states], rewards
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              MOVE PROPOSALS
+# =============================================================================
+# Ways of choosing which ED to flip, and to which CON, for the array engine.
+# A ProposalMix draws each flip from one of several proposals and keeps
+# statistics of how often flips from each proposal survive selection.
+
+#%% Imports
+
+import numpy as np
+
+from engine import uniform_move, move_delta, reward_totals
+
+#%% SER Residuals
+
+def ser_residuals(state, national_ratio=29800):
+    '''
+    Returns SER - round(SER) for each CON: positive if the CON has more
+    people than its seats represent, negative if fewer.
+    '''
+    s = state.con_pop/national_ratio
+    return s - np.round(s)
+
+#%% Targeted Move
+
+def targeted_move(static, state, rng, eligible, national_ratio=29800):
+    '''
+    Chooses a CON with probability proportional to |SER - round(SER)|, so
+    the CONs furthest from an integer SER are the most likely, and then an
+    eligible ED on its boundary with a CON whose error has the opposite sign:
+    an over-represented CON gives an ED to an under-represented neighbour,
+    and an under-represented CON takes one from an over-represented neighbour.
+    Returns (ED, new CON), or None if there is no such ED.
+    '''
+    resid = ser_residuals(state, national_ratio)
+    errors = np.abs(resid)
+    if errors.sum() == 0:
+        return None
+    c = rng.choice(len(errors), p=errors/errors.sum())
+
+    # Adjacency entries (i, j) with ED i eligible and j in a different CON
+    con_i = state.con[static.edge_src]
+    con_j = state.con[static.indices]
+    edges = eligible[static.edge_src] & (con_i != con_j)
+    if resid[c] > 0:
+        # Move an ED of c into an under-represented neighbouring CON
+        edges &= (con_i == c) & (resid[con_j] < 0)
+    else:
+        # Move an ED of an over-represented neighbouring CON into c
+        edges &= (con_j == c) & (resid[con_i] > 0)
+    candidates = np.flatnonzero(edges)
+    if candidates.size == 0:
+        return None
+    k = candidates[rng.integers(candidates.size)]
+    return static.edge_src[k], con_j[k]
+
+#%% Compound Moves
+
+def best_partner(static, state, first, partners, reward_params, 
+                 candidates=20, rng=None):
+    '''
+    Given a first move (ED, new CON) and arrays of partner EDs and their new
+    CONs, scores up to <candidates> of the compound moves [first, partner]
+    with move_delta and returns the best one (or None if there are none).
+    '''
+    eds, cons = partners
+    if eds.size == 0:
+        return None
+    if eds.size > candidates:
+        pick = rng.choice(eds.size, candidates, replace=False)
+        eds, cons = eds[pick], cons[pick]
+    totals = reward_totals(static, state)
+    scored = [(move_delta(static, state, [first, (j, c)], totals,
+                          **reward_params), j, c)
+              for j, c in zip(eds, cons)]
+    _, j, c = max(scored, key=lambda x: x[0])
+    return [first, (j, c)]
+
+def swap_moves(static, state, rng, eligible, reward_params, candidates=20):
+    '''
+    Swap across a shared boundary: a random eligible ED i moves from CON A to
+    a neighbouring CON B, and an ED of B bordering A moves to A. The partner
+    is the one whose swap most improves the reward (by move_delta), and it
+    may be an ED which has already changed, but not one which the dataset
+    fixes or excludes.
+    Returns the list of two moves, or None if there is no partner.
+    '''
+    i, b = uniform_move(static, state, rng, eligible)
+    a = state.con[i]
+    con_i = state.con[static.edge_src]
+    con_j = state.con[static.indices]
+    edges = (con_i == b) & (con_j == a) & (static.edge_src != i) \
+        & (static.population[static.edge_src] > 0) \
+        & static.movable[static.edge_src]
+    eds = np.unique(static.edge_src[edges])
+    return best_partner(static, state, (i, b),
+                        (eds, np.full(eds.size, a)),
+                        reward_params, candidates, rng)
+
+def chain_moves(static, state, rng, eligible, reward_params, candidates=20):
+    '''
+    Chain of two moves: a random eligible ED i moves from CON A to a
+    neighbouring CON B, and an ED of B moves on to a third neighbouring
+    CON C. The partner is the one which most improves the reward (by
+    move_delta), and it may be an ED which has already changed, but not one
+    which the dataset fixes or excludes.
+    Returns the list of two moves, or None if there is no partner.
+    '''
+    i, b = uniform_move(static, state, rng, eligible)
+    a = state.con[i]
+    con_i = state.con[static.edge_src]
+    con_j = state.con[static.indices]
+    edges = (con_i == b) & (con_j != a) & (con_j != b) \
+        & (static.edge_src != i) \
+        & (static.population[static.edge_src] > 0) \
+        & static.movable[static.edge_src]
+    pairs = np.unique(np.stack([static.edge_src[edges], con_j[edges]],
+                               axis=1), axis=0)
+    return best_partner(static, state, (i, b), (pairs[:,0], pairs[:,1]),
+                        reward_params, candidates, rng)
+
+#%% Proposal Mix
+
+class ProposalMix:
+    '''
+    Draws each flip from 'uniform', 'targeted', 'swap' or 'chain' proposals,
+    with the given relative weights, e.g. ProposalMix({'uniform': 1,
+    'targeted': 3}). A proposal with no candidate falls back to a uniform one.
+    Swap and chain proposals are compound moves of two EDs (see swap_moves
+    and chain_moves), scored with reward_params.
+    Counts, for each proposal, the flips proposed, those rejected for
+    breaking contiguity, and those in children which survived selection in
+    kill_states.
+    '''
+    names_known = ('uniform', 'targeted', 'swap', 'chain')
+
+    def __init__(self, weights=None, national_ratio=29800, 
+                 reward_params=None):
+        if weights is None:
+            weights = {'uniform': 1, 'targeted': 1}
+        unknown = set(weights) - set(self.names_known)
+        if unknown:
+            raise ValueError(f'Unknown proposals {sorted(unknown)}')
+        self.names = list(weights)
+        p = np.array([weights[n] for n in self.names], dtype=float)
+        self.p = p/p.sum()
+        self.reward_params = dict(reward_params or {})
+        self.reward_params.setdefault('nr', national_ratio)
+        self.national_ratio = self.reward_params['nr']
+        self.proposed = {n: 0 for n in self.names_known}
+        self.rejected = {n: 0 for n in self.names_known}
+        self.accepted = {n: 0 for n in self.names_known}
+
+    def propose(self, static, state, rng, eligible):
+        '''
+        Returns (proposal name, list of (ED, new CON) moves).
+        '''
+        name = self.names[rng.choice(len(self.names), p=self.p)]
+        moves = None
+        if name == 'targeted':
+            move = targeted_move(static, state, rng, eligible,
+                                 self.national_ratio)
+            moves = None if move is None else [move]
+        elif name == 'swap':
+            moves = swap_moves(static, state, rng, eligible, 
+                               self.reward_params)
+        elif name == 'chain':
+            moves = chain_moves(static, state, rng, eligible, 
+                                self.reward_params)
+        if moves is None:
+            name = 'uniform'
+            moves = [uniform_move(static, state, rng, eligible)]
+        self.proposed[name] += 1
+        return name, moves
+
+    def record(self, survivors):
+        '''
+        Counts the flips of each proposal in the surviving children.
+        '''
+        for state, _ in survivors:
+            for name in state.proposed_by:
+                self.accepted[name] += 1
+
+    def acceptance(self):
+        '''
+        Returns a dictionary of proposal name:fraction of its flips which
+        survived selection.
+        '''
+        return {n: self.accepted[n]/self.proposed[n]
+                for n in self.names_known if self.proposed[n] > 0}
+
+    def reporting(self, callback):
+        '''
+        Wraps an evolve callback to add 'acceptance' (as from acceptance) to
+        each generation summary.
+        '''
+        if callback is None:
+            return None
+        def report(summary, survivors):
+            summary['acceptance'] = self.acceptance()
+            callback(summary, survivors)
+        return report
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              REGRESSION CHECK
+# =============================================================================
+# Checks the fast paths (array engine, connectivity index, move deltas,
+# what-if queries, materialiser) against the reference dataframe code (flip,
+# f_contiguity, reward) on random flip sequences. Each sequence is made by
+# flip from its own seed, and the same flips are applied to an EngineState;
+# after every flip the two states must have the same CONs, flip counts,
+# NB_CONS, BOUNDARY, flip pool, contiguity and reward.
+#
+#   python regression_check.py --sequences 20 --length 10 --seed 0
+#
+# The same checks run as tests on the bundled datasets (tests/).
+#
+# Any disagreement is printed with the seed and flips which produce it, and
+# the flips can be replayed on the reference code with replay().
+#
+# Divergences found in the original reference flip, where its NB_CONS (and
+# so BOUNDARY and the flip pool) differed from that recomputed by the
+# engine, both since fixed in flip:
+#   - the flipped ED never gained its old CON as a neighbouring CON, even
+#     if some of its neighbours were still in it
+#   - neighbours of the flipped ED which were already in the new CON had it
+#     added to their own NB_CONS, so they could later be "flipped" into the
+#     CON they were already in
+# Against the original flip, sequences which hit either of these are
+# reported as NB_CONS (or BOUNDARY or flip pool) failures.
+
+#%% Imports
+
+import argparse
+import random
+import sys
+import numpy as np
+
+from datasets import Dataset
+from evolutionary_algorithm import flip
+from reward_function import reward, f_contiguity
+from static_data import build_static_data
+from engine import state_from_frame, move, neighbour_cons, boundary_mask, \
+    flippable, state_contiguous, state_reward, move_delta, \
+    county_boundary_term, continuity_term, ser_term
+from connectivity import ConnectivityIndex, ArticulationFilter
+from what_if import MoveQuery
+from materialise import Materialiser
+
+#%% Parameters
+
+tolerance = 1e-9 # Relative tolerance for rewards and reward deltas
+
+#%% Helpers
+
+def close(a, b):
+    '''
+    Returns True if a and b agree to the relative tolerance.
+    '''
+    return abs(a - b) <= tolerance*max(1, abs(a), abs(b))
+
+def smooth_reward(static, state, a_ser=3, a_cb=1e-10, b_cb=1e-4,
+                  a_cont=1e-3, b_cont=0.01, nr=29800):
+    '''
+    Returns the reward of state without the contiguity check, which
+    move_delta and MoveQuery.score predict changes in.
+    '''
+    return county_boundary_term(static, state, a_cb, b_cb) + \
+        continuity_term(static, state, a_cont, b_cont) + \
+        ser_term(static, state, a_ser, nr)
+
+def replay(df, moves):
+    '''
+    Applies a list of (ED_ID, new CON) flips to dataframe df with flip,
+    returning the final dataframe.
+    '''
+    for ed_id, new_con in moves:
+        i = int(df.index[df['ED_ID']==ed_id][0])
+        df = flip(df, i=i, new_con=new_con)
+    return df
+
+#%% Compare States
+
+def compare_states(static, df, state, reward_params, materialiser):
+    '''
+    Returns a list describing each way in which EngineState state disagrees
+    with the reference dataframe df (empty if they agree). Every ED is
+    compared, including excluded EDs and those next to them or to links,
+    as Dataset.load gives the reference code the adjacency of static.
+    '''
+    problems = []
+    names = np.array(static.con_names)
+    ref_con = df['CON'].str.upper().to_numpy()
+
+    def check(name, wrong):
+        wrong = np.flatnonzero(wrong)
+        if wrong.size:
+            problems.append(f'{name} differs for ED_IDs '
+                            f'{static.ed_id[wrong][:10].tolist()}')
+
+    check('CON', names[state.con] != ref_con)
+    check('CHANGE', state.change != df['CHANGE'].to_numpy())
+
+    nb_cons = neighbour_cons(static, state.con)
+    check('NB_CONS', [set(names[c]) != {str(x).upper() for x in ref}
+                      for c, ref in zip(nb_cons,
+                                        map(np.atleast_1d, df['NB_CONS']))])
+    check('BOUNDARY', boundary_mask(static, state.con) !=
+          (df['BOUNDARY'].to_numpy() != 0))
+
+    pool = (df['BOUNDARY']!=0) & (df['CHANGE']<1) & (df['POPULATION']>0)
+    if 'FIXED' in df:
+        pool &= ~df['FIXED']
+    check('flip pool', flippable(static, state) != pool.to_numpy())
+
+    if f_contiguity(df) != state_contiguous(static, state):
+        problems.append(f'contiguity: reference {f_contiguity(df)}, '
+                        f'engine {state_contiguous(static, state)}')
+    try:
+        state.index.validate()
+    except ValueError as error:
+        problems.append(f'connectivity index: {error}')
+
+    r_ref = reward(df, **reward_params)
+    r_eng = state_reward(static, state, **reward_params)
+    if not close(r_ref, r_eng):
+        problems.append(f'reward: reference {r_ref}, engine {r_eng}')
+
+    frame = materialiser.frame(state)
+    if (frame['CON'].to_numpy() != ref_con).any() or \
+        (frame['CHANGE'].to_numpy() != df['CHANGE'].to_numpy()).any():
+        problems.append('materialised CON or CHANGE differs')
+    return problems
+
+#%% Compare Move
+
+def compare_move(static, df, state, i, new, reward_params, articulation):
+    '''
+    Returns a list describing each way in which the predictions of the fast
+    paths for moving ED i to CON code new disagree with the reference code
+    or with the move itself (which is applied to a copy of state).
+    '''
+    problems = []
+    old = state.con[i]
+    after = state.copy()
+    move(static, after, i, new)
+
+    predicted = move_delta(static, state, [(i, new)], **reward_params)
+    actual = smooth_reward(static, after, **reward_params) - \
+        smooth_reward(static, state, **reward_params)
+    if not close(predicted, actual):
+        problems.append(f'move_delta: predicted {predicted}, actual {actual}')
+
+    answer = MoveQuery(static, state, reward_params.get('nr', 29800)).score(
+        np.array([i]), np.array([new]), **reward_params)
+    if not close(answer['delta'][0], actual):
+        problems.append(f"MoveQuery delta: predicted {answer['delta'][0]}, "
+                        f'actual {actual}')
+    if state_contiguous(static, state, [old, new]):
+        ok = bool(state_contiguous(static, after, [old, new]))
+        if bool(answer['contiguous'][0]) != ok:
+            problems.append(f"MoveQuery contiguity: predicted "
+                            f"{answer['contiguous'][0]}, actual {ok}")
+        if state.index.contiguous(old):
+            splits = articulation.splits(df, i)
+            if splits == state.index.removable(i):
+                problems.append(f'articulation: reference splits={splits}, '
+                                f'index removable={state.index.removable(i)}')
+    return problems
+
+#%% Run Sequence
+
+def run_sequence(df0, static, materialiser, length=10, seed=0,
+                 reward_params=None):
+    '''
+    Makes <length> flips with flip, seeded with seed, applying the same flips
+    to an EngineState and checking the two after every flip.
+    Returns None if they always agree, or otherwise a dictionary of the
+    seed, the number of flips made, the flips as (ED_ID, new CON) and the
+    problems found.
+    '''
+    reward_params = dict(reward_params or {})
+    random.seed(seed)
+    articulation = ArticulationFilter()
+    df = df0
+    state = state_from_frame(static, df0)
+    state.index = ConnectivityIndex(static, state.con)
+    moves = []
+    problems = compare_states(static, df, state, reward_params, materialiser)
+    for step in range(length):
+        if problems:
+            break
+        df2 = flip(df)
+        i = int(np.flatnonzero(df2['CHANGE'].to_numpy() !=
+                               df['CHANGE'].to_numpy())[0])
+        new_con = df2.at[i,'CON']
+        new = static.con_codes([new_con])[0]
+        moves.append((int(df.at[i,'ED_ID']), new_con))
+        problems = compare_move(static, df, state, i, new, reward_params,
+                                articulation)
+        move(static, state, i, new)
+        df = df2
+        problems += compare_states(static, df, state, reward_params,
+                                   materialiser)
+    if problems:
+        return {'seed': seed, 'flips': len(moves), 'moves': moves,
+                'problems': problems}
+    return None
+
+#%% Run Checks
+
+def run_checks(df, sequences=20, length=10, seed=0, reward_params=None):
+    '''
+    Runs <sequences> random flip sequences from dataframe df, with seeds
+    counting up from seed, and returns a list of the failures (as from
+    run_sequence).
+    '''
+    static = build_static_data(df)
+    materialiser = Materialiser(df, static)
+    failures = []
+    for k in range(sequences):
+        failure = run_sequence(df, static, materialiser, length, seed + k,
+                               reward_params)
+        status = 'ok' if failure is None else 'FAILED'
+        print(f'Sequence {k+1}/{sequences} (seed {seed + k}): {status}')
+        if failure is not None:
+            failures.append(failure)
+    return failures
+
+#%% Main
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the fast paths against the reference code on '
+        'random flip sequences.')
+    parser.add_argument('--path', default='./data/DublinElectoral'
+                        'Divisions.feather', help='ED dataset (feather)')
+    parser.add_argument('--excluded', default='', help='EDs exempt from '
+                        'contiguity (feather), or "" for none')
+    parser.add_argument('--sequences', type=int, default=20)
+    parser.add_argument('--length', type=int, default=10,
+                        help='flips per sequence')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = Dataset(args.path, excluded=args.excluded or ()).load()
+    failures = run_checks(df, args.sequences, args.length, args.seed)
+    for failure in failures:
+        print(f"\nSeed {failure['seed']}, after {failure['flips']} flips "
+              f"{failure['moves']}:")
+        for problem in failure['problems']:
+            print(f'  {problem}')
+    print(f'\n{args.sequences - len(failures)}/{args.sequences} sequences '
+          'agree')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
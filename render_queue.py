@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                               RENDER QUEUE
+# =============================================================================
+
+#%% Imports
+
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, wait
+
+#%% Worker Functions
+
+def init_worker():
+    '''
+    Runs once in each rendering process. Switches to a non-interactive
+    backend (even if the parent had an interactive one), since figures are
+    only saved to file.
+    '''
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+def render(func, args, kwargs):
+    '''
+    Runs one plotting function in a rendering process and returns the list
+    of paths of the files it saved.
+    '''
+    import matplotlib.pyplot as plt
+    paths = func(*args, **kwargs)
+    # Free the figure(s), since the process is reused for later jobs
+    plt.close('all')
+    return paths
+
+#%% Render Queue
+
+class RenderQueue:
+    '''
+    Dispatches plotting functions (make_plot, make_chart, etc.) to a pool of
+    background processes. submit() returns a future for the list of output
+    files, so the caller can carry on with the next configuration.
+    '''
+    def __init__(self, workers=None):
+        # Fork (where available), so that workers do not re-import the
+        # calling script (e.g. main.py run with python, which would reload
+        # the data and re-run evolve); init_worker replaces any inherited
+        # interactive backend
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in methods else None)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=init_worker
+            )
+        self.futures = []
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Queues func(*args, **kwargs) for rendering and returns its future.
+        '''
+        future = self.pool.submit(render, func, args, kwargs)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        '''
+        Waits for all queued jobs and returns a flat list of saved files.
+        Any exception raised while rendering is raised here.
+        '''
+        wait(self.futures)
+        paths = []
+        for future in self.futures:
+            paths += future.result()
+        return paths
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
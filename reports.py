@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              BATCH REPORTS
+# =============================================================================
+
+#%% Imports
+
+import numpy as np
+import pandas as pd
+
+from plotting_functions import format_table_data, format_chart_dictionaries, \
+    render_table, render_chart, timestamp
+from render_queue import RenderQueue
+
+#%% Batch Metrics
+
+def batch_metrics(states, national_ratio=29800):
+    '''
+    Computes the population, SER, seats and VNA of every CON in every state
+    in a single groupby. Returns a dataframe with one row per (STATE, CON),
+    where STATE is the position of the state in the list.
+    If all states have a SEATS column, then CURRENT_SEATS and CURRENT_VNA
+    (VNA using currently assigned seats) are also included.
+    '''
+    # Stack the columns needed from every state
+    stacked = pd.DataFrame({
+        'STATE': np.repeat(np.arange(len(states)), [len(df) for df in states]),
+        'CON': np.concatenate([df['CON'].str.upper().to_numpy()
+                               for df in states]),
+        'POPULATION': np.concatenate([df['POPULATION'].to_numpy()
+                                      for df in states])
+        })
+    has_seats = all('SEATS' in df.columns for df in states)
+    if has_seats:
+        stacked['SEATS'] = np.concatenate([df['SEATS'].to_numpy()
+                                           for df in states])
+
+    grouped = stacked.groupby(['STATE', 'CON'])
+    metrics = grouped['POPULATION'].sum().to_frame()
+    metrics['SER'] = metrics['POPULATION']/national_ratio
+    metrics['SEATS'] = metrics['SER'].round().astype(int)
+    metrics['VNA'] = (metrics['SER'] - metrics['SEATS'])/metrics['SEATS']
+    if has_seats:
+        metrics['CURRENT_SEATS'] = grouped['SEATS'].first().astype(int)
+        metrics['CURRENT_VNA'] = (metrics['SER'] - metrics['CURRENT_SEATS']) \
+            /metrics['CURRENT_SEATS']
+    return metrics.reset_index()
+
+#%% Batch Report
+
+def batch_report(states, names=None, baseline=None, tables=True,
+                 charts=True, seats=False, save_tex=False, workers=None,
+                 national_ratio=29800):
+    '''
+    Writes an SER and VNA table for each state in states and, if baseline
+    is given, SER and VNA charts comparing the baseline with each state.
+    All metrics are computed in one pass by batch_metrics, and the files are
+    rendered in parallel with a single shared timestamp.
+    States are named state_0, state_1, ... unless names is given.
+    Returns the metrics dataframe and a list of the paths of files saved.
+    '''
+    states = list(states)
+    if names is None:
+        names = [f'state_{k}' for k in range(len(states))]
+
+    # The baseline, if any, is the last state in the batch
+    all_states = states + ([baseline] if baseline is not None else [])
+    metrics = batch_metrics(all_states, national_ratio)
+    per_state = {k: m.set_index('CON') for k, m in metrics.groupby('STATE')}
+
+    time = timestamp()
+    with RenderQueue(workers) as queue:
+        for k, name in enumerate(names):
+            m = per_state[k]
+            if tables:
+                table_data = format_table_data(
+                    dict(m['SER']),
+                    dict(m['VNA']),
+                    dict(m['SEATS']) if seats else None
+                    )
+                queue.submit(render_table, table_data, f'{name}_table',
+                             save_tex=save_tex, time=time)
+            if charts and baseline is not None:
+                b = per_state[len(states)]
+                ser_data = format_chart_dictionaries(dict(b['SER']),
+                                                     dict(m['SER']))
+                # Use current seats for the baseline VNA, where known
+                b_vna = b['CURRENT_VNA'] if 'CURRENT_VNA' in b else b['VNA']
+                vna_data = format_chart_dictionaries(dict(b_vna),
+                                                     dict(m['VNA']))
+                queue.submit(render_chart, ser_data, name, metric='SER',
+                             save_tex=save_tex, time=time)
+                queue.submit(render_chart, vna_data, name, metric='VNA',
+                             save_tex=save_tex, time=time)
+        paths = queue.wait()
+
+    return metrics, paths
@@ -4,10 +4,10 @@
 #%% Imports
 import pandas as pd
 import numpy as np
-import networkx as nx # For contiguity check
 from numba import jit # Use numba for faster computation
 
 from data_analysis import ser
+from connectivity import connected # For contiguity check
 
 #%% Files
 
@@ -32,35 +32,25 @@ def f_contiguity(df):
     Checks whether all constituencies in the state are contiguous.
     Returns 1 if so, 0 if not.
     '''
-    # Only check for changed constituenciess
-    changed_cons = list(np.unique(df[df['CHANGE']==1]['CON']))
-    # Neighbouring CONs of a flipped ED could also become discontiguous,
-    # so add them to changed_cons
-    for i in list(df[df['CHANGE']>0].index):
-        for nc in df.loc[i, 'NB_CONS']:
-            if nc not in changed_cons:
-                changed_cons.append(nc)
+    # Only check for changed constituencies: the CONs of flipped EDs, and
+    # the CONs of their neighbouring EDs (which include the CONs they left)
+    con_of = dict(zip(df['ED_ID'], df['CON']))
+    flipped = df[df['CHANGE']>0]
+    changed_cons = set(flipped['CON'])
+    for nbh in flipped['NEIGHBOURS']:
+        changed_cons.update(con_of[n] for n in np.atleast_1d(nbh)
+                            if n in con_of)
     # Check contiguity of each changed constituency
+    neighbours = dict(zip(df['ED_ID'], df['NEIGHBOURS']))
     for c in changed_cons:
-        # Filter dataframe to just EDs in constituency c
-        d = df[df['CON']==c]
-        # Create list of ED IDs in constituency c
-        ed_ids = list(d['ED_ID'])
-        # Form nested list of neighbours of each ED
-        nbh_list = list([list(nbh) for nbh in d['NEIGHBOURS']])
-        # Form nested list with only neighbours in constituency c
-        nbhs_in_c = [[n for n in nbh_sublist if n in ed_ids] 
-                for nbh_sublist in nbh_list]
-        if [] in nbhs_in_c: # If some ED in CON c has no neighbours in same CON
-            return 0
-        # Create a dictionary of ED ID-neighbour pairs,
-        # but only including neighbours in same constituency
-        nbh_dict = {ed_id: nbh for ed_id, nbh in
-                    zip(list(d['ED_ID']), nbhs_in_c)}
-        # Create a graph representing constituency c
-        g = nx.Graph(nbh_dict)
-        # Check whether the graph is connected, i.e. whether c is contiguous
-        if not nx.is_connected(g):
+        # Set of ED IDs in constituency c, without any EDs which the dataset
+        # exempts from contiguity (see datasets.py)
+        members = df['CON']==c
+        if 'EXEMPT' in df:
+            members &= ~df['EXEMPT']
+        ed_ids = set(df.loc[members, 'ED_ID'])
+        # A single ED has no neighbours in the same CON
+        if len(ed_ids) == 1 or not connected(ed_ids, neighbours):
             return 0
     return 1
     
@@ -185,8 +175,26 @@ def reward(df, a_ser=3, a_cb=1e-10, b_cb=1e-4, a_cont=1e-3, b_cont=0.01,
     '''
     Reward function for dataframe df.
     '''
+    part, _ = reward_partial(df, a_ser, a_cont, b_cont, nr)
+    return reward_rest(df, part, a_cb, b_cb)
+
+#%% Partial Reward
+
+def reward_partial(df, a_ser=3, a_cont=1e-3, b_cont=0.01, nr=29800):
+    '''
+    Computes the cheap terms of reward (continuity and SER) first.
+    Returns them, and an upper bound on the full reward: the county
+    boundary term is at most 1, and the reward is 0 if not contiguous.
+    '''
+    cont = f_continuity(df, a_cont, b_cont)
+    s = f_ser(df, a_ser, nr)
+    return (cont, s), cont + s + 1
+
+def reward_rest(df, part, a_cb=1e-10, b_cb=1e-4):
+    '''
+    Completes reward, given the cheap terms from reward_partial.
+    '''
     if not f_contiguity(df):
         return 0 # No reward if not globally contiguous
-    return f_county_boundary(df, c2c, a_cb, b_cb) + \
-        f_continuity(df, a_cont, b_cont) + f_ser(df, a_ser, nr)
-        
\ No newline at end of file
+    cont, s = part
+    return f_county_boundary(df, c2c, a_cb, b_cb) + cont + s
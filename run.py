@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                          COMMAND-LINE ENTRY POINT
+# =============================================================================
+# Headless alternative to main.py, driven by a TOML or YAML run config.
+# See configs/example.toml for the available settings.
+#
+#   python run.py configs/example.toml
+#   python run.py configs/example.toml --no-plots --workers 8
+
+#%% Imports
+
+import argparse
+import sys
+
+from data_analysis import remove_islands, remove_dublin
+from datasets import Dataset, cut_out
+from materialise import Materialiser
+from sweep import engines, evolve_keys, reward_keys, grid, random_search, \
+    run_sweep
+
+#%% Defaults
+
+defaults = {
+    'data': {
+        'path': './data/IrishElectoralDivisions.feather',
+        'remove_islands': True,
+        'remove_dublin': False,
+        'fixed': [],
+        'fixed_counties': [],
+        'excluded': [],
+        'links': []
+        },
+    'parameters': {'flips': 5, 'kids': 10, 'keep': 4},
+    'reward': {},
+    'run': {'engine': 'reference', 'workers': 1, 'seed': None,
+            'search': 'grid', 'samples': 20},
+    'sweep': {},
+    'outputs': {'plots': True, 'tables': True, 'save_data': False,
+                'results': None, 'run_output': None}
+    }
+
+# Settings which can be swept over
+sweep_keys = evolve_keys + reward_keys
+
+#%% Load Config
+
+def load_config(path):
+    '''
+    Reads a TOML (.toml) or YAML (.yaml/.yml) run config and fills in
+    any missing settings from defaults.
+    '''
+    if path.endswith(('.yaml', '.yml')):
+        import yaml # Only needed for YAML configs
+        with open(path) as file:
+            config = yaml.safe_load(file) or {}
+    else:
+        import tomllib
+        with open(path, 'rb') as file:
+            config = tomllib.load(file)
+    # Fill in defaults, section by section
+    full = {}
+    for section, values in defaults.items():
+        full[section] = {**values, **config.get(section, {})}
+    unknown = (set(full['sweep']) | set(full['reward'])) - set(sweep_keys)
+    if unknown:
+        raise ValueError(f'Unknown parameters {sorted(unknown)}; '
+                         f'choose from {list(sweep_keys)}')
+    if full['run']['engine'] not in engines:
+        raise ValueError(f"Unknown engine {full['run']['engine']!r}; "
+                         f'choose from {list(engines)}')
+    return full
+
+#%% Expand Sweep
+
+def expand_sweep(config):
+    '''
+    Returns a list of configurations (dictionaries of flips, kids, keep, seed
+    and any reward weights) from the sweep section: every combination of
+    the listed values if search = "grid", or <samples> random draws if
+    search = "random".
+    '''
+    base = {**config['parameters'], **config['reward'], 
+            'seed': config['run']['seed']}
+    if config['run']['search'] == 'random':
+        return random_search(base, config['sweep'], config['run']['samples'],
+                             config['run']['seed'])
+    return grid(base, config['sweep'])
+
+#%% Load Dataset
+
+def load_dataset(data_config):
+    '''
+    Reads and prepares the dataset described by the data section of a config.
+    Fixed and excluded EDs stay in the dataframe (see datasets.py); only
+    remove_islands and remove_dublin drop rows, and the EDs they drop are
+    cut out of the adjacency of the rest.
+    '''
+    d0 = Dataset.from_config(data_config).load()
+    d = d0.copy()
+    if data_config['remove_islands']:
+        d = remove_islands(d)
+    if data_config['remove_dublin']:
+        d = remove_dublin(d)
+    if len(d) < len(d0):
+        cut_out(d)
+    return d0, d
+
+#%% Run Name
+
+def run_name(params):
+    '''
+    Returns a name identifying a run, used in output file names.
+    '''
+    name = f"flips={params['flips']}_kids={params['kids']}" \
+        f"_keep={params['keep']}"
+    for key in reward_keys:
+        if key in params:
+            name += f'_{key}={params[key]:g}'
+    if params['seed'] is not None:
+        name += f"_seed={params['seed']}"
+    return name
+
+#%% Finish Run
+
+def finish_run(best_state, params, data):
+    '''
+    Saves the outputs of one run; called by run_sweep in the worker process.
+    The dataframes of the original and best states share the geometry of
+    d0, through a Materialiser kept in the worker's data; EDs removed from
+    the run (e.g. Dublin or the islands) keep their original CONs. If the
+    best state is saved, its NB_CONS and BOUNDARY are recomputed, so that
+    it can be loaded as a start state.
+    '''
+    if 'materialiser' not in data:
+        data['materialiser'] = Materialiser(data['d0'], data.get('static'))
+    materialiser = data['materialiser']
+    save_outputs(materialiser.frame(),
+                 materialiser.frame(best_state,
+                                    neighbours=data['outputs']['save_data']),
+                 run_name(params), data['outputs'])
+
+#%% Save Outputs
+
+def save_outputs(original_data_full, optimal_data_full, name, outputs):
+    '''
+    Saves the plots, tables and data requested in the outputs section.
+    '''
+    if outputs['plots'] or outputs['tables']:
+        # Never open windows when running headless
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from plotting_functions import make_plot, make_chart, \
+            make_ser_and_vna_table
+    if outputs['plots']:
+        make_plot(optimal_data_full, f'optimal_state_{name}')
+        make_plot(optimal_data_full, f'optimal_state_{name}',
+                  highlight_changes=True)
+        make_chart(original_data_full, optimal_data_full, name)
+        make_chart(original_data_full, optimal_data_full, name, metric='VNA')
+    if outputs['tables']:
+        make_ser_and_vna_table(optimal_data_full, f'optimal_state_SER_{name}')
+    if outputs['plots'] or outputs['tables']:
+        plt.close('all')
+    if outputs['save_data']:
+        optimal_data_full.to_feather(f'./data/optimal_data_{name}.feather')
+
+#%% Run Config
+
+def run_config(config):
+    '''
+    Runs every configuration of a sweep (or the single configuration),
+    concurrently if workers > 1. The dataset is loaded only once.
+    Returns a dataframe summarising the runs.
+    '''
+    d0, d = load_dataset(config['data'])
+    data = {
+        'd0': d0,
+        'd': d,
+        'outputs': config['outputs']
+        }
+    outputs = config['outputs']
+    wants_outputs = outputs['plots'] or outputs['tables'] \
+        or outputs['save_data']
+    results = run_sweep(
+        data,
+        expand_sweep(config),
+        engine=config['run']['engine'],
+        workers=config['run']['workers'],
+        finish=finish_run if wants_outputs else None,
+        output=config['outputs']['run_output']
+        )
+    results['name'] = [run_name(params) 
+                       for params in results.to_dict('records')]
+    if config['outputs']['results']:
+        results.to_csv(config['outputs']['results'], index=False)
+    return results
+
+#%% Main
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Evolve Irish constituency boundaries from a run config.')
+    parser.add_argument('config', help='TOML or YAML run config')
+    parser.add_argument('--no-plots', action='store_true',
+                        help='skip all plots and tables (throughput runs)')
+    parser.add_argument('--workers', type=int,
+                        help='number of configurations to run at once')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--engine', choices=list(engines),
+                        help='optimisation engine')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    # Command-line options override the config
+    if args.no_plots:
+        config['outputs']['plots'] = False
+        config['outputs']['tables'] = False
+    if args.workers is not None:
+        config['run']['workers'] = args.workers
+    if args.seed is not None:
+        config['run']['seed'] = args.seed
+    if args.engine is not None:
+        config['run']['engine'] = args.engine
+
+    results = run_config(config)
+    print(results.to_string(index=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
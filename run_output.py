@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 RUN OUTPUT
+# =============================================================================
+# Streams the survivors of every generation to a Parquet dataset, partitioned
+# by run and generation:
+#
+#   <root>/_eds.parquet                          ED_ID of each ED position
+#   <root>/_cons.parquet                         name of each CON code
+#   <root>/run=<run>/generation=<g>/part-0.parquet
+#
+# Each row is one surviving state: its rank, reward and reward terms, and its
+# assignment as a list of CON codes (one per ED, no geometry). The dataset
+# can be queried afterwards with pyarrow.dataset, DuckDB, Polars etc., e.g.
+#   pyarrow.dataset.dataset(root, partitioning='hive')
+
+#%% Imports
+
+import os
+import numpy as np
+
+from engine import state_from_frame, ser_term, county_boundary_term, \
+    continuity_term
+
+#%% Run Writer
+
+class RunWriter:
+    '''
+    Callback for evolve() (or evolve_states) which writes the survivors of
+    each generation to <root>/run=<run>/generation=<g>/part-0.parquet, so
+    that no states are kept in memory.
+    static is the StaticData of the original dataset (never of a survivor,
+    as its CONs are the baseline of changed_eds and the continuity term).
+    reward_params are the weights used for the reward terms.
+    '''
+    def __init__(self, root, static, run=0, reward_params=None):
+        # pyarrow is only needed for run output
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.root = root
+        self.run = run
+        self.static = static
+        self.reward_params = dict(reward_params or {})
+        self.rows = 0
+        self.write_codes()
+
+    def write_codes(self):
+        '''
+        Writes the ED_ID of each ED position and the name of each CON code
+        to the root of the dataset (replacing any existing files atomically,
+        as several runs may share it).
+        '''
+        pa, pq = self.pa, self.pq
+        os.makedirs(self.root, exist_ok=True)
+        tables = {
+            '_eds.parquet': pa.table({
+                'ED': np.arange(self.static.n_eds, dtype=np.int32),
+                'ED_ID': self.static.ed_id}),
+            '_cons.parquet': pa.table({
+                'CON': np.arange(self.static.n_cons, dtype=np.int16),
+                'NAME': self.static.con_names}),
+            }
+        for name, table in tables.items():
+            path = os.path.join(self.root, name)
+            temp = f'{path}.{os.getpid()}.tmp'
+            pq.write_table(table, temp)
+            os.replace(temp, path)
+
+    def terms(self, state):
+        '''
+        Returns the SER, county boundary and continuity terms of state.
+        '''
+        p = self.reward_params
+        return (ser_term(self.static, state, p.get('a_ser', 3),
+                         p.get('nr', 29800)),
+                county_boundary_term(self.static, state, p.get('a_cb', 1e-10),
+                                     p.get('b_cb', 1e-4)),
+                continuity_term(self.static, state, p.get('a_cont', 1e-3),
+                                p.get('b_cont', 0.01)))
+
+    def __call__(self, summary, survivors):
+        pa, pq = self.pa, self.pq
+        states = [x for x, _ in survivors]
+        if not hasattr(states[0], 'con'):
+            states = [state_from_frame(self.static, df) for df in states]
+        terms = np.array([self.terms(s) for s in states]).reshape(-1, 3)
+        con = np.stack([s.con for s in states]).astype(np.int16)
+        change = np.stack([s.change for s in states]).astype(np.int8)
+        n, m = con.shape
+        table = pa.table({
+            'rank': np.arange(n, dtype=np.int16),
+            'reward': np.array([float(r) for _, r in survivors]),
+            'ser_term': terms[:,0],
+            'cb_term': terms[:,1],
+            'cont_term': terms[:,2],
+            'changed_eds': (con != self.static.con0).sum(axis=1),
+            'evaluations': np.full(n, summary.get('evaluations', 0)),
+            'con': pa.FixedSizeListArray.from_arrays(con.ravel(), m),
+            'change': pa.FixedSizeListArray.from_arrays(change.ravel(), m),
+            })
+        directory = os.path.join(self.root, f'run={self.run}',
+                                 f"generation={summary['generation']}")
+        os.makedirs(directory, exist_ok=True)
+        pq.write_table(table, os.path.join(directory, 'part-0.parquet'))
+        self.rows += n
+
+#%% Read Run Output
+
+def read_run_output(root, columns=None, filter=None):
+    '''
+    Returns the run output dataset at root as a pyarrow Table, with run and
+    generation columns from the partitioning. columns and filter are passed
+    to pyarrow.dataset, e.g.
+        read_run_output(root, ['reward'], pyarrow.dataset.field('run') == 3)
+    '''
+    import pyarrow.dataset as ds # Only needed for run output
+    return ds.dataset(root, partitioning='hive').to_table(columns=columns,
+                                                          filter=filter)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                             STATIC ED DATA
+# =============================================================================
+# Per-ED arrays which never change during an optimisation (population,
+# county, baseline CON, adjacency), stored once so that worker processes
+# can attach to them without copying.
+
+#%% Imports
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from multiprocessing import shared_memory, resource_tracker
+
+from reward_function import c2c
+
+#%% Static Data
+
+class StaticData:
+    '''
+    Static arrays describing a dataset of n EDs and their adjacency, with
+    CONs and counties given as integer codes into con_names/county_names:
+        ed_id       (n,)     ED_ID of each row
+        population  (n,)     population of each ED
+        county      (n,)     county code of each ED
+        con0        (n,)     CON code of each ED in the baseline state
+        indptr      (n+1,)   CSR adjacency: the neighbours of ED i are
+        indices     (m,)         indices[indptr[i]:indptr[i+1]]
+        edge_src    (m,)     ED at the start of each adjacency entry
+        edge_length (m,)     length of shared boundary (1 if not computed)
+        home        (c, k)   True if county k is a home county of CON c
+        movable     (n,)     False for EDs which may never be flipped
+        exempt      (n,)     True for EDs exempt from contiguity (which
+                                 have no adjacency entries)
+    '''
+    array_names = ('ed_id', 'population', 'county', 'con0', 'indptr',
+                   'indices', 'edge_src', 'edge_length', 'home', 'movable',
+                   'exempt')
+
+    def __init__(self, arrays, con_names, county_names):
+        for name in self.array_names:
+            setattr(self, name, arrays[name])
+        self.con_names = list(con_names)
+        self.county_names = list(county_names)
+        self.n_eds = len(self.ed_id)
+        self.n_cons = len(self.con_names)
+
+    def arrays(self):
+        '''
+        Returns a dictionary of name:array for all static arrays.
+        '''
+        return {name: getattr(self, name) for name in self.array_names}
+
+    def neighbours(self, i):
+        '''
+        Returns the row indices of the neighbours of ED i.
+        '''
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def con_codes(self, cons):
+        '''
+        Converts an array of CON names to CON codes.
+        '''
+        lookup = {c: k for k, c in enumerate(self.con_names)}
+        return np.array([lookup[c.upper()] for c in cons], dtype=np.int16)
+
+#%% Build Static Data
+
+def build_static_data(df, c2c=c2c, edge_lengths=False):
+    '''
+    Builds StaticData from a dataframe of EDs with NEIGHBOURS arrays
+    (as prepared by convert_data). Neighbours which are not in df
+    (e.g. removed islands) are dropped, and adjacency is made symmetric.
+    If edge_lengths=True, then shared boundary lengths are computed from the
+    geometry (slow); otherwise every edge has length 1.
+    EDs are fixed or exempt from contiguity if df has FIXED or EXEMPT
+    columns (see datasets.py).
+    '''
+    n = len(df)
+    ed_id = df['ED_ID'].to_numpy().astype(np.int64)
+    row = pd.Series(np.arange(n), index=ed_id)
+
+    # CON and county codes, including any CONs/counties only in c2c
+    home_counties = {c.upper(): h.split(',')
+                     for c, h in zip(c2c['CON'], c2c['HOME_COUNTY'])}
+    con_names = sorted(set(df['CON'].str.upper()) | set(home_counties))
+    county_names = sorted(set(df['COUNTY'])
+                          | {k for h in home_counties.values() for k in h})
+    con_lookup = {c: k for k, c in enumerate(con_names)}
+    county_lookup = {k: j for j, k in enumerate(county_names)}
+    con0 = df['CON'].str.upper().map(con_lookup).to_numpy().astype(np.int16)
+    county = df['COUNTY'].map(county_lookup).to_numpy().astype(np.int16)
+
+    home = np.zeros((len(con_names), len(county_names)), dtype=bool)
+    for c, counties in home_counties.items():
+        for k in counties:
+            home[con_lookup[c], county_lookup[k]] = True
+
+    # Adjacency as (source row, neighbour row) pairs (a cell with a single
+    # neighbour may hold a 0-d array)
+    nbrs = [np.atleast_1d(np.asarray(x)).astype(np.int64)
+            for x in df['NEIGHBOURS']]
+    src = np.repeat(np.arange(n), [len(x) for x in nbrs])
+    dst = row.reindex(np.concatenate(nbrs)).to_numpy()
+    found = ~np.isnan(dst)
+    src, dst = src[found], dst[found].astype(np.int64)
+    # Symmetrise, remove duplicates and self-loops, and sort by source
+    pairs = np.unique(np.concatenate([np.stack([src, dst], axis=1),
+                                      np.stack([dst, src], axis=1)]), axis=0)
+    pairs = pairs[pairs[:,0]!=pairs[:,1]]
+    # EDs exempt from contiguity are left out of the adjacency
+    exempt = df['EXEMPT'].to_numpy().astype(bool) if 'EXEMPT' in df \
+        else np.zeros(n, dtype=bool)
+    movable = ~df['FIXED'].to_numpy().astype(bool) if 'FIXED' in df \
+        else np.ones(n, dtype=bool)
+    pairs = pairs[~exempt[pairs[:,0]] & ~exempt[pairs[:,1]]]
+    edge_src = pairs[:,0].astype(np.int32)
+    indices = pairs[:,1].astype(np.int32)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(edge_src,
+                                                         minlength=n))])
+
+    if edge_lengths:
+        geoms = df.geometry.values
+        shared = gpd.GeoSeries(geoms[edge_src]).intersection(
+            gpd.GeoSeries(geoms[indices]), align=False)
+        edge_length = shared.length.to_numpy().astype(np.float64)
+    else:
+        edge_length = np.ones(len(indices))
+
+    arrays = {
+        'ed_id': ed_id,
+        'population': df['POPULATION'].to_numpy().astype(np.int64),
+        'county': county,
+        'con0': con0,
+        'indptr': indptr.astype(np.int64),
+        'indices': indices,
+        'edge_src': edge_src,
+        'edge_length': edge_length,
+        'home': home,
+        'movable': movable & ~exempt,
+        'exempt': exempt
+        }
+    return StaticData(arrays, con_names, county_names)
+
+#%% Shared Memory
+
+def share_static_data(static):
+    '''
+    Copies the arrays of static into shared memory.
+    Returns a small picklable handle for attach_static_data, and the list of
+    shared memory blocks, which the caller must pass to release_static_data
+    when all workers have finished.
+    '''
+    handle = {
+        'con_names': static.con_names,
+        'county_names': static.county_names,
+        'arrays': {}
+        }
+    blocks = []
+    for name, arr in static.arrays().items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+        view[...] = arr
+        handle['arrays'][name] = (shm.name, arr.shape, arr.dtype.str)
+        blocks.append(shm)
+    return handle, blocks
+
+# Blocks attached by this process, kept open while their arrays are in use
+attached_blocks = []
+
+def attach_static_data(handle):
+    '''
+    Returns StaticData whose arrays are read-only views of the shared memory
+    described by handle (from share_static_data). Nothing is copied.
+    '''
+    arrays = {}
+    for name, (shm_name, shape, dtype) in handle['arrays'].items():
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:
+            # Before Python 3.13, attaching registers the block with the
+            # resource tracker, which would unlink it when this process exits
+            shm = shared_memory.SharedMemory(name=shm_name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        attached_blocks.append(shm)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[name] = arr
+    return StaticData(arrays, handle['con_names'], handle['county_names'])
+
+def release_static_data(blocks):
+    '''
+    Frees shared memory blocks created by share_static_data.
+    '''
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+#%% Memory-Mapped Files
+
+def save_static_data(static, directory):
+    '''
+    Saves static as .npy files (plus names.json) in directory, so that it
+    can be memory-mapped by load_static_data.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for name, arr in static.arrays().items():
+        np.save(os.path.join(directory, f'{name}.npy'), arr)
+    with open(os.path.join(directory, 'names.json'), 'w') as file:
+        json.dump({'con_names': static.con_names,
+                   'county_names': static.county_names}, file)
+
+def load_static_data(directory, mmap=True):
+    '''
+    Loads StaticData saved by save_static_data. If mmap=True, the arrays are
+    read-only memory maps, shared between all processes that load them.
+    '''
+    mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'),
+                            mmap_mode=mode)
+              for name in StaticData.array_names}
+    with open(os.path.join(directory, 'names.json')) as file:
+        names = json.load(file)
+    return StaticData(arrays, names['con_names'], names['county_names'])
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              PARAMETER SWEEPS
+# =============================================================================
+
+#%% Imports
+
+import itertools
+import multiprocessing
+import random
+import time
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+from evolutionary_algorithm import evolve, Pruning
+from engine import evolve_states, initial_state
+from objective import SeatObjective
+from proposals import ProposalMix
+from crossover import Crossover
+from polish import polish, polish_states
+from connectivity import ArticulationFilter
+from monitoring import combine
+from static_data import build_static_data, share_static_data, \
+    attach_static_data, release_static_data
+
+#%% Parameters
+
+# Parameters of evolve (seat_total, total_bounds, the proposal weights and
+# crossovers are only used by the array engine), and whether to polish its
+# best states
+evolve_keys = ('flips', 'kids', 'keep', 'seed', 'seat_total', 'total_bounds',
+               'targeted', 'swap', 'chain', 'crossovers', 'polish',
+               'prefilter', 'prune')
+# Keyword arguments of reward
+reward_keys = ('a_ser', 'a_cb', 'b_cb', 'a_cont', 'b_cont', 'nr')
+
+#%% Grid
+
+def grid(base, space):
+    '''
+    Returns a list of configurations, one for each combination of the lists
+    of values in space. Parameters not in space are taken from base.
+    '''
+    keys = list(space)
+    configurations = []
+    for combination in itertools.product(*[space[k] for k in keys]):
+        configurations.append({**base, **dict(zip(keys, combination))})
+    return configurations
+
+#%% Random Search
+
+def random_search(base, space, samples=20, seed=None):
+    '''
+    Returns a list of <samples> randomly drawn configurations.
+    Each entry of space is either a list of values to choose from, or a
+    dictionary {'low': ..., 'high': ..., 'log': bool} giving a range; the
+    range is sampled as integers if both ends are integers.
+    '''
+    rng = np.random.default_rng(seed)
+    configurations = []
+    for _ in range(samples):
+        config = dict(base)
+        for key, values in space.items():
+            if isinstance(values, dict):
+                low, high = values['low'], values['high']
+                if isinstance(low, int) and isinstance(high, int):
+                    config[key] = int(rng.integers(low, high + 1))
+                elif values.get('log', False):
+                    config[key] = float(np.exp(
+                        rng.uniform(np.log(low), np.log(high))))
+                else:
+                    config[key] = float(rng.uniform(low, high))
+            else:
+                config[key] = values[rng.integers(len(values))]
+        configurations.append(config)
+    return configurations
+
+#%% Worker Data
+# Data loaded once by the parent, and set in each worker by init_worker
+
+preloaded = {}
+
+def init_worker(data):
+    '''
+    Stores the preloaded data in a worker process. With the fork start
+    method the data is inherited from the parent rather than pickled.
+    If the data has a static_handle, the worker attaches to the static
+    arrays in shared memory.
+    '''
+    preloaded.update(data)
+    if 'static_handle' in data:
+        preloaded['static'] = attach_static_data(data['static_handle'])
+
+#%% Engines
+# Functions engine(config, reward_params, callback) returning
+# (best states, best rewards) for the preloaded dataset, and functions
+# polisher(config, states, reward_params) which polish the states of an
+# engine as it does when the config has polish = True
+
+def seat_objective(config, static):
+    '''
+    Returns the SeatObjective of the config for static, or None if the
+    config has no seat_total. The national ratio is derived from the
+    national population of the preloaded data, and the seat total kept
+    within total_bounds (default 171-181 for the whole country; false to
+    disable).
+    '''
+    if config.get('seat_total') is None:
+        return None
+    bounds = config.get('total_bounds', (171, 181))
+    return SeatObjective(static, config['seat_total'],
+                         tuple(bounds) if bounds else None,
+                         national_population=preloaded.get(
+                             'national_population'))
+
+def polish_reference(config, states, reward_params):
+    '''
+    Polishes dataframes of the preloaded dataframe.
+    '''
+    return polish(states, preloaded['d'], reward_params,
+                  static=preloaded.get('static'))
+
+def polish_array(config, states, reward_params):
+    '''
+    Polishes EngineStates of the preloaded static data, within the seat
+    limits of the config.
+    '''
+    static = preloaded['static']
+    return polish_states(static, states, reward_params,
+                         seat_objective(config, static))
+
+def run_reference(config, reward_params, callback):
+    '''
+    Runs evolve on the preloaded dataframe, then polishes the best states
+    if the config has polish = True. If it has prefilter = True, flips
+    which would disconnect a CON are left out of the pool, and if it has
+    prune = True, children which cannot survive are not scored in full.
+    '''
+    articulation = ArticulationFilter() if config.get('prefilter') else None
+    pruning = Pruning() if config.get('prune') else None
+    states, rewards = evolve(preloaded['d'], config['flips'], config['kids'],
+                             config['keep'], callback, reward_params,
+                             articulation, pruning)
+    if config.get('polish'):
+        states, rewards = polish_reference(config, states, reward_params)
+    return states, rewards
+
+def run_array(config, reward_params, callback):
+    '''
+    Runs the array engine on the preloaded static data. The best states are
+    returned as EngineStates.
+    If the config has a seat_total, flips are constrained by its
+    SeatObjective (see seat_objective). If it has targeted, swap or chain
+    (fractions between 0 and 1), those fractions of flips use those
+    proposals, and the rest uniform ones. If it has crossovers, each
+    generation also has that many crossover children. If it has polish =
+    True, the best states are polished, and if it has prefilter = True,
+    flips which would disconnect a CON are left out of the pool. If it has
+    prune = True, states which cannot survive are not scored in full.
+    '''
+    static = preloaded['static']
+    objective = seat_objective(config, static)
+    proposals = None
+    weights = {k: config[k] for k in ('targeted', 'swap', 'chain')
+               if config.get(k)}
+    if weights:
+        weights['uniform'] = max(1 - sum(weights.values()), 0)
+        nr = 29800 if objective is None else objective.national_ratio
+        proposals = ProposalMix(weights, nr, reward_params)
+    crossover = None
+    if config.get('crossovers'):
+        crossover = Crossover(config['crossovers'])
+    states, rewards = evolve_states(static, initial_state(static),
+                                    config['flips'], config['kids'],
+                                    config['keep'], callback, reward_params,
+                                    rng=config.get('seed'),
+                                    objective=objective, proposals=proposals,
+                                    crossover=crossover,
+                                    articulation=ArticulationFilter()
+                                    if config.get('prefilter') else None,
+                                    pruning=Pruning()
+                                    if config.get('prune') else None)
+    if config.get('polish'):
+        states, rewards = polish_states(static, states, reward_params,
+                                        objective)
+    return states, rewards
+
+engines = {
+    'reference': run_reference,
+    'array': run_array,
+    }
+
+polishers = {
+    'reference': polish_reference,
+    'array': polish_array,
+    }
+
+#%% Evaluation Counter
+
+class EvaluationCounter:
+    '''
+    Callback for evolve() which remembers the latest generation summary,
+    so that the number of reward evaluations is known at the end.
+    '''
+    def __init__(self):
+        self.summary = {}
+
+    def __call__(self, summary, survivors):
+        self.summary = summary
+
+#%% Run Configuration
+
+def run_configuration(config, engine='reference', finish=None, output=None,
+                      run=0):
+    '''
+    Runs one configuration on the preloaded dataset.
+    If finish is given, then finish(best_state, config, preloaded) is
+    called with the best state found (e.g. to save outputs), as a dataframe
+    (reference engine) or an EngineState (array engine).
+    If output is given, the survivors of every generation are written to the
+    Parquet dataset in that directory as run <run> (see run_output.py).
+    Returns a dictionary of the configuration, best reward, runtime and
+    number of reward evaluations (and the expected number of wasted
+    evaluations avoided, as expected_avoided, with prefilter, the number of
+    children pruned, with prune, and the acceptance rate of each proposal,
+    as acceptance_<proposal>, with targeted, swap or chain).
+    '''
+    if config.get('seed') is not None:
+        random.seed(config['seed'])
+        np.random.seed(config['seed'])
+    reward_params = {k: config[k] for k in reward_keys if k in config}
+    # The array engine scores SERs with the national ratio of its seat
+    # objective (the reference engine has none), and so must the RunWriter
+    if engine == 'array':
+        objective = seat_objective(config, preloaded['static'])
+        if objective is not None:
+            reward_params.setdefault('nr', objective.national_ratio)
+    counter = EvaluationCounter()
+    callback = counter
+    if output is not None:
+        from run_output import RunWriter # Needs pyarrow
+        # Both engines are recorded against the CONs of the original dataset
+        if 'static' not in preloaded:
+            preloaded['static'] = build_static_data(preloaded['d'])
+        callback = combine(counter, RunWriter(output, preloaded['static'],
+                                              run, reward_params))
+
+    start = time.perf_counter()
+    states, rewards = engines[engine](config, reward_params, callback)
+    runtime = time.perf_counter() - start
+
+    if finish is not None:
+        finish(states[0], config, preloaded)
+
+    result = {
+        **config,
+        'run': run,
+        'reward': rewards[0],
+        'runtime': runtime,
+        'evaluations': counter.summary.get('evaluations'),
+        }
+    for key in ('expected_avoided', 'pruned'):
+        if key in counter.summary:
+            result[key] = counter.summary[key]
+    for name, rate in counter.summary.get('acceptance', {}).items():
+        result[f'acceptance_{name}'] = rate
+    return result
+
+#%% Run Sweep
+
+def run_sweep(data, configurations, engine='reference', workers=1,
+              finish=None, output=None):
+    '''
+    Runs each configuration on a dataset which is loaded only once.
+    data is a dictionary which must contain the prepared dataframe 'd'
+    (or, for the array engine, its StaticData 'static'), and may contain
+    anything else needed by finish (e.g. 'd0').
+    If data has 'd0' (the whole dataset, before any rows were removed),
+    its population is the national population used to derive the national
+    ratio for a seat_total.
+    Configurations are scheduled across <workers> processes. With the array
+    engine, workers attach to the static arrays in shared memory, and the
+    dataframes are only passed to workers if finish needs them.
+    If output is given, every generation of every configuration is written
+    to the Parquet dataset in that directory, with the configurations
+    numbered as runs in order.
+    Returns a dataframe with one row per configuration.
+    '''
+    data = dict(data)
+    if engine == 'array' and 'static' not in data:
+        data['static'] = build_static_data(data['d'])
+    if 'd0' in data:
+        data.setdefault('national_population', data['d0']['POPULATION'].sum())
+
+    if workers > 1 and len(configurations) > 1:
+        worker_data = dict(data)
+        blocks = []
+        if engine == 'array':
+            handle, blocks = share_static_data(worker_data.pop('static'))
+            worker_data['static_handle'] = handle
+            if finish is None:
+                worker_data.pop('d', None)
+                worker_data.pop('d0', None)
+        # Fork (where available) shares the preloaded data with workers
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in methods else None)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=init_worker,
+                                     initargs=(worker_data,)) as pool:
+                futures = [pool.submit(run_configuration, config, engine,
+                                       finish, output, run)
+                           for run, config in enumerate(configurations)]
+                results = [future.result() for future in futures]
+        finally:
+            release_static_data(blocks)
+    else:
+        init_worker(data)
+        results = [run_configuration(config, engine, finish, output, run)
+                   for run, config in enumerate(configurations)]
+    return pd.DataFrame(results)
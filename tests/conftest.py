@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              TEST FIXTURES
+# =============================================================================
+# Tests run on the datasets bundled in ./data: the Dublin EDs (a regional
+# dataset, whose neighbours outside Dublin are cut out of the adjacency) and
+# the island EDs.
+
+#%% Imports
+
+import os
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from datasets import Dataset
+
+#%% Paths
+
+dublin_path = os.path.join(root, 'data', 'DublinElectoralDivisions.feather')
+islands_path = os.path.join(root, 'data', 'IslandElectoralDivisions.feather')
+
+#%% Fixtures
+
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    # Layers such as the islands are read from paths relative to the root
+    monkeypatch.chdir(root)
+
+@pytest.fixture(scope='session')
+def dublin():
+    '''
+    The Dublin EDs, loaded as a Dataset. Tests must not modify it in place.
+    '''
+    return Dataset(dublin_path).load()
+
+@pytest.fixture(scope='session')
+def dublin_islands(tmp_path_factory):
+    '''
+    The Dublin EDs and the island EDs in one Dataset, with the islands
+    excluded.
+    '''
+    import geopandas as gpd
+    import pandas as pd
+    path = tmp_path_factory.mktemp('data') / 'DublinAndIslands.feather'
+    parts = [gpd.read_feather(p) for p in (dublin_path, islands_path)]
+    gpd.GeoDataFrame(pd.concat(parts, ignore_index=True)).to_feather(path)
+    return Dataset(str(path), excluded=islands_path).load()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                               BENCHMARK TESTS
+# =============================================================================
+
+#%% Imports
+
+import pandas as pd
+
+from benchmark import summarise_benchmark
+
+#%% Summarise Benchmark
+
+def curve(label, seed, rewards):
+    return pd.DataFrame({'label': label, 'seed': seed,
+                         'time': range(1, len(rewards) + 1),
+                         'reward': rewards, 'best_max_vna': 0.1,
+                         'max_vna': 0.1, 'breaches': 0, 'evaluations': 10})
+
+def test_default_reward_target():
+    # The default target used to be the lowest final reward, which every
+    # run reaches
+    curves = pd.concat([curve('fast', 0, [1, 3, 4]),
+                        curve('fast', 1, [1, 2, 6]),
+                        curve('fast', 2, [2, 5, 8]),
+                        curve('slow', 0, [1, 2, 3]),
+                        curve('slow', 1, [1, 1, 2])])
+    summary = summarise_benchmark(curves).set_index('label')
+    # Median final reward of 'fast', the best label
+    assert 'time_to_reward_6' in summary
+    assert summary.at['fast', 'reached_reward'] == 2/3
+    assert summary.at['fast', 'time_to_reward_6'] == 3
+    assert summary.at['slow', 'reached_reward'] == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              CONTIGUITY TESTS
+# =============================================================================
+# f_contiguity used to check the CONs of EDs with CHANGE==1 and the NB_CONS
+# of every ED with CHANGE>0; it now checks the CONs of every ED with CHANGE>0
+# and the CONs of their neighbouring EDs. These tests check that it scores
+# states the same as the old version did.
+
+#%% Imports
+
+import random
+import numpy as np
+import pytest
+
+from evolutionary_algorithm import flip
+from reward_function import f_contiguity
+
+#%% Old Contiguity
+
+def old_contiguity(df):
+    '''
+    f_contiguity as it was before the connectivity index, reading NB_CONS
+    with np.atleast_1d so that it can score cells of one CON.
+    '''
+    nx = pytest.importorskip('networkx')
+    changed_cons = list(np.unique(df[df['CHANGE']==1]['CON']))
+    for i in list(df[df['CHANGE']>0].index):
+        for nc in np.atleast_1d(df.loc[i, 'NB_CONS']):
+            if nc not in changed_cons:
+                changed_cons.append(nc)
+    for c in changed_cons:
+        d = df[df['CON']==c]
+        ed_ids = list(d['ED_ID'])
+        nbh_list = list([list(nbh) for nbh in d['NEIGHBOURS']])
+        nbhs_in_c = [[n for n in nbh_sublist if n in ed_ids]
+                for nbh_sublist in nbh_list]
+        if [] in nbhs_in_c:
+            return 0
+        nbh_dict = {ed_id: nbh for ed_id, nbh in
+                    zip(list(d['ED_ID']), nbhs_in_c)}
+        g = nx.Graph(nbh_dict)
+        if not nx.is_connected(g):
+            return 0
+    return 1
+
+#%% Flip Sequences
+
+@pytest.mark.parametrize('seed', range(3))
+def test_contiguity_matches_old_version(dublin, seed):
+    # Unfiltered flips, so that some states are discontiguous
+    random.seed(seed)
+    df = dublin
+    scores = []
+    for _ in range(30):
+        df = flip(df)
+        scores.append(f_contiguity(df))
+        assert scores[-1] == old_contiguity(df)
+    assert 1 in scores and 0 in scores
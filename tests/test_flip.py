@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 FLIP TESTS
+# =============================================================================
+
+#%% Imports
+
+import random
+import numpy as np
+
+from evolutionary_algorithm import flip, evolve, cell
+from static_data import build_static_data
+from engine import neighbour_cons
+
+#%% One-Element Cells
+
+def test_flip_reads_one_element_cells(dublin):
+    # Cells set to an array of one CON hold a 0-d array, which flip used to
+    # fail on with 'len() of unsized object'
+    rows = [i for i in dublin.index
+            if np.ndim(dublin.at[i,'NB_CONS']) == 0
+            and dublin.at[i,'BOUNDARY'] != 0]
+    assert rows
+    for i in rows[:5]:
+        df = flip(dublin, i=i)
+        assert df.at[i,'CON'] == str(dublin.at[i,'NB_CONS'])
+
+def test_evolve_runs_on_dublin(dublin):
+    random.seed(0)
+    states, rewards = evolve(dublin, flips=3, kids=4, keep=2)
+    assert len(states) == 2
+    assert rewards[0] >= rewards[1] > 0
+
+#%% Neighbouring CONs
+
+def test_flip_updates_neighbouring_cons(dublin):
+    # flip used to leave the old CON out of the NB_CONS of the flipped ED,
+    # and add the new CON to the NB_CONS of neighbours already in it
+    static = build_static_data(dublin)
+    row = {e: k for k, e in enumerate(dublin['ED_ID'])}
+    for i in dublin.index[dublin['BOUNDARY'] != 0][:10]:
+        old_con = dublin.at[i,'CON']
+        new_con = cell(dublin, i, 'NB_CONS')[0]
+        df = flip(dublin, i=i, new_con=new_con)
+        neighbours = [row[e] for e in cell(df, i, 'NEIGHBOURS')]
+        for y in neighbours:
+            assert df.at[y,'CON'] not in cell(df, y, 'NB_CONS')
+        if any(df.at[y,'CON'] == old_con for y in neighbours):
+            assert old_con in cell(df, i, 'NB_CONS')
+        # Every ED agrees with the CONs recomputed from the adjacency
+        names = np.array(static.con_names)
+        con = static.con_codes(df['CON'].to_numpy())
+        for c, ref in zip(neighbour_cons(static, con), df['NB_CONS']):
+            assert set(names[c]) == {str(x).upper()
+                                     for x in np.atleast_1d(ref)}
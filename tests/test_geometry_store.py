@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                            GEOMETRY STORE TESTS
+# =============================================================================
+
+#%% Imports
+
+import numpy as np
+
+from geometry_store import build_geometry_store
+
+#%% Region Bounds
+
+def test_region_bounds(dublin, tmp_path):
+    store = build_geometry_store(dublin, str(tmp_path))
+    assert np.allclose(store.region_bounds('COUNTY', 'DUBLIN'),
+                       dublin.total_bounds)
+    # An empty selection used to raise on the min of an empty array
+    assert store.region_bounds('COUNTY', 'KERRY') is None
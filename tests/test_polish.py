@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                POLISH TESTS
+# =============================================================================
+
+#%% Imports
+
+import numpy as np
+
+from static_data import build_static_data
+from engine import evolve_states, initial_state, state_reward
+from polish import polish_state
+from what_if import MoveQuery
+
+#%% Local Optimum
+
+def test_polished_state_is_local_optimum(dublin):
+    static = build_static_data(dublin)
+    states, _ = evolve_states(static, initial_state(static), flips=3,
+                              kids=5, keep=2, rng=0)
+    polished, moves = polish_state(static, states[0])
+    assert moves > 0
+    assert state_reward(static, polished) > state_reward(static, states[0])
+    # No contiguous single move improves the polished state
+    query = MoveQuery(static, polished)
+    eds, cons = query.candidates((static.population > 0) & static.movable)
+    answer = query.score(eds, cons)
+    assert not (answer['contiguous'] & (answer['delta'] > 1e-12)).any()
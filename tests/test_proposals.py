@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                               PROPOSAL TESTS
+# =============================================================================
+
+#%% Imports
+
+import numpy as np
+import pytest
+
+from static_data import build_static_data
+from engine import initial_state, flippable
+from proposals import swap_moves, chain_moves
+
+#%% Compound Moves
+
+@pytest.mark.parametrize('proposal', [swap_moves, chain_moves])
+def test_partners_are_movable(dublin, proposal):
+    # Partners used to be any ED with people, including fixed ones
+    static = build_static_data(dublin)
+    static.movable = static.movable.copy()
+    static.movable[::2] = False
+    state = initial_state(static)
+    eligible = flippable(static, state)
+    rng = np.random.default_rng(0)
+    moves = [proposal(static, state, rng, eligible, {}) for _ in range(50)]
+    partners = [m[1][0] for m in moves if m is not None]
+    assert partners
+    assert static.movable[partners].all()
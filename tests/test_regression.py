@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              REGRESSION TESTS
+# =============================================================================
+# The fast paths against the reference code on seeded random flip sequences
+# (see regression_check.py), on the bundled datasets.
+
+#%% Imports
+
+import pytest
+
+from static_data import build_static_data
+from materialise import Materialiser
+from regression_check import run_sequence, compare_states
+from engine import state_from_frame
+from connectivity import ConnectivityIndex
+
+#%% Helpers
+
+def check_sequences(df, seeds, length, reward_params=None):
+    static = build_static_data(df)
+    materialiser = Materialiser(df, static)
+    for seed in seeds:
+        failure = run_sequence(df, static, materialiser, length, seed,
+                               reward_params)
+        assert failure is None, failure
+
+#%% Tests
+
+def test_initial_states_agree(dublin, dublin_islands):
+    for df in (dublin, dublin_islands):
+        static = build_static_data(df)
+        state = state_from_frame(static, df)
+        state.index = ConnectivityIndex(static, state.con)
+        problems = compare_states(static, df, state, {},
+                                  Materialiser(df, static))
+        assert problems == []
+
+@pytest.mark.parametrize('seed', range(3))
+def test_dublin_sequences(dublin, seed):
+    check_sequences(dublin, [seed], length=10)
+
+@pytest.mark.parametrize('seed', range(2))
+def test_excluded_islands_sequences(dublin_islands, seed):
+    check_sequences(dublin_islands, [seed], length=10)
+
+def test_reward_weights(dublin):
+    check_sequences(dublin, [10], length=8,
+                    reward_params={'a_ser': 5, 'a_cont': 1e-2, 'nr': 25000})
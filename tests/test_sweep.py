@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                                 SWEEP TESTS
+# =============================================================================
+
+#%% Imports
+
+import numpy as np
+import pytest
+
+import sweep
+from static_data import build_static_data
+from run_output import read_run_output
+
+#%% Run Output
+
+@pytest.fixture
+def preloaded(dublin):
+    sweep.init_worker({'d': dublin, 'static': build_static_data(dublin),
+                       'national_population': 4.2e6})
+    yield sweep.preloaded
+    sweep.preloaded.clear()
+
+def test_run_output_uses_seat_objective_ratio(preloaded, tmp_path):
+    # The RunWriter used to score SERs with the default national ratio
+    # rather than the one the engine derived from seat_total
+    pytest.importorskip('pyarrow')
+    config = {'flips': 2, 'kids': 4, 'keep': 2, 'seed': 0,
+              'seat_total': 160, 'total_bounds': False}
+    sweep.run_configuration(config, engine='array', output=str(tmp_path))
+    table = read_run_output(str(tmp_path)).to_pandas()
+    terms = table[['ser_term', 'cb_term', 'cont_term']].sum(axis=1)
+    assert np.allclose(table['reward'], terms)
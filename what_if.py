@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+#                              WHAT-IF QUERIES
+# =============================================================================
+# Answers "what happens if ED X moves to CON Y?" from the population of each
+# CON and the articulation points of each CON (kept in a ConnectivityIndex,
+# refreshed only for CONs which have changed), without copying the dataframe
+# or recomputing ser_global/vna_global. Thousands of moves can be asked about
+# in one vectorised call, and every legal flip of a state can be listed with
+# its change in each term of the reward.
+
+#%% Imports
+
+import numpy as np
+import pandas as pd
+
+from reward_function import f_exp
+from engine import initial_state, state_from_frame, move, flippable, \
+    reward_totals, ser_terms
+from connectivity import ConnectivityIndex
+from static_data import build_static_data
+
+#%% Move Query
+
+class MoveQuery:
+    '''
+    Hypothetical single-ED moves from one state (by default the baseline
+    state of static).
+    seats may give the current seats of each CON (as with
+    use_current_seats=True in vna); otherwise VNA is measured against the
+    nearest integer SER, as in vna.
+    '''
+    def __init__(self, static, state=None, national_ratio=29800, seats=None):
+        self.static = static
+        self.state = initial_state(static) if state is None else state.copy()
+        self.national_ratio = national_ratio
+        self.seats = None if seats is None else np.asarray(seats)
+        self.rows = {ed: k for k, ed in enumerate(static.ed_id)}
+        self.con_lookup = {c: k for k, c in enumerate(static.con_names)}
+        if self.state.index is None:
+            self.state.index = ConnectivityIndex(static, self.state.con)
+        self.index = self.state.index
+        self.refresh()
+
+    @classmethod
+    def from_frame(cls, df, national_ratio=29800, use_current_seats=False):
+        '''
+        Builds a MoveQuery for the state of a dataframe of EDs.
+        '''
+        static = build_static_data(df)
+        seats = None
+        if use_current_seats:
+            seats = np.zeros(static.n_cons)
+            con_seats = df.groupby(df['CON'].str.upper())['SEATS'].first()
+            for c, n in con_seats.items():
+                seats[static.con_names.index(c)] = n
+        return cls(static, state_from_frame(static, df), national_ratio,
+                   seats)
+
+    def refresh(self):
+        '''
+        Recomputes the (ED, neighbouring CON) pairs of the current state.
+        '''
+        static, con = self.static, self.state.con
+        # Keys ED*n_cons + CON of each ED and the CONs it borders
+        other = con[static.indices]
+        differs = other != con[static.edge_src]
+        self.borders = np.unique(
+            static.edge_src[differs].astype(np.int64)*static.n_cons
+            + other[differs])
+
+    def codes(self, ed_ids, cons):
+        '''
+        Converts ED_IDs and CON names to row indices and CON codes.
+        '''
+        eds = np.array([self.rows[e] for e in np.atleast_1d(ed_ids)])
+        cons = np.array([self.con_lookup[c.upper()]
+                         for c in np.atleast_1d(cons)])
+        return eds, cons
+
+    def query(self, eds, cons, nr=None):
+        '''
+        Takes arrays of ED row indices and new CON codes, and returns a
+        dictionary of arrays with one entry per move:
+            old_con, new_con       CON codes before and after
+            old_ser, new_ser       SER of the old and new CON after the move
+            old_vna, new_vna       VNA of the old and new CON after the move
+            breach                 True if the ED leaves the home counties of
+                                   its new CON
+            borders                True if the ED borders its new CON
+            contiguous             True if both CONs are contiguous after
+                                   the move
+        The national ratio of the query is used unless nr is given.
+        '''
+        static, state = self.static, self.state
+        eds = np.asarray(eds, dtype=np.int64)
+        new = np.asarray(cons, dtype=np.int64)
+        old = state.con[eds].astype(np.int64)
+        pop = static.population[eds]
+        if nr is None:
+            nr = self.national_ratio
+
+        old_ser = (state.con_pop[old] - pop)/nr
+        new_ser = (state.con_pop[new] + pop)/nr
+        if self.seats is None:
+            old_seats, new_seats = np.round(old_ser), np.round(new_ser)
+        else:
+            old_seats, new_seats = self.seats[old], self.seats[new]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            old_vna = (old_ser - old_seats)/old_seats
+            new_vna = (new_ser - new_seats)/new_seats
+
+        borders = np.isin(eds*static.n_cons + new, self.borders)
+        # The old CON stays in one piece unless the ED holds it together, or
+        # leaves a single ED behind (which counts as discontiguous)
+        index = self.index
+        cut = index.articulation()
+        con_ok = index.contiguous_cons()
+        remaining = index.size[old] - 1
+        old_ok = con_ok[old] & ~cut[eds] & (remaining != 1)
+        contiguous = old_ok & con_ok[new] & borders
+
+        return {
+            'old_con': old,
+            'new_con': new,
+            'old_ser': old_ser,
+            'new_ser': new_ser,
+            'old_vna': old_vna,
+            'new_vna': new_vna,
+            'breach': ~static.home[new, static.county[eds]],
+            'borders': borders,
+            'contiguous': contiguous,
+            }
+
+    def ask(self, ed_id, con):
+        '''
+        Answers a single move of ED ed_id to the CON named con, returning a
+        dictionary as query, with CON names and plain values.
+        '''
+        eds, cons = self.codes(ed_id, con)
+        answer = {k: v[0].item() for k, v in self.query(eds, cons).items()}
+        answer['old_con'] = self.static.con_names[answer['old_con']]
+        answer['new_con'] = self.static.con_names[answer['new_con']]
+        return answer
+
+    def candidates(self, eligible=None):
+        '''
+        Returns arrays of ED row indices and CON codes for every move of an
+        eligible ED (by default, those which flip may choose) to a CON it
+        borders.
+        '''
+        if eligible is None:
+            eligible = flippable(self.static, self.state)
+        eds = self.borders // self.static.n_cons
+        cons = self.borders % self.static.n_cons
+        keep = eligible[eds]
+        return eds[keep], cons[keep]
+
+    def score(self, eds, cons, a_ser=3, a_cb=1e-10, b_cb=1e-4, a_cont=1e-3,
+              b_cont=0.01, nr=None):
+        '''
+        Returns query(eds, cons) with the change in each term of the reward
+        added (d_ser, d_cb and d_cont, and their sum delta), for reward
+        parameters as in reward. delta ignores contiguity, which is given
+        separately.
+        '''
+        if nr is None:
+            nr = self.national_ratio
+        answer = self.query(eds, cons, nr)
+        static, state = self.static, self.state
+        eds = np.asarray(eds, dtype=np.int64)
+        old, new = answer['old_con'], answer['new_con']
+        pop = static.population[eds]
+
+        # SER term of the two CONs involved (a CON left empty drops out)
+        before = ser_terms(state.con_pop[old]/nr) + \
+            ser_terms(state.con_pop[new]/nr)
+        after = np.where(self.index.size[old] > 1,
+                         ser_terms(answer['old_ser']), 0) \
+            + ser_terms(answer['new_ser'])
+        answer['d_ser'] = a_ser*(after - before)
+
+        # County boundary and continuity terms, from their totals
+        n_cb, p_cb, n_cont, p_cont = reward_totals(static, state)
+        county = static.county[eds]
+        d_breach = answer['breach'].astype(int) - \
+            (~static.home[old, county]).astype(int)
+        d_changed = (new != static.con0[eds]).astype(int) - \
+            (old != static.con0[eds]).astype(int)
+        answer['d_cb'] = f_exp(p_cb + d_breach*pop, n_cb + d_breach,
+                               a_cb, b_cb) - f_exp(p_cb, n_cb, a_cb, b_cb)
+        answer['d_cont'] = f_exp(p_cont + d_changed*pop, n_cont + d_changed,
+                                 a_cont, b_cont) - \
+            f_exp(p_cont, n_cont, a_cont, b_cont)
+        answer['delta'] = answer['d_ser'] + answer['d_cb'] + answer['d_cont']
+        return answer
+
+    def apply(self, ed, con, objective=None):
+        '''
+        Moves ED row ed to CON code con (with objective.apply, if a
+        SeatObjective is given), so that later queries start from the new
+        state.
+        '''
+        # move keeps the ConnectivityIndex of the state up to date
+        if objective is None:
+            move(self.static, self.state, ed, con)
+        else:
+            objective.apply(self.static, self.state, ed, con)
+        self.refresh()
+
+#%% Enumerate Moves
+
+def enumerate_moves(static, state, eligible=None, reward_params=None,
+                    query=None):
+    '''
+    Returns a dataframe of every legal single flip of state (by default, of
+    every ED flip may choose, to every CON it borders), with columns:
+        ED, ED_ID, FROM, TO, FROM_CON, TO_CON     the ED (row and ED_ID)
+                                                  and its old and new CON
+                                                  (code and name)
+        D_SER, D_CB, D_CONT, DELTA                change in each term of
+                                                  the reward, and in total
+        CONTIGUOUS                                True if both CONs stay
+                                                  contiguous
+    sorted by DELTA, best first. reward_params are as for reward.
+    A MoveQuery of state may be passed in to avoid rebuilding it.
+    '''
+    if query is None:
+        query = MoveQuery(static, state,
+                          (reward_params or {}).get('nr', 29800))
+    eds, cons = query.candidates(eligible)
+    answer = query.score(eds, cons, **(reward_params or {}))
+    names = np.array(static.con_names)
+    moves = pd.DataFrame({
+        'ED': eds,
+        'ED_ID': static.ed_id[eds],
+        'FROM': answer['old_con'],
+        'TO': answer['new_con'],
+        'FROM_CON': names[answer['old_con']],
+        'TO_CON': names[answer['new_con']],
+        'D_SER': answer['d_ser'],
+        'D_CB': answer['d_cb'],
+        'D_CONT': answer['d_cont'],
+        'DELTA': answer['delta'],
+        'CONTIGUOUS': answer['contiguous'],
+        })
+    return moves.sort_values('DELTA', ascending=False, ignore_index=True)